@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Read throughput of the storage layouts (--layout) of the visibility columns.
+Creates an MS per layout with the native backend, fills its DATA column and
+times reading it in the two common access patterns:
+
+    rows:     all channels of chunks of integrations (e.g. calibration solvers)
+    channels: all rows of subbands of channels (e.g. imaging per subband)
+
+    python benchmarks/layout.py [--tel meerkat] [--nchan 1024] [--synthesis 0.1] [--drop-caches]
+
+Unless --drop-caches is given (which needs root), the MS is likely to be
+read from the page cache, which understates the difference between layouts.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+LAYOUTS = ["row", "channel", "balanced"]
+
+
+def drop_caches():
+    subprocess.run(["sync"])
+    with open("/proc/sys/vm/drop_caches", "w") as stdw:
+        stdw.write("3\n")
+
+
+def fill(tb, msname, rows_per_chunk):
+    """Write (non-zero) visibilities to the DATA column"""
+    tb.open(msname, nomodify=False)
+    nrows = tb.nrows()
+    shape = tb.getcell("DATA", 0).shape
+    for row in range(0, nrows, rows_per_chunk):
+        nrow = min(rows_per_chunk, nrows - row)
+        tb.putcol("DATA", np.ones(shape + (nrow,), dtype=np.complex64), startrow=row, nrow=nrow)
+    tb.close()
+    return nrows, shape
+
+
+def read_rows(tb, msname, rows_per_chunk):
+    tb.open(msname)
+    nbytes = 0
+    for row in range(0, tb.nrows(), rows_per_chunk):
+        nbytes += tb.getcol("DATA", startrow=row, nrow=rows_per_chunk).nbytes
+    tb.close()
+    return nbytes
+
+
+def read_channels(tb, msname, subband):
+    tb.open(msname)
+    ncorr, nchan = tb.getcell("DATA", 0).shape
+    nbytes = 0
+    for chan in range(0, nchan, subband):
+        last = min(chan + subband, nchan) - 1
+        nbytes += tb.getcolslice("DATA", [0, chan], [ncorr - 1, last], [1, 1]).nbytes
+    tb.close()
+    return nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tel", default="meerkat", help="Telescope")
+    parser.add_argument("--nchan", type=int, default=1024, help="Number of channels")
+    parser.add_argument("--synthesis", type=float, default=0.1, help="Synthesis time (hours)")
+    parser.add_argument("--dtime", type=int, default=8, help="Integration time (s)")
+    parser.add_argument("--integrations", type=int, default=10, help="Integrations per row chunk")
+    parser.add_argument("--subband", type=int, default=64, help="Channels per subband")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS), help="Comma separated layouts")
+    parser.add_argument("--dir", default=None, help="Directory for the MSs (default: a temporary directory)")
+    parser.add_argument("--drop-caches", action="store_true", help="Drop the page cache before each read")
+    args = parser.parse_args()
+
+    from simms import core
+    from simms.casasm import tb
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="simms-layout-")
+    results = []
+    try:
+        for layout in args.layouts.split(","):
+            msname = os.path.join(workdir, "%s.MS" % layout)
+            options = core.resolve_config(dict(tel=args.tel))
+            core.create_empty_ms(
+                msname=msname,
+                synthesis=args.synthesis,
+                dtime=args.dtime,
+                freq0="1GHz",
+                dfreq="100kHz",
+                nchan=args.nchan,
+                backend="native",
+                layout=layout,
+                auto_corr=False,
+                cache=False,
+                nolog=True,
+                **options,
+            )
+            tb.open(msname)
+            nbl = len(set(zip(tb.getcol("ANTENNA1"), tb.getcol("ANTENNA2"))))
+            tb.close()
+            rows_per_chunk = nbl * args.integrations
+            fill(tb, msname, rows_per_chunk)
+
+            timings = []
+            for read, arg in [(read_rows, rows_per_chunk), (read_channels, args.subband)]:
+                if args.drop_caches:
+                    drop_caches()
+                t0 = time.perf_counter()
+                nbytes = read(tb, msname, arg)
+                timings.append(nbytes / (time.perf_counter() - t0) / 1024**2)
+            results.append((layout, timings))
+            shutil.rmtree(msname)
+    finally:
+        if not args.dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print("{:<10} {:>12} {:>14}".format("layout", "rows (MB/s)", "channels (MB/s)"))
+    for layout, (rows, channels) in results:
+        print("{:<10} {:>12.1f} {:>14.1f}".format(layout, rows, channels))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Start-up time of the simms command line interface. Runs `simms --help`
+(and friends) in fresh interpreters and reports the best and median wall
+time of each, failing if the best `--help` time exceeds --max-ms.
+
+    python benchmarks/startup.py [-n 10] [--max-ms 200]
+
+The entry point is run with the current interpreter, so wrapper scripts
+(e.g. pyenv shims) are not part of the measurement.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINT = "import sys; from simms.core import main; sys.exit(main())"
+
+COMMANDS = {
+    "--help": ["--help"],
+    "--version": ["--version"],
+    "argument error": ["--no-such-option"],
+}
+
+
+def time_command(cmd, repeat):
+    """Wall times (s) of running cmd repeat times"""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, capture_output=True)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=10, help="Runs per command")
+    parser.add_argument("--max-ms", type=float, default=200, help="Budget for `simms --help` (ms)")
+    args = parser.parse_args()
+
+    # a bare interpreter, for reference
+    results = {"python -c pass": time_command([sys.executable, "-c", "pass"], args.repeat)}
+    for name, cmd in COMMANDS.items():
+        results[name] = time_command([sys.executable, "-c", ENTRY_POINT] + cmd, args.repeat)
+
+    print("{:<16} {:>10} {:>10}".format("command", "best (ms)", "median (ms)"))
+    for name, times in results.items():
+        print("{:<16} {:>10.1f} {:>10.1f}".format(name, min(times) * 1e3, statistics.median(times) * 1e3))
+
+    best = min(results["--help"]) * 1e3
+    if best > args.max_ms:
+        print("FAIL: simms --help took %.1f ms (budget %.1f ms)" % (best, args.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
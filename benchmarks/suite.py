@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of creating MSs of the telescopes bundled with simms over a grid
+of synthesis times, integration times, channels and bands. Each case runs in
+a fresh interpreter and records its wall time, peak RSS, rows per second and
+bytes on disk. A run (all its cases) is appended to a JSON history file, and
+compared with a baseline (the last run of another history file), failing if
+any case is slower or uses more memory than the baseline by over --tolerance.
+
+    python benchmarks/suite.py [--telescopes kat-7,meerkat] [--synthesis 0.25,1] [--dtime 8,60]
+        [--nchan 16] [--nband 1] [--backend native] [--history simms-benchmarks.json]
+        [--baseline baseline.json] [--tolerance 0.2]
+
+To keep a baseline, copy a history file (e.g. of the main branch).
+"""
+import argparse
+import datetime
+import importlib.metadata
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+TELESCOPES = [
+    "kat-7",
+    "meerkat",
+    "wsrt",
+    "vla-a",
+    "vla-b",
+    "vla-c",
+    "vla-d",
+    "ska1mid197",
+    "ska1mid254",
+    "lofar_nl",
+]
+
+GRID = ["tel", "synthesis", "dtime", "nchan", "nbands"]
+
+# What a case measures, and whether more of it is worse
+METRICS = {"seconds": True, "peak_rss": True, "rows_per_s": False, "bytes": True}
+
+CASE = """
+import json, sys, time
+from simms import core, memory
+case = json.loads(sys.argv[1])
+t0 = time.perf_counter()
+msname = core.create_empty_ms(
+    **core.resolve_config(dict(case, freq0="1GHz", dfreq="1MHz", auto_corr=False, cache=False, nolog=True))
+)
+seconds = time.perf_counter() - t0
+from simms.casasm import tb
+tb.open(msname)
+rows = tb.nrows()
+tb.close()
+print("SIMMS-BENCHMARK " + json.dumps(dict(msname=msname, seconds=seconds, rows=rows, peak_rss=memory.run_peak_rss())))
+"""
+
+
+def disk_usage(path):
+    """Bytes on disk (not the apparent size) of a file or directory"""
+    nbytes = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            nbytes += os.lstat(os.path.join(root, name)).st_blocks * 512
+    return nbytes
+
+
+def run_case(case, workdir):
+    """Create the MS of a case (a dict of create_empty_ms arguments) in a
+    fresh interpreter. Returns the case with what was measured"""
+    case = dict(case, msname=os.path.join(workdir, "bench.MS"))
+    proc = subprocess.run([sys.executable, "-c", CASE, json.dumps(case)], capture_output=True, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("SIMMS-BENCHMARK ")]
+    result = dict(case)
+    del result["msname"]
+    if proc.returncode or not lines:
+        result["error"] = (proc.stderr.strip().splitlines() or ["exit code %d" % proc.returncode])[-1]
+        return result
+    measured = json.loads(lines[-1].split(" ", 1)[1])
+    result.update(
+        seconds=measured["seconds"],
+        peak_rss=measured["peak_rss"],
+        rows=measured["rows"],
+        rows_per_s=measured["rows"] / measured["seconds"],
+        bytes=disk_usage(measured["msname"]),
+    )
+    shutil.rmtree(measured["msname"], ignore_errors=True)
+    return result
+
+
+def case_key(case):
+    return tuple(str(case.get(name)) for name in GRID + ["backend"])
+
+
+def git_commit():
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return proc.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as stdr:
+        return json.load(stdr)
+
+
+def compare(cases, baseline, tolerance):
+    """Regressions (descriptions) of cases against the cases of a baseline run"""
+    reference = {case_key(case): case for case in baseline["cases"] if "error" not in case}
+    regressions = []
+    for case in cases:
+        old = reference.get(case_key(case))
+        if old is None or "error" in case:
+            continue
+        for metric, more_is_worse in METRICS.items():
+            ratio = case[metric] / old[metric] if old[metric] else 1
+            if (ratio > 1 + tolerance) if more_is_worse else (ratio < 1 - tolerance):
+                regressions.append(
+                    "{}: {} {:.4g} vs {:.4g} ({:+.0%})".format(
+                        " ".join(case_key(case)), metric, case[metric], old[metric], ratio - 1
+                    )
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--telescopes", default=",".join(TELESCOPES), help="Comma separated telescopes")
+    parser.add_argument("--synthesis", default="0.25", help="Comma separated synthesis times (hours)")
+    parser.add_argument("--dtime", default="60", help="Comma separated integration times (s)")
+    parser.add_argument("--nchan", default="16", help="Comma separated numbers of channels")
+    parser.add_argument("--nband", default="1", help="Comma separated numbers of bands")
+    parser.add_argument("--backend", default="native", choices=["casa", "native"], help="Backend")
+    parser.add_argument("--history", default="simms-benchmarks.json", help="JSON history file the run is added to")
+    parser.add_argument("--baseline", help="History file whose last run is the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fraction a case may be worse by")
+    parser.add_argument("--dir", default=None, help="Directory for the MSs (default: a temporary directory)")
+    args = parser.parse_args()
+
+    # read first, the baseline may be the history itself
+    baseline = load_history(args.baseline) if args.baseline else None
+    if args.baseline and not baseline:
+        parser.error("No runs in the baseline %s" % args.baseline)
+
+    grid = [
+        args.telescopes.split(","),
+        [float(value) for value in args.synthesis.split(",")],
+        [float(value) for value in args.dtime.split(",")],
+        [int(value) for value in args.nchan.split(",")],
+        [int(value) for value in args.nband.split(",")],
+    ]
+    workdir = args.dir or tempfile.mkdtemp(prefix="simms-bench-")
+    cases = []
+    columns = GRID + ["time (s)", "RSS (MB)", "rows/s", "disk (MB)"]
+    print("{:<11} {:>6} {:>6} {:>6} {:>3} {:>9} {:>9} {:>11} {:>10}".format(*columns))
+    try:
+        for values in itertools.product(*grid):
+            case = run_case(dict(zip(GRID, values), backend=args.backend), workdir)
+            cases.append(case)
+            if "error" in case:
+                print("{:<11} {:>6} {:>6} {:>6} {:>3} FAILED: {}".format(*values, case["error"]))
+                continue
+            print(
+                "{:<11} {:>6} {:>6} {:>6} {:>3} {:>9.2f} {:>9.0f} {:>11.0f} {:>10.1f}".format(
+                    *values, case["seconds"], case["peak_rss"], case["rows_per_s"], case["bytes"] / 1024**2
+                )
+            )
+    finally:
+        if not args.dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    history = load_history(args.history)
+    history.append(
+        dict(
+            date=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            version=importlib.metadata.version("simms"),
+            commit=git_commit(),
+            host=platform.node(),
+            python=platform.python_version(),
+            cpus=os.cpu_count(),
+            cases=cases,
+        )
+    )
+    with open(args.history, "w") as stdw:
+        json.dump(history, stdw, indent=2)
+
+    failed = any("error" in case for case in cases)
+    if baseline:
+        regressions = compare(cases, baseline[-1], args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line)
+        if not regressions:
+            print("No regressions against the baseline of %s" % baseline[-1]["date"])
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
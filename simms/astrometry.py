@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Closed-form astrometry needed to lay out an observation without casatools:
+sidereal time, precession-nutation and annual aberration. Times are MJD
+seconds (UTC, as in the MS TIME column), angles are in radians.
+
+The models are the classic IAU 1976/1980 expressions (truncated nutation),
+good to a fraction of an arcsecond over the next few decades, which puts the
+UVW coordinates within ~2e-5 of the baseline length (0.1 m on the longest
+MeerKAT baselines) of what the CASA simulator computes for the same TIME.
+tests/test.py checks this.
+"""
+import numpy as np
+
+ARCSEC = np.pi / 180 / 3600
+MJD_J2000 = 51544.5
+SECONDS_PER_DAY = 86400.0
+# Ratio of sidereal to solar time
+SIDEREAL_RATE = 1.002737909350795
+# Earth's mean orbital speed in units of the speed of light
+_EARTH_SPEED = 29.7859 / 299792.458
+
+
+def _days_since_j2000(time):
+    return np.asarray(time, dtype=float) / SECONDS_PER_DAY - MJD_J2000
+
+
+def rotation(angle, axis):
+    """Frame rotation matrices about axis (0=x, 1=y, 2=z). angle may be an
+    array in which case the result has shape angle.shape + (3,3)"""
+    angle = np.asarray(angle, dtype=float)
+    c, s = np.cos(angle), np.sin(angle)
+    mat = np.zeros(angle.shape + (3, 3))
+    # cyclic, so that every axis rotates the same way
+    i, j = (axis + 1) % 3, (axis + 2) % 3
+    mat[..., axis, axis] = 1
+    mat[..., i, i] = c
+    mat[..., j, j] = c
+    mat[..., i, j] = s
+    mat[..., j, i] = -s
+    return mat
+
+
+def nutation(time):
+    """Nutation in longitude and obliquity, and the mean obliquity of the ecliptic"""
+    d = _days_since_j2000(time)
+    T = d / 36525.0
+    omega = np.deg2rad(125.04452 - 1934.136261 * T)
+    L = np.deg2rad(280.4665 + 36000.7698 * T)
+    Lm = np.deg2rad(218.3165 + 481267.8813 * T)
+
+    dpsi = -17.20 * np.sin(omega) - 1.32 * np.sin(2 * L) - 0.23 * np.sin(2 * Lm) + 0.21 * np.sin(2 * omega)
+    deps = 9.20 * np.cos(omega) + 0.57 * np.cos(2 * L) + 0.10 * np.cos(2 * Lm) - 0.09 * np.cos(2 * omega)
+    eps = 84381.448 - 46.8150 * T - 0.00059 * T**2 + 0.001813 * T**3
+
+    return dpsi * ARCSEC, deps * ARCSEC, eps * ARCSEC
+
+
+def gast(time):
+    """Greenwich apparent sidereal time (radians). UT1 is taken to be UTC"""
+    d = _days_since_j2000(time)
+    T = d / 36525.0
+    gmst = np.deg2rad(280.46061837 + 360.98564736629 * d + 0.000387933 * T**2 - T**3 / 38710000.0)
+    dpsi, _, eps = nutation(time)
+    return np.mod(gmst + dpsi * np.cos(eps), 2 * np.pi)
+
+
+def precession_nutation(time):
+    """Rotation from the J2000 frame to the true equator and equinox of date"""
+    T = _days_since_j2000(time) / 36525.0
+    zeta = (2306.2181 * T + 0.30188 * T**2 + 0.017998 * T**3) * ARCSEC
+    z = (2306.2181 * T + 1.09468 * T**2 + 0.018203 * T**3) * ARCSEC
+    theta = (2004.3109 * T - 0.42665 * T**2 - 0.041833 * T**3) * ARCSEC
+    prec = rotation(-z, 2) @ rotation(theta, 1) @ rotation(-zeta, 2)
+
+    dpsi, deps, eps = nutation(time)
+    nut = rotation(-(eps + deps), 0) @ rotation(-dpsi, 2) @ rotation(eps, 0)
+    return nut @ prec
+
+
+def celestial_to_terrestrial(time, epoch=None):
+    """Rotations (ntime,3,3) from J2000 to ITRF (polar motion is ignored).
+    Precession-nutation is evaluated once, at epoch (default: the mean of time)"""
+    time = np.atleast_1d(time)
+    return rotation(gast(time), 2) @ precession_nutation(np.mean(time) if epoch is None else epoch)
+
+
+def earth_velocity(time):
+    """Velocity of the Earth (J2000 equatorial, units of c) from a circular orbit"""
+    d = _days_since_j2000(time)
+    g = np.deg2rad(357.529 + 0.98560028 * d)
+    lam = np.deg2rad(280.459 + 0.98564736 * d + 1.915 * np.sin(g) + 0.020 * np.sin(2 * g))
+    eps = nutation(time)[2]
+    vel = _EARTH_SPEED * np.array([np.sin(lam), -np.cos(lam), 0 * lam])
+    return rotation(-eps, 0) @ vel
+
+
+def direction_cosines(ra, dec):
+    """Unit vectors (...,3) of directions"""
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    return np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def aberrate(ra, dec, time):
+    """Apply annual aberration (at time) to J2000 directions"""
+    s = direction_cosines(ra, dec)
+    v = earth_velocity(time)
+    s = s + v - (s @ v)[..., np.newaxis] * s
+    s /= np.linalg.norm(s, axis=-1)[..., np.newaxis]
+    return np.arctan2(s[..., 1], s[..., 0]), np.arcsin(s[..., 2])
+
+
+def uvw_frame(ra, dec):
+    """Rows of the returned (...,3,3) matrices are the u, v and w unit vectors
+    for a phase centre at (ra, dec)"""
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    sa, ca, sd, cd = np.sin(ra), np.cos(ra), np.sin(dec), np.cos(dec)
+    return np.stack(
+        [
+            np.stack([-sa, ca, np.zeros_like(ra)], axis=-1),
+            np.stack([-sd * ca, -sd * sa, cd], axis=-1),
+            np.stack([cd * ca, cd * sa, sd], axis=-1),
+        ],
+        axis=-2,
+    )
+
+
+def hour_angle(ra, dec, lon, time):
+    """Hour angle of a J2000 direction at time, as seen from longitude lon"""
+    s = precession_nutation(np.mean(time)) @ direction_cosines(ra, dec)
+    ha = gast(time) + lon - np.arctan2(s[1], s[0])
+    return np.mod(ha + np.pi, 2 * np.pi) - np.pi
+
+
+def transit_time(ra, dec, lon, time):
+    """Time of the transit of a J2000 direction closest to time"""
+    ha = hour_angle(ra, dec, lon, time)
+    return time - ha / (2 * np.pi) * SECONDS_PER_DAY / SIDEREAL_RATE
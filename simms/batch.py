@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Create many MSs (e.g. a parameter sweep) with a pool of long-lived worker
+processes. Each worker keeps its casatools session warm between jobs and a
+failing job does not take the others down.
+
+A batch file is JSON with the same keys as a --json-config file, either as
+a list of jobs
+
+    [{"tel": "meerkat", "synthesis": 1}, {"tel": "kat-7", "dec": "-60d0m0s"}]
+
+or as a grid, where every combination of the values in "grid" is added to
+"base" (and msname may refer to any argument of the job):
+
+    {
+        "base": {"tel": "meerkat", "msname": "sweep_{dec}_{synthesis}h.MS"},
+        "grid": {"dec": ["-30d0m0s", "-60d0m0s"], "synthesis": [1, 4]}
+    }
+
+A grid file may also have a "jobs" list, which is run as well.
+"""
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+
+def load_jobs(path):
+    """The jobs (dicts of create_empty_ms arguments) in a batch file"""
+    with open(path) as stdr:
+        content = json.load(stdr)
+
+    if isinstance(content, list):
+        jobs = content
+    elif isinstance(content, dict):
+        jobs = list(content.get("jobs", []))
+        base = content.get("base", {})
+        grid = content.get("grid", {})
+        if grid:
+            keys = list(grid)
+            for values in itertools.product(*[grid[key] for key in keys]):
+                jobs.append(dict(base, **dict(zip(keys, values))))
+        elif base and not jobs:
+            jobs = [base]
+    else:
+        raise ValueError("A batch file must hold a list of jobs or a grid")
+
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise ValueError("Job %d of %s is not a dict of arguments" % (index, path))
+        if "msname" in job:
+            job["msname"] = job["msname"].format(index=index, **job)
+        else:
+            job["msname"] = "%s_%04d.MS" % (job.get("label") or job.get("tel", "simms"), index)
+    return jobs
+
+
+class _Redirect(object):
+    """Redirect stdout and stderr (including output of the casatools C++
+    libraries) to a file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.saved = [os.dup(1), os.dup(2)]
+        self.log = open(self.path, "a")
+        os.dup2(self.log.fileno(), 1)
+        os.dup2(self.log.fileno(), 2)
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved in zip([1, 2], self.saved):
+            os.dup2(saved, fd)
+            os.close(saved)
+        self.log.close()
+
+
+def run_job(index, job, logdir=None):
+    """Run one job. Returns its status (a dict), it never raises"""
+    from simms import core
+
+    t0 = time.time()
+    result = dict(index=index, msname=job.get("msname"), status="done", seconds=0.0, error=None, pid=os.getpid())
+    log = os.path.join(logdir, "job%04d.log" % index) if logdir else os.devnull
+    try:
+        with _Redirect(log):
+            msname = core.create_empty_ms(**core.resolve_config(job))
+        if msname is None:
+            result.update(status="failed", error="MS failed validation")
+        else:
+            result["msname"] = msname
+    except Exception as exc:
+        result.update(status="failed", error="%s: %s" % (type(exc).__name__, exc))
+        if logdir:
+            with open(log, "a") as stdw:
+                traceback.print_exc(file=stdw)
+    result["seconds"] = time.time() - t0
+    return result
+
+
+def run(jobs, nworkers=1, logdir=None, retries=1):
+    """Run jobs with nworkers worker processes. The output of each job goes to
+    logdir/jobNNNN.log (discarded if no logdir). A worker that dies takes the
+    jobs still in its pool with it: those are run again one at a time, each
+    in a worker of its own, so that only a job that kills its worker is
+    retried (up to retries times) and then failed. Returns the status of
+    each job."""
+    if logdir:
+        os.makedirs(logdir, exist_ok=True)
+
+    results = {}
+    broken = []
+    # spawn (not fork) so that no casatools state is shared with the workers
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(min(nworkers, len(jobs)), mp_context=context) as pool:
+        futures = {pool.submit(run_job, index, job, logdir): index for index, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker died (e.g. a crash in casatools), and with it the pool
+                broken.append(index)
+                continue
+            _print(results[index])
+
+    for index in sorted(broken):
+        attempts = 0
+        while index not in results:
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                try:
+                    results[index] = pool.submit(run_job, index, jobs[index], logdir).result()
+                except concurrent.futures.process.BrokenProcessPool:
+                    attempts += 1
+                    if attempts > retries:
+                        results[index] = dict(
+                            index=index,
+                            msname=jobs[index].get("msname"),
+                            status="failed",
+                            seconds=0.0,
+                            error="worker process died",
+                            pid=None,
+                        )
+        _print(results[index])
+
+    return [results[index] for index in range(len(jobs))]
+
+
+def _print(status):
+    print("[{:>4}] {:<7} {:8.1f}s {}".format(status["index"], status["status"], status["seconds"], status["msname"]))
+
+
+def summary(results):
+    """Summary table of the status and wall time of each job"""
+    lines = ["{:>5} {:<7} {:>10}  {}".format("job", "status", "time (s)", "MS / error")]
+    for result in results:
+        lines.append(
+            "{:>5} {:<7} {:>10.1f}  {}".format(
+                result["index"], result["status"], result["seconds"], result["error"] or result["msname"]
+            )
+        )
+    ndone = sum(result["status"] == "done" for result in results)
+    total = sum(result["seconds"] for result in results)
+    lines.append("{} of {} jobs done, {:.1f}s in total".format(ndone, len(results), total))
+    return "\n".join(lines)
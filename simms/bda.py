@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Baseline-dependent time averaging (BDA). The fringes of a source at a
+distance theta (rad) from the phase centre turn at most
+
+    2 pi omega |B| theta / lambda   rad/s
+
+on a baseline of length |B|, where omega is the rotation rate of the Earth.
+Averaged over a time dt, the amplitude of the source drops by a factor
+sinc(phase / 2), or about phase^2 / 24, where phase is how far the fringe
+turns in dt. So the longest integration of a baseline that keeps this loss
+within a tolerance at the edge of the field (the primary beam) and at the
+highest frequency is
+
+    dt = sqrt(24 tolerance) lambda_min / (2 pi omega |B| theta)
+
+Short baselines can be averaged over many integrations. Each baseline is
+averaged over a power of two (at most MAX_FACTOR) of the integrations of
+--dtime that fit into its dt. Averaging restarts at the start of each scan,
+so the averaging intervals of the baselines nest. The last interval of a
+scan may be shorter. Rows have the TIME (the middle) and INTERVAL/EXPOSURE
+of their averaging interval.
+
+    factor = bda.factors(xyz, dish_diam, ant1, ant2, dtime, freqs, 0.01)
+"""
+import numpy as np
+
+from simms import astrometry
+
+SPEED_OF_LIGHT = 299792458.0
+# Rotation rate of the Earth (rad/s)
+EARTH_RATE = 2 * np.pi * astrometry.SIDEREAL_RATE / astrometry.SECONDS_PER_DAY
+# Largest number of integrations averaged into a row
+MAX_FACTOR = 64
+# Half power width of the primary beam, in units of lambda / dish diameter
+BEAM_WIDTH = 1.02
+
+
+def field_radius(dish_diam, freq_min):
+    """Radius (rad) of the field: half the half power width of the primary
+    beam of a dish at the lowest frequency (Hz)"""
+    return BEAM_WIDTH * SPEED_OF_LIGHT / freq_min / np.asarray(dish_diam, dtype=float) / 2
+
+
+def longest_integration(length, radius, freq_max, tolerance):
+    """Longest time (s) a baseline of length (m) can be averaged over with
+    an amplitude loss within tolerance at radius (rad) and freq_max (Hz)"""
+    rate = EARTH_RATE * np.asarray(length, dtype=float) * radius * freq_max / SPEED_OF_LIGHT
+    with np.errstate(divide="ignore"):
+        return np.sqrt(24 * tolerance) / (2 * np.pi * rate)
+
+
+def factors(xyz, dish_diam, ant1, ant2, dtime, freqs, tolerance, max_factor=MAX_FACTOR):
+    """Number of integrations (of dtime seconds, a power of two) each
+    baseline (ant1, ant2) is averaged over. freqs (Hz) are the frequencies
+    observed, e.g. the first and last channel of each spectral window. The
+    field is the primary beam of the smaller dish of the baseline at the
+    lowest of them."""
+    freq_min, freq_max = np.min(freqs), np.max(freqs)
+    length = np.linalg.norm(xyz[ant1] - xyz[ant2], axis=-1)
+    dish_diam = np.asarray(dish_diam, dtype=float)
+    radius = field_radius(np.minimum(dish_diam[ant1], dish_diam[ant2]), freq_min)
+    fit = longest_integration(length, radius, freq_max, float(tolerance)) / dtime
+    factor = 2 ** np.floor(np.log2(np.clip(fit, 1, max_factor)))
+    return factor.astype(np.int32)
+
+
+def count_rows(nint, factor):
+    """Number of rows of a scan of nint integrations, with baselines
+    averaged over factor integrations"""
+    return int(np.sum(-(-nint // np.asarray(factor))))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of the MSs created by simms. The key of an MS is a
+hash of the (normalised) arguments it was created with and of the contents
+of its antenna table or file, so a repeat request is served by copying the
+cached MS instead of running the simulator again. Files are copied as
+reflinks (copy-on-write) where the filesystem supports it.
+
+The cache lives in $SIMMS_CACHE_DIR, or else $XDG_CACHE_HOME/simms (which
+defaults to ~/.cache/simms). Its size is capped at $SIMMS_CACHE_SIZE GB (10 GB
+by default) by removing the least recently used MSs.
+
+Cached MSs are never hard linked: the MS handed out is usually written to
+afterwards (e.g. when it is filled with visibilities), which would change the
+cached copy as well.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+DEFAULT_SIZE = 10  # GB
+
+# Ioctl that makes a file a copy-on-write clone of another (Linux, on btrfs/XFS and friends)
+FICLONE = 0x40049409
+
+META = "simms-cache.json"
+
+
+def get_dir(path=None):
+    """The cache directory"""
+    if path:
+        return path
+    if os.environ.get("SIMMS_CACHE_DIR"):
+        return os.environ["SIMMS_CACHE_DIR"]
+    xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg, "simms")
+
+
+def get_size(size=None):
+    """The size cap of the cache in bytes. size is in GB"""
+    if size is None:
+        size = float(os.environ.get("SIMMS_CACHE_SIZE", DEFAULT_SIZE))
+    return int(float(size) * 1024**3)
+
+
+def _hash_path(digest, path):
+    # the contents of a file, or of all files in a directory (a CASA table)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                digest.update(os.path.relpath(os.path.join(root, name), path).encode())
+                _hash_path(digest, os.path.join(root, name))
+    else:
+        with open(path, "rb") as stdr:
+            for block in iter(lambda: stdr.read(1 << 20), b""):
+                digest.update(block)
+
+
+def _normalise(value):
+    # the same argument may be given as a string (command line) or a number (JSON, Python)
+    if isinstance(value, (list, tuple)):
+        return [_normalise(item) for item in value]
+    # (but False is not 0)
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+    # and "not set" has two spellings
+    return None if value is None or value == "None" else value
+
+
+def key(arguments, version=""):
+    """Cache key of an MS created with arguments (a dict of makems arguments,
+    minus the name of the MS). The contents of the antenna positions (pos)
+    are hashed instead of their path."""
+    arguments = {name: _normalise(value) for name, value in arguments.items() if name != "outdir"}
+    if not any(arguments.get("scan_length") or []):
+        arguments["scan_length"] = None
+    # an MS created without a date is observed today
+    if arguments.get("date") in (None, "None"):
+        arguments["date"] = time.strftime("today:%Y/%m/%d", time.gmtime())
+
+    pos = arguments.pop("pos", None)
+
+    digest = hashlib.sha256()
+    digest.update(version.encode())
+    digest.update(json.dumps(arguments, sort_keys=True, default=str).encode())
+    # only the contents of a file, so that the same antennas at another path give the same key
+    if isinstance(pos, str) and os.path.exists(pos):
+        _hash_path(digest, pos)
+    else:
+        digest.update(json.dumps(pos, default=str).encode())
+    return digest.hexdigest()
+
+
+def _clone(src, dst):
+    """Copy a file, as a reflink where the filesystem supports it"""
+    try:
+        import fcntl
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return dst
+    except (ImportError, OSError):
+        return shutil.copy2(src, dst)
+
+
+def _copy(src, dst):
+    # multi-MSs have (relative) symbolic links to their subtables
+    shutil.copytree(src, dst, symlinks=True, copy_function=_clone)
+
+
+def _du(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not os.path.islink(os.path.join(root, name)):
+                size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def entries(cache_dir=None):
+    """Metadata of all the MSs in the cache, least recently used first"""
+    cache_dir = get_dir(cache_dir)
+    if not os.path.isdir(cache_dir):
+        return []
+    found = []
+    for name in os.listdir(cache_dir):
+        meta = os.path.join(cache_dir, name, META)
+        if os.path.exists(meta):
+            with open(meta) as stdr:
+                content = json.load(stdr)
+            content.update(key=name, path=os.path.join(cache_dir, name), used=os.path.getmtime(meta))
+            found.append(content)
+    return sorted(found, key=lambda entry: entry["used"])
+
+
+def fetch(msname, ckey, cache_dir=None):
+    """Copy the MS cached under ckey to msname. Returns False if there is none"""
+    path = os.path.join(get_dir(cache_dir), ckey)
+    meta = os.path.join(path, META)
+    if not os.path.exists(meta):
+        return False
+
+    _copy(os.path.join(path, "ms"), msname)
+    # the modification time of the metadata is the last time the entry was used
+    os.utime(meta)
+    print("Copied {} from the simms cache ({})".format(msname, path))
+    return True
+
+
+def store(msname, ckey, arguments=None, cache_dir=None, size=None):
+    """Add msname to the cache under ckey, and remove the least recently used
+    MSs if the cache is over its size cap"""
+    cache_dir = get_dir(cache_dir)
+    size = get_size(size)
+    nbytes = _du(msname)
+    if nbytes > size:
+        return False
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # fill in a temporary directory and rename it, so that an entry is never seen half written
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cache_dir)
+    try:
+        _copy(msname, os.path.join(tmp, "ms"))
+        with open(os.path.join(tmp, META), "w") as stdw:
+            json.dump(dict(nbytes=nbytes, created=time.time(), arguments=arguments), stdw, default=str)
+        os.rename(tmp, os.path.join(cache_dir, ckey))
+    except OSError:
+        # e.g. another process stored the same MS first
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+
+    evict(size, cache_dir, keep=ckey)
+    return True
+
+
+def evict(size=None, cache_dir=None, keep=None):
+    """Remove the least recently used MSs until the cache is within size
+    (bytes). The MS cached under keep is not removed."""
+    size = get_size() if size is None else size
+    found = entries(cache_dir)
+    total = sum(entry["nbytes"] for entry in found)
+    for entry in found:
+        if total <= size:
+            break
+        if entry["key"] == keep:
+            continue
+        shutil.rmtree(entry["path"], ignore_errors=True)
+        total -= entry["nbytes"]
+
+
+def clear(cache_dir=None):
+    """Remove all MSs from the cache"""
+    evict(0, cache_dir)
@@ -10,14 +10,28 @@ import os
 import time
 
 import numpy as np
-from casatools import componentlist, image, measures, simulator, table
 
-# Instantiate all the required tools
-sm = simulator()
-ia = image()
-tb = table()
-me = measures()
-cl = componentlist()
+from simms import (
+    coords,
+    flagging,
+    layouts,
+    memory,
+    msschema,
+    optimise,
+    profiling,
+    schedule,
+    storage,
+    tools,
+    uvw,
+    validation,
+)
+
+# The required tools. These are only created when first used
+sm = tools.LazyTool("sm")
+ia = tools.LazyTool("ia")
+tb = tools.LazyTool("tb")
+me = tools.LazyTool("me")
+cl = tools.LazyTool("cl")
 
 
 DEG = 180 / math.pi
@@ -33,43 +47,151 @@ def get_int_data(tab):
     return (x, y, z), dish_diam, station, mount
 
 
-def wgs84_2xyz(pos_wgs84):
-    """convert wgs84 to itrf"""
+def get_observatory(tel, lon_lat=None):
+    """Position measure of the telescope. This is either given as
+    comma seperated lon,lat[,elevation] or taken from the CASA database"""
+    if (
+        (lon_lat in [None, "None"])
+        and tel
+        and tel.upper() not in [item.upper() for item in me.obslist()]
+    ):
+        raise ValueError(
+            "Could not Find your telescope [%s] in the CASA Database. "
+            "Please double check the telescope name, or provide the location of "
+            "the telescope via lon_lat (or --lon-lat-elv)" % tel
+        )
+
+    obs_pos = None
+    if lon_lat not in [None, "None"]:
+        if isinstance(lon_lat, str):
+            tmp = lon_lat.split(",")
+            lon, lat = ["%sdeg" % i for i in tmp[:2]]
+            if len(tmp) > 2:
+                el = tmp[2] + "m"
+            else:
+                el = "0m"
+            obs_pos = me.position("wgs84", lon, lat, el)
+    return obs_pos or me.observatory(tel)
+
+
+def read_antennas(pos, pos_type="casa", noup=False):
+    """Read antenna positions, dish diameters, station names and mounts from
+    a CASA antenna table or an ASCII file"""
+    if pos_type.lower() == "casa":
+        tb.open(pos)
+        (xx, yy, zz), dish_diam, station, mount = get_int_data(tb)
+        tb.close()
+
+    elif pos_type.lower() == "ascii":
+        # parsed once, then read from the cache of parsed layouts
+        xyz, dish_diam, station, mount = layouts.read_ascii(pos, noup)
+        xx, yy, zz = xyz.T
+    else:
+        raise ValueError("Unknown antenna position type [%s]" % pos_type)
+
+    return (xx, yy, zz), dish_diam, list(station), list(mount)
+
+
+def get_scan_lengths(scan_length, synthesis, ndir):
+    """Scan lengths (in seconds) observed on each field"""
+    if np.isscalar(scan_length):
+        scan_length = [scan_length]
+    # a scan length of 0 (the create_empty_ms default) means no scan length
+    scan_length = [float(sl) * 3600 for sl in scan_length or [] if float(sl) > 0]
+    nscans = len(scan_length)
+
+    synthesis *= 3600
+
+    # fit as many complete scans into field synthesis time as possible
+    if nscans == 1 and scan_length[0] < synthesis:
+        nscans = int(np.floor(synthesis / scan_length[0]))
+        scan_length = scan_length * (nscans)
+
+    if ndir >= 1:
+        # if scan legth is not set, set it to equal the synthesis time per field
+        if nscans == 0:
+            # NOTE(JSKenyon): Use ceil to round synthesis time up to the nearest whole second.
+            # This was added to address issue-67. Cause is likely float conversion in casatools.
+            scan_length = [np.ceil(synthesis * 1.0)] * ndir
+            nscans = 1  # one scan per field for the entire st
+
+    return scan_length
 
-    pos_itrf = np.zeros(pos_wgs84.shape)
-    for i, (x, y, z) in enumerate(pos_wgs84):
-        p = me.position("wgs84", "%fdeg" % x, "%fdeg" % y, "%fm" % z)
-        pos_itrf[i] = me.addxvalue(me.measure(p, "itrf"))["value"]
 
-    return pos_itrf
+def get_integrations(start, stop, dtime, time_range=None):
+    """Range (first, last + 1) of the integrations of a scan from start to stop
+    (seconds) that start within time_range (default: all of them). Like the
+    simulator, the number of integrations in a scan is rounded to the nearest
+    integer, so the last integration may end after stop."""
+    nint = int(np.floor((stop - start) / dtime + 0.5))
+    if time_range is None:
+        return 0, nint
+    first, last = [int(np.ceil((t - start) / dtime - 1e-6)) for t in time_range]
+    return min(max(first, 0), nint), min(max(last, 0), nint)
+
+
+def get_spws(freq0, dfreq, nchan, nbands=1):
+    """Start frequencies, channel widths and number of channels of each spectral window"""
+    freq0, dfreq, nchan = list(freq0), list(dfreq), list(nchan)
+    if nbands > 1 and len(freq0) == 1:
+        # contiguous bands starting at freq0
+        _freq0 = me.frequency("rest", freq0[0])["m0"]["value"]
+        _dfreq = me.frequency("rest", dfreq[0])["m0"]["value"]
+        bw = _dfreq * nchan[0]
+        for band in range(1, nbands):
+            __freq0 = "{:.4f}MHz".format((_freq0 + band * bw) / 1e6)
+            freq0.append(__freq0)
+
+    nbands = len(freq0)
+    while len(nchan) < nbands:
+        nchan.append(nchan[-1])
+    while len(dfreq) < nbands:
+        dfreq.append(dfreq[-1])
+
+    return freq0, dfreq, nchan
+
+
+def wgs84_2xyz(pos_wgs84):
+    """convert wgs84 to itrf"""
+    return coords.wgs84_to_itrf(pos_wgs84)
 
 
 def enu2xyz(refpos_wgs84, enu):
     """converts xyz0 + ENU (Nx3 array) into xyz"""
-    refpos = me.measure(refpos_wgs84, "itrf")
-    lon, lat, rad = [refpos[x]["value"] for x in ("m0", "m1", "m2")]
-    xyz0 = rad * np.array(
-        [math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)]
-    )
-    # 3x3 transform matrix. Each row is a normal vector, i.e. the rows are (dE,dN,dU)
-    xform = np.array(
-        [
-            [-math.sin(lon), math.cos(lon), 0],
-            [
-                -math.cos(lon) * math.sin(lat),
-                -math.sin(lon) * math.sin(lat),
-                math.cos(lat),
-            ],
-            [
-                math.cos(lat) * math.cos(lon),
-                math.cos(lat) * math.sin(lon),
-                math.sin(lat),
-            ],
-        ]
-    )
-
-    xyz = xyz0[np.newaxis, :] + enu.dot(xform)
-    return xyz
+    return coords.enu_to_itrf(enu, coords.position_to_itrf(refpos_wgs84))
+
+
+def get_itrf(pos, pos_type="casa", coord_sys="itrf", noup=False, obs_pos=None, antennas=None):
+    """ITRF antenna positions (nant,3), dish diameters, station names and mounts.
+    ASCII positions may also be given as ENU offsets from obs_pos or as WGS84.
+    If antennas is given, only the antennas of that subarray (see
+    simms.layouts.select) are returned."""
+    (xx, yy, zz), dish_diam, station, mount = read_antennas(pos, pos_type, noup)
+    xyz = np.stack([xx, yy, zz], axis=-1)
+    if pos_type.lower() == "ascii" and coord_sys == "enu":
+        xyz = enu2xyz(obs_pos, xyz)
+    elif pos_type.lower() == "ascii" and coord_sys == "wgs84":
+        xyz = wgs84_2xyz(xyz)
+    dish_diam = np.asarray(dish_diam, dtype=float)
+
+    if antennas:
+        centre = coords.position_to_itrf(obs_pos) if obs_pos else None
+        index = layouts.select(station, xyz, antennas, centre)
+        xyz, dish_diam = xyz[index], dish_diam[index]
+        station, mount = [station[i] for i in index], [mount[i] for i in index]
+    return xyz, dish_diam, station, mount
+
+
+def get_baselines(xyz, station, auto_corr=False, obs_pos=None, baselines=None, min_baseline=None, max_baseline=None):
+    """Antenna indices (ant1, ant2) of the baselines observed: all of them,
+    or those selected by baselines, min_baseline and max_baseline (see
+    simms.layouts.select_baselines)"""
+    ant1, ant2 = uvw.baselines(len(xyz), auto_corr)
+    if baselines or min_baseline or max_baseline:
+        centre = coords.position_to_itrf(obs_pos) if obs_pos else None
+        index = layouts.select_baselines(station, xyz, ant1, ant2, baselines, min_baseline, max_baseline, centre)
+        ant1, ant2 = ant1[index], ant2[index]
+    return ant1, ant2
 
 
 def makems(
@@ -100,28 +222,72 @@ def makems(
     date=None,
     noup=False,
     auto_corr=False,
-    scan_lag=0,
-):  # Deprecated
-    """Creates an empty measurement set using CASA simulate (sm) tool."""
+    scan_lag=0,  # Deprecated
+    spws=None,
+    time_range=None,
+    constant_columns=None,
+    omit_columns=None,
+    layout=None,
+    tile_shape=None,
+    chunk_rows=None,
+    chunk_mb=None,
+    report_memory=False,
+    validation="quick",
+    drop_flagged=None,
+    antennas=None,
+    baselines=None,
+    min_baseline=None,
+    max_baseline=None,
+    bda_tolerance=None,
+    output_format="ms",
+    zarr_chunks=None,
+    append=False,
+):
+    """Creates an empty measurement set using CASA simulate (sm) tool.
+    If spws (a list of indices) is given, all spectral windows are defined
+    but only those in spws are observed. If time_range (start, stop) is given
+    (seconds, relative to the reference time), only integrations starting in
+    that range are observed. Scans are numbered as they would be if
+    everything was observed. The visibility columns in constant_columns are
+    stored as constants and the optional columns in omit_columns are removed
+    (see simms.storage); the simulator still writes them first. If a layout or
+    tile_shape is given (see msschema.tile_shape), the tiled visibility
+    columns are stored with that tile shape instead of the simulator's.
+    The simulator writes one integration at a time; chunk_rows and chunk_mb
+    set the chunks of rows copied by the conversions above (see
+    storage.get_chunk_rows). If report_memory, the memory used is printed
+    after each scan. validation is how the MS is checked once created, one
+    of simms.validation.MODES. Rows are flagged below the elevation_limit
+    (deg) or shadowed by more than the shadow_limit (see simms.flagging);
+    flagged rows can only be dropped (drop_flagged) by the native backend.
+    antennas selects a subarray of the layout (see simms.layouts.select);
+    baselines can only be selected (baselines, min_baseline, max_baseline)
+    by the native backend, the simulator observes all of them, and only the
+    native backend averages baselines over time (bda_tolerance, the
+    decorrelation tolerance, see simms.bda). Zarr stores and observations in
+    memory (output_format) are only made, and MSs only appended to (append),
+    by the native backend."""
     t0 = time.time()
-
-    if (
-        (lon_lat is None)
-        and tel
-        and tel.upper() not in [item.upper() for item in me.obslist()]
-    ):
-        raise ValueError(
-            "Could not Find your telescope [%s] in the CASA Database. "
-            "Please double check the telescope name, or provide the location of "
-            "the telescope via lon_lat (or --lon-lat-elv)" % tel
-        )
-
-    # The price you pay for allowing both string and float values for the same options
-    def toFloat(val):
-        try:
-            return float(val)
-        except TypeError:
-            return val
+    if drop_flagged:
+        raise ValueError("Flagged rows can only be dropped by the native backend")
+    if baselines or min_baseline or max_baseline:
+        raise ValueError("Baselines can only be selected by the native backend")
+    if bda_tolerance:
+        raise ValueError("Baseline-dependent averaging is only done by the native backend")
+    if output_format != "ms":
+        raise ValueError("Zarr stores and observations in memory are only made by the native backend")
+    if append:
+        raise ValueError("Only the native backend appends to an MS")
+    phases = profiling.Phases("casasm.makems")
+    phases.next("configure")
+    constant, omit = msschema.get_column_storage(constant_columns, omit_columns)
+    spw_nchan = get_spws(freq0, dfreq, nchan, nbands)[2]
+    if constant and len(set(spw_nchan)) > 1:
+        raise ValueError("Columns can only be stored as constants if all spectral windows have the same shape")
+    # fail early on a bad layout or tile shape
+    msschema.tile_shape(len(stokes.split()), max(spw_nchan), layout, tile_shape)
+
+    obs_pos = get_observatory(tel, lon_lat)
 
     if not isinstance(dtime, str):
         dtime = "%ds" % dtime
@@ -133,58 +299,29 @@ def makems(
     if outdir not in [None, "None", "."]:
         msname = "%s/%s" % (outdir, msname)
 
-    obs_pos = None
-    lon, lat = None, None
-    if lon_lat not in [None, "None"]:
-        if isinstance(lon_lat, str):
-            tmp = lon_lat.split(",")
-            lon, lat = ["%sdeg" % i for i in tmp[:2]]
-            if len(tmp) > 2:
-                el = tmp[2] + "m"
-            else:
-                el = "0m"
-            obs_pos = me.position("wgs84", lon, lat, el)
-    obs_pos = obs_pos or me.observatory(tel)
     me.doframe(obs_pos)
 
     sm.open(msname)
 
     if fromknown:
+        if antennas:
+            raise ValueError("Subarrays (antennas) need the layout of the antennas (pos)")
         sm.setknownconfig(tel)
 
     elif pos:
-        if pos_type.lower() == "casa":
-            tb.open(pos)
-            (xx, yy, zz), dish_diam, station, mount = get_int_data(tb)
-            tb.close()
-            coords = "itrf"
-
-        elif pos_type.lower() == "ascii":
-            zz = np.zeros(len(pos))
-            if noup:
-                names = ["x", "y", "dd", "station", "mount"]
-                ncols = 5
-            else:
-                names = ["x", "y", "z", "dd", "station", "mount"]
-                ncols = 6
-            dtype = ["float"] * ncols
-            dtype[-2:] = ["|S20"] * 2
+        # positions are always passed to the simulator as ITRF
+        xyz, dish_diam, station, mount = get_itrf(pos, pos_type, coords, noup, obs_pos, antennas)
+        xx, yy, zz = xyz.T
 
-            pos = np.genfromtxt(pos, names=names, dtype=dtype, usecols=range(ncols))
-            xx, yy, zz = pos["x"], pos["y"], zz if noup else pos["z"]
-            dish_diam, station, mount = pos["dd"], pos["station"], pos["mount"]
-
-        coord_sys = dict(itrf="global", enu="local", wgs84="longlat")
-        #import ipdb; ipdb.set_trace()
         sm.setconfig(
             telescopename=tel,
             x=xx,
             y=yy,
             z=zz,
             dishdiameter=dish_diam,
-            mount=list(map(lambda x: x.decode("utf-8"), mount.tolist())),
-            coordsystem=coord_sys.get(coords, "global"),
-            antname=list(map(lambda x: x.decode("utf-8"), mount.tolist())),
+            mount=mount,
+            coordsystem="global",
+            antname=mount,
             referencelocation=obs_pos,
         )
     else:
@@ -192,17 +329,14 @@ def makems(
             "Observatory name is not known, please provide antenna configuration"
         )
 
-    if shadow_limit or elevation_limit:
-        sm.setlimits(shadowlimit=shadow_limit or 0, elevationlimit=elevation_limit or 0)
+    # the rows are flagged by simms once the simulator is done (see simms.flagging)
+    sm.setlimits(shadowlimit=1.0, elevationlimit="-90deg")
     sm.setauto(autocorrwt=1.0 if auto_corr else 0.0)
     sm.setfeed(mode=feed)
 
     # set date to today (start of observation) if not set by user
     # The actual start time will be set internally by CASA depending on when the field transits
-    if optimise_start:
-        use_ha = True
-    else:
-        use_ha = False
+    use_ha = False
     if date in (None, "None"):
         td = time.gmtime()
         date = "UTC,{0:d}/{1:d}/{02:d}".format(td.tm_year, td.tm_mon, td.tm_mday)
@@ -211,48 +345,17 @@ def makems(
     # set reference time
     epoch, date = date.split(",")
     reftime = me.epoch(epoch, date)
+    scan_length = get_scan_lengths(scan_length, synthesis, len(direction))
+    if optimise_start:
+        reftime = me.measure(reftime, "UTC")["m0"]["value"] * 86400.0
+        start = optimised_start(direction, scan_length, dtime, obs_pos, reftime, elevation_limit)
+        reftime = me.epoch("UTC", "{!r}d".format(start / 86400.0))
+        use_ha = False
     me.doframe(reftime)
     sm.settimes(integrationtime=dtime, usehourangle=use_ha, referencetime=reftime)
 
-    ndir = len(direction)
-    if scan_length:
-        scan_length = [float(sl) * 3600 for sl in scan_length]
-        nscans = len(scan_length)
-    else:
-        nscans = 0
-
-    synthesis *= 3600
-
-    # fit as many complete scans into field synthesis time as possible
-    if nscans == 1 and scan_length[0] < synthesis:
-        nscans = int(np.floor(synthesis / scan_length[0]))
-        scan_length = scan_length * (nscans)
-
-    if ndir >= 1:
-        # if scan legth is not set, set it to equal the synthesis time per field
-        if nscans == 0:
-            # NOTE(JSKenyon): Use ceil to round synthesis time up to the nearest whole second.
-            # This was added to address issue-67. Cause is likely float conversion in casatools.
-            scan_length = [np.ceil(synthesis * 1.0)] * ndir
-            nscans = 1  # one scan per field for the entire st
-
-    # Set spectral window information
-    if nbands > 1 and len(freq0) > 1:
-        nbands = len(freq0)
-    elif nbands > 1 and len(freq0) == 1:
-        _freq0 = me.frequency("rest", freq0[0])["m0"]["value"]
-        _dfreq = me.frequency("rest", dfreq)["m0"]["value"]
-        bw = _dfreq * nchan + _freq0
-        for band in range(1, nbands):
-            __freq0 = "{:.4f}MHz".format(_freq0 + band * bw)
-            freq0.append(__freq0)
-    else:
-        nbands = len(freq0)
-
-    while len(nchan) < nbands:
-        nchan.append(nchan[-1])
-    while len(dfreq) < nbands:
-        dfreq.append(dfreq[-1])
+    freq0, dfreq, nchan = get_spws(freq0, dfreq, nchan, nbands)
+    nbands = len(freq0)
     print("Creating Measurement Set with the following properties:")
     print(
         "\t {} SPWs each with {} channels at of {} resolution".format(
@@ -267,6 +370,14 @@ def makems(
         )
     )
 
+    # scan numbers (as if everything was observed), spws and fields of the scans observed
+    phases.next("observe")
+    scans = schedule.get_schedule(direction, scan_length, nbands)
+    scan_numbers = []
+    observed = []
+    int_time = float(dtime.rstrip("s"))
+    for fid, field in enumerate(direction):
+        sm.setfield(sourcename="{0:02d}".format(fid), sourcedirection=me.direction(*field.split(",")))
     for i, (freq, df, nc) in enumerate(zip(freq0, dfreq, nchan)):
         bname = "{0:02d}".format(i)
         sm.setspwindow(
@@ -277,37 +388,40 @@ def makems(
             nchannels=nc,
             stokes=stokes,
         )
-
-        # Set field information
-        start_time = 0.0 - sum(scan_length) / 2.0
-        num_scans_dumped = dict(zip(direction, [0] * len(direction)))
-        next_direction = 0
-        while any([num_scans_dumped[d] < len(scan_length) for d in direction]):
-            fid = next_direction
-            if num_scans_dumped[direction[fid]] < len(scan_length):
-                field = direction[next_direction].split(",")
-                fname = sourcename = "{0:02d}".format(fid)
-                sm.setfield(sourcename=fname, sourcedirection=me.direction(*field))
-
-                # advance by another scan
-                sl = scan_length[num_scans_dumped[direction[fid]]]
-                stop_time = start_time + sl
-                sm.observe(
-                    "{:02d}".format(fid),
-                    "{:02d}".format(i),
-                    starttime=start_time,
-                    stoptime=stop_time,
-                )
-                start_time += sl
-
-                num_scans_dumped[direction[fid]] += 1
-
-            # advance to next field i.o.t interleave fields
-            next_direction = (next_direction + 1) % len(direction)
+        if spws is not None and i not in spws:
+            continue
+
+        # all the scans of the spectral window are observed in one go
+        names, starts, stops, pointings = [], [], [], []
+        for scan in np.flatnonzero(scans["spw"] == i):
+            _, fid, start_time, stop_time = scans[scan]
+            first, last = get_integrations(start_time, stop_time, int_time, time_range)
+            if last <= first:
+                continue
+            if last < get_integrations(start_time, stop_time, int_time)[1]:
+                stop_time = start_time + last * int_time
+            names.append("{:02d}".format(fid))
+            starts.append("{!r}s".format(float(start_time + first * int_time)))
+            stops.append("{!r}s".format(float(stop_time)))
+            pointings.append(" ".join(direction[fid].split(",")))
+            scan_numbers.append(scan + 1)
+            observed.append((i, int(fid)))
+        if names:
+            sm.observemany(
+                sourcenames=names,
+                spwname=bname,
+                starttimes=starts,
+                stoptimes=stops,
+                directions=pointings,
+                state_obs_mode="OBSERVE_TARGET.ON_SOURCE",
+            )
+            if report_memory:
+                memory.report("spw {} ({} scans)".format(i, len(names)))
 
     me.doframe(reftime)
     me.doframe(obs_pos)
 
+    phases.next("done")
     if sm.done():
         print("Empty MS '{}' created".format(msname))
     else:
@@ -317,40 +431,94 @@ def makems(
             "is due a to bug, raise an issue on https://github.com/SpheMakh/simms"
         )
 
-    if validate(msname, t0):
+    if not observed:
+        raise RuntimeError("Nothing to observe in the selected spectral windows and time range")
+    if profiling.active():
+        tb.open(msname)
+        profiling.add_rows(tb.nrows())
+        tb.close()
+    phases.next("flag")
+    if fromknown:
+        print("WARNING: No elevation and shadowing flags, the antennas of known configurations are not known to simms")
+    else:
+        fields = [me.measure(me.direction(*d.split(",")), "J2000") for d in direction]
+        flagging.flag_ms(
+            msname,
+            xyz,
+            dish_diam,
+            [(d["m0"]["value"], d["m1"]["value"]) for d in fields],
+            elevation_limit,
+            shadow_limit,
+            chunk_rows,
+            chunk_mb,
+        )
+
+    phases.next("storage")
+    if spws is not None or time_range is not None:
+        renumber_scans(msname, scan_numbers)
+    if constant or omit:
+        storage.convert(msname, constant, omit, chunk_rows, chunk_mb)
+    if layout or tile_shape:
+        storage.retile(msname, layout, tile_shape, chunk_rows=chunk_rows, chunk_mb=chunk_mb)
+    if report_memory:
+        memory.report("done")
+
+    phases.next("validate")
+    valid = validate(msname, t0, *observed[0], mode=validation)
+    phases.end()
+    if valid:
         return msname
     else:
         os.system("rm -fr %s" % msname)
 
 
-def validate(msname, t0):
-    # Run a few tests on the MS, see if its valid.
-    print("Validating %s ..." % msname)
-    validated = False
+def optimised_start(direction, scan_length, dtime, obs_pos, reftime, elevation_limit=None):
+    """The reference time (MJD seconds, UTC) within a sidereal day after
+    reftime (MJD seconds) that keeps the fields in direction above the elevation
+    limit for longest (see simms.optimise)"""
+    directions = [me.measure(me.direction(*d.split(",")), "J2000") for d in direction]
+    pos = me.measure(obs_pos, "wgs84")
+    start, above = optimise.best_start(
+        [(d["m0"]["value"], d["m1"]["value"]) for d in directions],
+        schedule.get_schedule(direction, scan_length, 1),
+        float(str(dtime).rstrip("s")),
+        pos["m0"]["value"],
+        pos["m1"]["value"],
+        reftime,
+        elevation_limit,
+    )
+    print(
+        "\t start optimised: fields above the elevation limit for {:.2f} of {:.2f} hr (reuse with --date {})".format(
+            above / 3600.0, sum(scan_length) * len(direction) / 3600.0, optimise.date_string(start)
+        )
+    )
+    return start
 
-    try:
-        tb.open(msname)
-        data = tb.getcell("DATA", 0)
-        ddid = list(set(tb.getcol("DATA_DESC_ID", 0)))
-        fid = list(set(tb.getcol("FIELD_ID", 0)))
-        tb.close()
 
-        if data is None:
-            validated = False
-        elif 0 not in ddid or 0 not in fid:
-            validated = False
-        else:
-            validated = True
-    except ValueError:
+def renumber_scans(msname, scan_numbers):
+    """Replace the scan numbers 1, 2, ... in an MS with scan_numbers"""
+    tb.open(msname, nomodify=False)
+    scans = tb.getcol("SCAN_NUMBER")
+    tb.putcol("SCAN_NUMBER", np.asarray(scan_numbers, dtype=np.int32)[scans - 1])
+    tb.close()
+
+
+def validate(msname, t0, ddid=0, field=0, mode="quick"):
+    """Run the checks of mode (see simms.validation) on the MS, and print
+    its report. ddid and field are the ids expected in the first row.
+    Returns True if the MS is valid."""
+    if mode == "off":
+        return True
+    print("Validating %s (%s) ..." % (msname, mode))
+    report = validation.check(msname, mode, ddid, field)
+    for line in validation.summary(report):
+        print("\t %s" % line)
+    if not report["valid"]:
         # Clean up and exit
         for tabF in glob.glob("tab*"):
             if os.path.isdir(tabF) and os.path.getmtime(tabF) > t0:
                 os.system("rm -fr %s" % tabF)
-
         return False
 
-    if validated:
-        print("MS validated")
-        return True
-    else:
-        return False
+    print("MS validated")
+    return True
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorised conversions between WGS84 (geodetic), ITRF (geocentric XYZ) and
+local ENU coordinates of antenna positions. All positions are (N,3) arrays;
+longitudes and latitudes are in degrees and everything else in metres.
+"""
+import numpy as np
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+
+def wgs84_to_itrf(llh):
+    """Convert (lon, lat, height) to ITRF (x, y, z)"""
+    llh = np.atleast_2d(np.asarray(llh, dtype=float))
+    lon, lat, height = np.deg2rad(llh[:, 0]), np.deg2rad(llh[:, 1]), llh[:, 2]
+    # radius of curvature in the prime vertical
+    nu = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+    return np.stack(
+        [
+            (nu + height) * np.cos(lat) * np.cos(lon),
+            (nu + height) * np.cos(lat) * np.sin(lon),
+            (nu * (1 - WGS84_E2) + height) * np.sin(lat),
+        ],
+        axis=-1,
+    )
+
+
+def itrf_to_wgs84(xyz, niter=3):
+    """Convert ITRF (x, y, z) to (lon, lat, height). Bowring's method, iterated
+    niter times, which is accurate to well below a millimetre on the Earth"""
+    xyz = np.atleast_2d(np.asarray(xyz, dtype=float))
+    x, y, z = xyz.T
+    p = np.hypot(x, y)
+    lon = np.arctan2(y, x)
+    ep2 = WGS84_E2 / (1 - WGS84_E2)
+    b = WGS84_A * (1 - WGS84_F)
+
+    beta = np.arctan2(z, (1 - WGS84_F) * p)
+    for _ in range(niter):
+        lat = np.arctan2(z + ep2 * b * np.sin(beta) ** 3, p - WGS84_E2 * WGS84_A * np.cos(beta) ** 3)
+        beta = np.arctan2((1 - WGS84_F) * np.sin(lat), np.cos(lat))
+
+    nu = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+    # the better conditioned of the two expressions for the height
+    height = np.where(
+        np.abs(np.cos(lat)) > 0.5,
+        p / np.maximum(np.abs(np.cos(lat)), 1e-12) - nu,
+        z / np.where(np.sin(lat) == 0, 1, np.sin(lat)) - nu * (1 - WGS84_E2),
+    )
+    return np.stack([np.rad2deg(lon), np.rad2deg(lat), height], axis=-1)
+
+
+def local_vertical(xyz):
+    """Unit vectors (N,3) normal to the WGS84 ellipsoid at ITRF positions"""
+    llh = np.deg2rad(itrf_to_wgs84(xyz)[:, :2])
+    lon, lat = llh[:, 0], llh[:, 1]
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def enu_frame(ref_xyz):
+    """3x3 transform whose rows are the (dE, dN, dU) unit vectors at the ITRF
+    reference position. As in CASA, the local frame is geocentric, i.e. up
+    points away from the centre of the Earth."""
+    x, y, z = np.asarray(ref_xyz, dtype=float).reshape(3)
+    lon = np.arctan2(y, x)
+    lat = np.arctan2(z, np.hypot(x, y))
+    return np.array(
+        [
+            [-np.sin(lon), np.cos(lon), 0],
+            [-np.cos(lon) * np.sin(lat), -np.sin(lon) * np.sin(lat), np.cos(lat)],
+            [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)],
+        ]
+    )
+
+
+def enu_to_itrf(enu, ref_xyz):
+    """Convert ENU offsets from the ITRF reference position to ITRF (x, y, z)"""
+    enu = np.atleast_2d(np.asarray(enu, dtype=float))
+    return np.asarray(ref_xyz, dtype=float).reshape(1, 3) + enu @ enu_frame(ref_xyz)
+
+
+def itrf_to_enu(xyz, ref_xyz):
+    """Convert ITRF (x, y, z) to ENU offsets from the ITRF reference position"""
+    xyz = np.atleast_2d(np.asarray(xyz, dtype=float))
+    return (xyz - np.asarray(ref_xyz, dtype=float).reshape(1, 3)) @ enu_frame(ref_xyz).T
+
+
+def position_to_itrf(pos):
+    """ITRF (x, y, z) of a CASA position measure (a dict as returned by
+    me.position or me.observatory) in either the ITRF or WGS84 frame"""
+    lon, lat, m2 = [pos[m]["value"] for m in ("m0", "m1", "m2")]
+    units = [pos[m]["unit"] for m in ("m0", "m1")]
+    lon, lat = [np.rad2deg(v) if u == "rad" else v for v, u in zip((lon, lat), units)]
+
+    refer = pos["refer"].upper()
+    if refer == "ITRF":
+        lon, lat = np.deg2rad(lon), np.deg2rad(lat)
+        return m2 * np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    elif refer == "WGS84":
+        return wgs84_to_itrf([lon, lat, m2])[0]
+    else:
+        raise ValueError("Unknown position reference frame [%s]" % pos["refer"])
@@ -14,6 +14,7 @@ dimension by enebaling the --noup (-nu) option
 """
 
 import argparse
+import functools
 import json
 import logging
 import os
@@ -21,8 +22,6 @@ import os
 import importlib.metadata
 import importlib.resources
 
-from simms import casasm
-
 __version__ = importlib.metadata.version("simms")
 
 
@@ -101,6 +100,27 @@ def which_vla(name):
         raise NameError("Telescope name could not recognised")
 
 
+def get_telescope(tel):
+    """CASA observatory name and bundled antenna file of a telescope known to simms"""
+    name = tel.lower()
+    if name in VLA_CONFS + ["jvla"]:
+        return "vla", str(importlib.resources.files("simms.observatories") / _ANTENNAS[which_vla(name)])
+    return _OBS.get(name, name), str(importlib.resources.files("simms.observatories") / _ANTENNAS[name])
+
+
+def resolve_config(jdict):
+    """Arguments of create_empty_ms (e.g. from a JSON config) with the bundled
+    antenna file filled in if tel is a telescope known to simms and no
+    antenna positions are given"""
+    jdict = dict(jdict)
+    tel = jdict.get("tel")
+    if tel and tel.lower() in list(_ANTENNAS.keys()) + VLA_CONFS and not jdict.get("pos", False):
+        jdict["tel"], jdict["pos"] = get_telescope(tel)
+        jdict["pos_type"] = "ascii"
+        jdict["coords"] = "itrf"
+    return jdict
+
+
 def create_empty_ms(
     msname=None,
     label=None,
@@ -119,6 +139,7 @@ def create_empty_ms(
     setlimits=False,
     elevation_limit=0,
     shadow_limit=0,
+    drop_flagged=None,
     outdir=None,
     nolog=False,
     coords="itrf",
@@ -126,12 +147,44 @@ def create_empty_ms(
     noup=False,
     nbands=1,
     direction=[],
+    antennas=None,
+    baselines=None,
+    min_baseline=None,
+    max_baseline=None,
+    bda_tolerance=None,
+    pointing_file=None,
+    hex_rings=0,
+    hex_spacing=None,
     date=None,
     fromknown=False,
     feed="perfect X Y",
     scan_lag=0,
     auto_corr=False,
     optimise_start=None,
+    backend="casa",
+    output_format="ms",
+    zarr_chunks=None,
+    append=False,
+    parallel_spw=0,
+    spw_assembly="multims",
+    shards=0,
+    shard_workers=1,
+    shard_plan=False,
+    constant_columns=None,
+    omit_columns=None,
+    layout=None,
+    tile_shape=None,
+    chunk_rows=None,
+    chunk_mb=None,
+    report_memory=False,
+    validation="quick",
+    profile=None,
+    dry_run=False,
+    space_check=True,
+    benchmark_history=None,
+    cache=True,
+    cache_dir=None,
+    cache_size=None,
 ):
     """
     Uses the CASA simulate tool to create an empty measurement set. Requires
@@ -143,12 +196,84 @@ def create_empty_ms(
     pos: Antenna positions. This can either a CASA table or an ASCII file.
         (see simms --help for more on using an ascii file)
     pos_type: Antenna position type. Choices are (casa, ascii)
-    coords: This is only applicable if you are using an ASCII file. Choices are (itrf, enu)
+    antennas: Subarray of the antennas in pos: a comma separated list of station names (with wildcards),
+        indices, index ranges (e.g. "0:16") and radii from the array centre (e.g. "<5km"). See simms.layouts
+    baselines: Only write these baselines: a comma separated list of pairs of antennas (e.g. "M000&M01*",
+        each side selecting antennas like antennas does) and antennas (all their baselines). Native backend only
+    min_baseline, max_baseline: Only write the baselines at least/at most this long (m, or e.g. "5km").
+        Native backend only
+    bda_tolerance: Average each baseline over as many integrations (a power of two) as keep the loss of
+        amplitude at the edge of the primary beam and the highest frequency within this fraction (e.g. 0.01).
+        The rows have the INTERVAL and EXPOSURE of their averaging interval. Native backend only. See simms.bda
+    coords: This is only applicable if you are using an ASCII file. Choices are (itrf, enu, wgs84)
     synthesis: Synthesis time in hours
     dtime: Integration time in seconds
     freq0: Start frequency
     dfreq: Channel width
     nbands: Number of frequency bands
+    direction: Pointing directions (EPOCH,ra,dec), observed in turns. Default is ra,dec
+    pointing_file: File of the pointings of a mosaic, one "[epoch] ra dec" a line, used instead of direction.
+        See simms.mosaic
+    hex_rings: Observe a mosaic on a hexagonal grid of pointings with this many rings around the (first)
+        direction, hex_spacing (an angle, e.g. "30arcmin") apart. Without scan_length, each pointing of a
+        mosaic is observed in one scan of the synthesis time
+    date: Date of the observation, e.g. "UTC,2014/05/26" or "UTC,2014/05/26/12:12:12". Without it, the
+        observation is centred on the transit of the first field today
+    optimise_start: Centre the observation on the time (within a sidereal day of date) that keeps all fields
+        above the elevation limit for longest. See simms.optimise
+    elevation_limit: Rows are flagged if either antenna is below this elevation (deg). Default is 8
+    shadow_limit: Rows are flagged if either antenna has more than this fraction of its dish shadowed
+        by another antenna. Default is 1e-6. See simms.flagging
+    drop_flagged: Do not write flagged rows ("rows"), or integrations with all rows flagged
+        ("integrations"). Native backend only
+    backend: How the MS is created. Choices are (casa, native). "casa" uses the CASA simulator,
+        "native" computes the observation with NumPy and writes the tables directly (much faster)
+    output_format: What is written. Choices are (ms, zarr, numpy, xarray). "zarr" writes an xarray/dask
+        friendly Zarr store (MSv4-style, a partition per spectral window and field) instead of an MS, and
+        needs zarr. See simms.zarrms. "numpy" and "xarray" write nothing, and return the observation as
+        arrays or an xarray Dataset (see observe). Native backend only
+    zarr_chunks: Chunk shape (time, baseline, frequency) of the visibilities of a Zarr store, -1 for a
+        whole axis. Default is all baselines and channels, and 64 MB of visibilities
+    append: Add the observation to the MS (if it exists) instead of replacing it, writing only the new
+        rows. Spectral windows and fields the MS does not have are added to it, and the scans are numbered
+        after its scans. The antennas and correlations must be those of the MS, which either backend may
+        have created. Native backend only. See native.append_ms
+    parallel_spw: Number of worker processes creating the spectral windows in parallel (if > 1)
+    spw_assembly: How the spectral windows created in parallel are put together. Choices are
+        (multims, concat). "multims" makes a CASA multi-MS, "concat" a single MS.
+    shards: Number of time shards to create the MS in (if > 1). See simms.shards for
+        creating the shards of a manifest on separate nodes.
+    shard_workers: Number of worker processes creating the shards
+    shard_plan: Only write the manifest of the shards (returns its name instead of the MS name)
+    constant_columns: Visibility columns (DATA, MODEL_DATA, CORRECTED_DATA, FLAG, SIGMA, WEIGHT or "all")
+        to store as constants, which takes next to no space. Needs all spectral windows to have the
+        same number of channels. See simms.storage for materialising them later
+    omit_columns: Optional columns (DATA, MODEL_DATA, CORRECTED_DATA, FLAG_CATEGORY or "all") to leave out
+    layout: Tile shape of the tiled visibility columns, by how the MS will be read. Choices are
+        (row, channel, balanced): "row" for reading chunks of rows (e.g. calibration), "channel"
+        for reading ranges of channels (e.g. imaging subbands). Default is the simulator's tiling
+        with the casa backend, and balanced with the native backend
+    tile_shape: Explicit tile shape (ncorr, nchan, nrow) of the visibility columns, overrides layout
+    chunk_rows: Number of rows of visibilities written (or copied) in one go, which bounds the
+        memory used. Default is as many as fit in chunk_mb
+    chunk_mb: Size (MB) of the visibilities written in one go. Default is 256
+    report_memory: Print the memory used (current and peak RSS) after each chunk of rows
+    validation: How the MS is checked once created. Choices are (quick, full, off). "quick" checks
+        the subtables and a sample of rows, "full" reads all rows for the number of rows of each
+        spectral window, field and scan and the baselines without rows. See simms.validation
+    profile: Record the time spent in each phase of creating the MS, the casatools calls, the rows
+        written and the memory used, and write them as a Chrome trace (JSON) to this file, or to
+        <msname>.trace.json if True. See simms.profiling
+    dry_run: Do not create the MS, but print (and return) an estimate of its number of scans,
+        rows, baselines, spectral windows and channels, its size and the time it takes to create.
+        See simms.estimate
+    space_check: Refuse to create an MS that does not fit in the free space of its filesystem,
+        instead of only warning
+    benchmark_history: Benchmark history (see benchmarks/suite.py) the wall time is estimated from
+    cache: Serve repeat requests (same arguments and antenna positions) from the simms cache,
+        and add new MSs to it (if its filesystem has room for them). See simms.cache
+    cache_dir: The cache directory. Default is $SIMMS_CACHE_DIR or $XDG_CACHE_HOME/simms
+    cache_size: Size cap of the cache in GB. Default is $SIMMS_CACHE_SIZE or 10
     **kw: extra keyword arguments.
 
     A standard file should have the format: pos1 pos2 pos3* dish_diameter station
@@ -158,7 +283,13 @@ def create_empty_ms(
     """
 
     def toList_freq(item, nounits=False):
-        items = item.split(",")
+        # comma separated strings (from the command line) or numbers/lists (from JSON)
+        if isinstance(item, str):
+            items = item.split(",")
+        elif isinstance(item, (list, tuple)):
+            items = list(item)
+        else:
+            items = [item]
         if nounits:
             return list(map(int, items))
         else:
@@ -176,22 +307,68 @@ def create_empty_ms(
         direction = ",".join(["J2000", ra, dec])
     if isinstance(direction, str):
         direction = [direction]
+    if pointing_file:
+        from simms import mosaic
+
+        direction = mosaic.read_pointings(pointing_file)
+    elif hex_rings:
+        from simms import mosaic
+
+        if not hex_spacing:
+            raise ValueError("A hexagonal grid of pointings needs their spacing (hex_spacing)")
+        direction = mosaic.hex_grid(direction[0], hex_spacing, hex_rings)
+    if pointing_file or hex_rings:
+        # without scan lengths, each pointing is observed in one scan of the synthesis time
+        lengths = scan_length if isinstance(scan_length, (list, tuple)) else [scan_length]
+        if not any(sl and float(sl) > 0 for sl in lengths):
+            scan_length = [synthesis]
 
     if msname is None:
-        msname = "%s_%dh%ss.MS" % (label or tel, synthesis, dtime)
+        msname = "%s_%dh%ss.%s" % (label or tel, synthesis, dtime, "zarr" if output_format == "zarr" else "MS")
     if outdir not in [None, "."]:
         msname = "%s/%s" % (outdir, msname)
         outdir = None
 
-    if os.path.exists(msname):
-        os.system("rm -fr %s" % msname)
+    # imported here so that the CLI starts without loading numpy
+    from simms import casasm, native, observation, parallel, profiling, shards as sharding
+
+    in_memory = output_format in observation.FORMATS
 
-    casasm.makems(
-        msname=msname,
+    if backend == "native":
+        makems = native.makems
+    elif backend == "casa":
+        makems = casasm.makems
+    else:
+        raise ValueError("Unknown backend [%s]. Choices are (casa, native)" % backend)
+
+    if (append or output_format != "ms") and ((parallel_spw and parallel_spw > 1) or (shards and shards > 1)):
+        raise ValueError(
+            "Zarr stores, observations in memory and appended rows are made in one go, "
+            "not in parallel spectral windows or shards"
+        )
+    if append and output_format != "ms":
+        raise ValueError("Only an MS can be appended to")
+    if parallel_spw and parallel_spw > 1 and shards and shards > 1:
+        raise ValueError("Spectral windows cannot be created in parallel in a sharded MS")
+    if parallel_spw and parallel_spw > 1:
+        makems = functools.partial(
+            parallel.makems, backend=backend, nworkers=parallel_spw, assembly=spw_assembly
+        )
+    elif shards and shards > 1 and shard_plan:
+        makems = functools.partial(sharding.plan, nshards=shards, backend=backend)
+    elif shards and shards > 1:
+        makems = functools.partial(sharding.makems, backend=backend, nshards=shards, nworkers=shard_workers)
+
+    arguments = dict(
         label=label,
         tel=tel,
         pos=pos,
         pos_type=pos_type,
+        antennas=antennas,
+        baselines=baselines,
+        min_baseline=min_baseline,
+        max_baseline=max_baseline,
+        bda_tolerance=bda_tolerance,
         synthesis=synthesis,
         scan_length=scan_length,
         dtime=dtime,
@@ -202,6 +379,7 @@ def create_empty_ms(
         setlimits=setlimits,
         elevation_limit=elevation_limit,
         shadow_limit=shadow_limit,
+        drop_flagged=drop_flagged,
         coords=coords,
         lon_lat=lon_lat,
         noup=noup,
@@ -214,6 +392,95 @@ def create_empty_ms(
         scan_lag=scan_lag,
         auto_corr=auto_corr,
         optimise_start=optimise_start,
+        constant_columns=constant_columns,
+        omit_columns=omit_columns,
+        layout=layout,
+        tile_shape=tile_shape,
+        output_format=output_format,
+        zarr_chunks=zarr_chunks,
+        append=append,
+    )
+    # how the rows are written and checked does not change the MS, so it is not part of the cache key
+    writing = dict(chunk_rows=chunk_rows, chunk_mb=chunk_mb, report_memory=report_memory, validation=validation)
+    report = None
+    if dry_run or not (shard_plan or in_memory):
+        from simms import estimate
+
+        try:
+            report = estimate.estimate(backend, history=benchmark_history, **arguments)
+        except ValueError:
+            # e.g. a known CASA configuration, whose antennas are only known to the simulator
+            if dry_run:
+                raise
+    if dry_run:
+        print("Dry run, {} would have:".format(msname))
+        for line in estimate.summary(report):
+            print(line)
+        problem = estimate.check_space(msname, report["peak_bytes"])
+        if problem:
+            print("WARNING: " + problem)
+        return report
+    if report:
+        # shards are merged into (and parts concatenated into) a copy
+        copies = 2 if (shards and shards > 1) or (parallel_spw and parallel_spw > 1 and spw_assembly == "concat") else 1
+        problem = estimate.check_space(msname, copies * report["peak_bytes"])
+        if problem and space_check:
+            raise RuntimeError(problem + ". Use --no-space-check to create it anyway")
+        elif problem:
+            print("WARNING: " + problem)
+
+    if os.path.exists(msname) and not (in_memory or append):
+        os.system("rm -fr %s" % msname)
+
+    def create():
+        # the cache only has MSs (as a whole)
+        if not cache or shard_plan or output_format != "ms" or append:
+            return makems(msname=msname, **arguments, **writing)
+
+        from simms import cache as mscache
+
+        # how the MS was put together matters, not how many processes did it
+        ckey = mscache.key(
+            dict(arguments, backend=backend, assembly=spw_assembly if parallel_spw and parallel_spw > 1 else None),
+            version=__version__,
+        )
+        with profiling.span("cache fetch"):
+            if mscache.fetch(msname, ckey, cache_dir):
+                return msname
+        made = makems(msname=msname, **arguments, **writing)
+        # the cached copy takes room of its own, maybe on another filesystem than the MS
+        problem = report and estimate.check_space(os.path.join(mscache.get_dir(cache_dir), ckey), report["peak_bytes"])
+        if made and problem:
+            print("Not adding {} to the simms cache: {}".format(made, problem))
+        elif made:
+            with profiling.span("cache store"):
+                mscache.store(made, ckey, arguments, cache_dir, cache_size)
+        return made
+
+    if not profile:
+        return create()
+    trace_name = profile if isinstance(profile, str) else "%s.trace.json" % msname.rstrip("/")
+    with profiling.trace(trace_name):
+        with profiling.span("create_empty_ms", backend=backend):
+            return create()
+
+
+def observe(dataset=False, backend="native", **kw):
+    """Computes the observation create_empty_ms would create, but returns it
+    instead of creating an MS: the rows of its main table (TIME, UVW,
+    ANTENNA1/2, FIELD_ID, FLAG_ROW, ...) as NumPy arrays, with the
+    frequencies, fields and antennas of the observation. Nothing is written,
+    so repeated observations (e.g. in tests) need neither the simulator nor
+    the filesystem. Only the native backend computes observations in memory.
+
+    dataset: Return an xarray Dataset (needs xarray) instead of a dict of arrays
+    **kw: The arguments of create_empty_ms. A telescope known to simms (tel) needs no
+        antenna positions (pos)
+
+    See simms.observation for what is returned.
+    """
+    return create_empty_ms(
+        backend=backend, output_format="xarray" if dataset else "numpy", cache=False, **resolve_config(kw)
     )
 
 
@@ -245,6 +512,43 @@ def main():
         choices=["casa", "ascii"],
         help="position list type : dafault is casa",
     )
+    add(
+        "-ants",
+        "--antennas",
+        dest="antennas",
+        help="Subarray of the antennas in the layout. Comma separated station names (which may have "
+        "wildcards, e.g. M01*), indices, index ranges (e.g. 0:16, the first 16) and radii from the "
+        "array centre (e.g. '<5km'). Example: --antennas '<1km,60:' : default is all antennas",
+    )
+    add(
+        "-bls",
+        "--baselines",
+        dest="baselines",
+        help="Only write these baselines. Comma separated pairs of antennas joined by & (each side selects "
+        "antennas as --antennas does) and antennas (all their baselines). Example: --baselines 'M000&M01*,M060'. "
+        "Native backend only : default is all baselines",
+    )
+    add(
+        "-minbl",
+        "--min-baseline",
+        dest="min_baseline",
+        help="Only write baselines at least this long (m, or with units, e.g. 1km). Native backend only : no default",
+    )
+    add(
+        "-maxbl",
+        "--max-baseline",
+        dest="max_baseline",
+        help="Only write baselines at most this long (m, or with units, e.g. 1km). Native backend only : no default",
+    )
+    add(
+        "-bda",
+        "--bda-tolerance",
+        dest="bda_tolerance",
+        type=float,
+        help="Baseline-dependent averaging. Average each baseline over as many integrations (a power of two) "
+        "as keep the loss of amplitude at the edge of the primary beam and the highest frequency within "
+        "this fraction (e.g. 0.01). Native backend only : no default",
+    )
     add(
         "-cs",
         "--coord-sys",
@@ -301,6 +605,28 @@ def main():
         help="Pointing direction. Example J2000,0h0m0s,-30d0m0d. Option "
         "--direction may be specified multiple times for multiple pointings",
     )
+    add(
+        "-pf",
+        "--pointing-file",
+        dest="pointing_file",
+        help="File of the pointings of a mosaic, one '[epoch] ra dec' a line (plain numbers are degrees). "
+        "Overrides --direction : no default",
+    )
+    add(
+        "-hex",
+        "--hex-rings",
+        dest="hex_rings",
+        type=int,
+        default=0,
+        help="Observe a mosaic of pointings on a hexagonal grid with this number of rings around the "
+        "(first) direction : default is 0, no mosaic",
+    )
+    add(
+        "-hexs",
+        "--hex-spacing",
+        dest="hex_spacing",
+        help="Spacing of the pointings of a hexagonal grid, e.g. 30arcmin : no default",
+    )
     add(
         "-ra",
         "--ra",
@@ -409,7 +735,8 @@ def main():
         "-os",
         "--optimise-start",
         action="store_true",
-        help="Modify observation start time to maximise source visibility.",
+        help="Start the observation at the time (on the day of --date) that keeps all fields above the "
+        "elevation limit for longest, and print it as a --date to reuse",
     )
     add(
         "-slg",
@@ -423,7 +750,7 @@ def main():
         "--set-limits",
         dest="set_limits",
         action="store_true",
-        help="Set telescope limits; elevation and shadow limts : not the default",
+        help="Set telescope limits; elevation and shadow limts (which now always apply) : not the default:: DEPRECATED",
     )
     add(
         "-el",
@@ -431,7 +758,7 @@ def main():
         dest="elevation_limit",
         type=float,
         default=0,
-        help="Dish elevation limit. Will only be taken into account if --set-limits (-stl) is enabled : no default",
+        help="Elevation limit (deg). Rows are flagged if either antenna is below it : default is 8",
     )
     add(
         "-shl",
@@ -439,7 +766,16 @@ def main():
         dest="shadow_limit",
         type=float,
         default=0,
-        help="Shadow limit. Will only be taken into account if --set-limits (-stl) is enabled : no default",
+        help="Shadow limit. Rows are flagged if either antenna has more than this fraction of its dish "
+        "area shadowed by another antenna : default is 1e-6",
+    )
+    add(
+        "-drop",
+        "--drop-flagged",
+        dest="drop_flagged",
+        choices=["rows", "integrations"],
+        help="Do not write flagged rows ('rows'), or integrations with all rows flagged ('integrations'), "
+        "to the MS. Native backend only : no default",
     )
     add(
         "-ac",
@@ -455,10 +791,316 @@ def main():
         action="store_true",
         help="Don't keep Log file : not the default",
     )
+    add(
+        "-be",
+        "--backend",
+        dest="backend",
+        default="casa",
+        choices=["casa", "native"],
+        help="How to create the MS. 'casa' uses the CASA simulator, 'native' computes "
+        "the observation with NumPy and writes the MS tables directly (much faster) : default is casa",
+    )
+    add(
+        "-of",
+        "--output-format",
+        dest="output_format",
+        default="ms",
+        choices=["ms", "zarr"],
+        help="What to write: an MS, or an xarray/dask friendly Zarr store (MSv4-style, a partition per "
+        "spectral window and field) that many workers can fill at once. Zarr needs the native backend "
+        "and zarr : default is ms",
+    )
+    add(
+        "-zc",
+        "--zarr-chunks",
+        dest="zarr_chunks",
+        help="Chunk shape time,baseline,frequency of the visibilities of a Zarr store, -1 for a whole axis. "
+        "Example: --zarr-chunks 100,-1,256 : default is all baselines and channels, and 64 MB of visibilities",
+    )
+    add(
+        "-app",
+        "--append",
+        dest="append",
+        action="store_true",
+        help="Add the observation (e.g. another band, field or time range) to the MS if it exists, writing "
+        "only the new rows, instead of replacing it. The MS may have been created by either backend. "
+        "Native backend only : not the default",
+    )
+    add(
+        "-pspw",
+        "--parallel-spw",
+        dest="parallel_spw",
+        type=int,
+        default=0,
+        help="Create the spectral windows in parallel, with this many worker processes : no default",
+    )
+    add(
+        "-spwa",
+        "--spw-assembly",
+        dest="spw_assembly",
+        default="multims",
+        choices=["multims", "concat"],
+        help="How to put together spectral windows created with --parallel-spw. 'multims' makes a "
+        "CASA multi-MS, 'concat' copies them into a single MS : default is multims",
+    )
+    add(
+        "-sh",
+        "--shards",
+        dest="shards",
+        type=int,
+        default=0,
+        help="Create the MS in this many time shards, which are then merged : no default",
+    )
+    add(
+        "-shw",
+        "--shard-workers",
+        dest="shard_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes creating the shards : default is 1",
+    )
+    add(
+        "-shp",
+        "--shard-plan",
+        dest="shard_plan",
+        action="store_true",
+        help="With --shards, only write the shard manifest (MSNAME.shards.json). The shards can then be "
+        "created independently with --shard-manifest and --shard-index, and merged with --shard-merge",
+    )
+    add(
+        "-shm",
+        "--shard-manifest",
+        dest="shard_manifest",
+        help="Shard manifest written by --shard-plan. Use with --shard-index or --shard-merge : no default",
+    )
+    add(
+        "-shi",
+        "--shard-index",
+        dest="shard_index",
+        type=int,
+        help="Create this shard of --shard-manifest : no default",
+    )
+    add(
+        "-shM",
+        "--shard-merge",
+        dest="shard_merge",
+        action="store_true",
+        help="Merge the shards of --shard-manifest : not the default",
+    )
     add("-jc", "--json-config", dest="config", help="Json config file : No default")
+    add(
+        "-ccol",
+        "--constant-columns",
+        dest="constant_columns",
+        help="Comma separated visibility columns (DATA, MODEL_DATA, CORRECTED_DATA, FLAG, SIGMA, WEIGHT) "
+        "to store as constants, which takes next to no space, or 'all'. Needs all spectral windows to "
+        "have the same number of channels : default is to store them tiled",
+    )
+    add(
+        "-ocol",
+        "--omit-columns",
+        dest="omit_columns",
+        help="Comma separated optional columns (DATA, MODEL_DATA, CORRECTED_DATA, FLAG_CATEGORY) "
+        "to leave out of the MS, or 'all' : no default",
+    )
+    add(
+        "-lay",
+        "--layout",
+        dest="layout",
+        choices=["row", "channel", "balanced"],
+        help="Tile shape of the visibility columns, by how the MS will be read: 'row' for reading chunks "
+        "of rows (e.g. calibration), 'channel' for ranges of channels (e.g. imaging subbands). See "
+        "benchmarks/layout.py : default is the simulator's tiling (balanced for the native backend)",
+    )
+    add(
+        "-ts",
+        "--tile-shape",
+        dest="tile_shape",
+        help="Explicit tile shape of the visibility columns as ncorr,nchan,nrow. Overrides --layout : no default",
+    )
+    add(
+        "-mat",
+        "--materialise",
+        dest="materialise",
+        help="Store the columns of this (existing) MS that are stored as constants (or the "
+        "--materialise-columns) tiled, as set by --layout/--tile-shape, and exit. Columns left out "
+        "of the MS are added : no default",
+    )
+    add(
+        "-matc",
+        "--materialise-columns",
+        dest="materialise_columns",
+        help="Comma separated columns to --materialise : default is all columns stored as constants",
+    )
+    add(
+        "-chr",
+        "--chunk-rows",
+        dest="chunk_rows",
+        type=int,
+        help="Number of rows of visibilities written in one go. Bounds the memory used : "
+        "default is as many as fit in --chunk-mb",
+    )
+    add(
+        "-chmb",
+        "--chunk-mb",
+        dest="chunk_mb",
+        type=float,
+        help="Size in MB of the visibilities written in one go : default is 256",
+    )
+    add(
+        "-rmem",
+        "--report-memory",
+        dest="report_memory",
+        action="store_true",
+        help="Print the memory used (current and peak RSS) after each chunk of rows written",
+    )
+    add(
+        "-val",
+        "--validate",
+        dest="validation",
+        choices=["quick", "full", "off"],
+        default="quick",
+        help="How the MS is checked once created: 'quick' checks the subtables and a sample of rows, "
+        "'full' reads all rows and prints the number of rows of each spectral window, field and scan "
+        "and the baselines without rows : default is quick",
+    )
+    add(
+        "-prof",
+        "--profile",
+        dest="profile",
+        nargs="?",
+        const=True,
+        help="Record the time spent in each phase of creating the MS (and in casatools calls), the rows "
+        "written and the memory used, as a Chrome trace (open it in chrome://tracing or "
+        "https://ui.perfetto.dev). Written to the given file : default is <msname>.trace.json",
+    )
+    add(
+        "-dry",
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Do not create the MS, print the number of scans, rows, baselines, spectral windows and channels, "
+        "the bytes of each column, the size on disk and an estimate of the time it would take",
+    )
+    add(
+        "-nosc",
+        "--no-space-check",
+        dest="space_check",
+        action="store_false",
+        help="Only warn (instead of refusing to create the MS) if it does not fit in the free space",
+    )
+    add(
+        "-bh",
+        "--benchmark-history",
+        dest="benchmark_history",
+        default="simms-benchmarks.json",
+        help="Benchmark history (of benchmarks/suite.py) that --dry-run estimates the wall time from : "
+        "default is simms-benchmarks.json",
+    )
+    add(
+        "-noc",
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="Always create the MS, even if an identical one is in the simms cache, and do not add it to the cache",
+    )
+    add(
+        "-cdir",
+        "--cache-dir",
+        dest="cache_dir",
+        help="Directory of the simms cache of MSs : default is $SIMMS_CACHE_DIR or $XDG_CACHE_HOME/simms",
+    )
+    add(
+        "-csize",
+        "--cache-size",
+        dest="cache_size",
+        type=float,
+        help="Size cap of the simms cache in GB. The least recently used MSs are removed to keep "
+        "the cache within it : default is $SIMMS_CACHE_SIZE or 10",
+    )
+    add(
+        "-B",
+        "--batch",
+        dest="batch",
+        help="Create all the MSs of this batch file (a JSON list of --json-config style "
+        "jobs, or a grid of them; see simms.batch) with a pool of worker processes : no default",
+    )
+    add(
+        "-Bw",
+        "--batch-workers",
+        dest="batch_workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes running the --batch (or --serve) jobs : default is the number of CPUs",
+    )
+    add(
+        "-Bl",
+        "--batch-logdir",
+        dest="batch_logdir",
+        default="simms-batch-logs",
+        help="Directory for the output of each --batch (or --serve) job : default is simms-batch-logs",
+    )
+    add(
+        "-srv",
+        "--serve",
+        dest="serve",
+        metavar="SOCKET",
+        help="Run a simms server on this Unix socket, whose --batch-workers warm worker processes run "
+        "the jobs sent to it (see simms.serve), until it is shut down : no default",
+    )
+    add(
+        "-srvc",
+        "--server",
+        dest="server",
+        metavar="SOCKET",
+        help="Run the MS (or the --batch jobs) on the simms server at this Unix socket, printing the "
+        "progress of the jobs : no default",
+    )
 
     args = parser.parse_args()
 
+    if args.shard_manifest:
+        from simms import shards
+
+        if args.shard_index is not None:
+            shards.make_shard(args.shard_manifest, args.shard_index)
+        elif args.shard_merge:
+            shards.merge(args.shard_manifest)
+        else:
+            raise parser.error("--shard-manifest needs either --shard-index or --shard-merge")
+        return
+
+    if args.materialise:
+        from simms import storage
+
+        columns = storage.materialise(
+            args.materialise,
+            args.materialise_columns,
+            args.layout,
+            args.tile_shape,
+            args.chunk_rows,
+            args.chunk_mb,
+        )
+        print("Materialised {} in {}".format(", ".join(columns) or "nothing", args.materialise))
+        return
+
+    if args.serve:
+        from simms import serve
+
+        serve.serve(args.serve, args.batch_workers, args.batch_logdir)
+        return
+
+    if args.batch:
+        from simms import batch
+
+        jobs = batch.load_jobs(args.batch)
+        if args.server:
+            return _submit(args.server, jobs)
+        print("Running {} jobs with {} workers (logs in {})".format(len(jobs), args.batch_workers, args.batch_logdir))
+        results = batch.run(jobs, args.batch_workers, args.batch_logdir)
+        print(batch.summary(results))
+        return 0 if all(result["status"] == "done" for result in results) else 1
+
     if args.config:
         with open(args.config) as conf:
             jdict = json.load(conf)
@@ -467,17 +1109,7 @@ def main():
             if isinstance(val, str):
                 jdict[key] = str(val)
 
-        tel = jdict["tel"]
-        if tel in list(_ANTENNAS.keys()) + VLA_CONFS and not jdict.get("pos", False):
-            if tel[:-3] in ["vla", "jvl"]:
-                pos = which_vla(tel)
-                jdict["tel"] = "vla"
-            else:
-                pos = jdict["tel"]
-            # jdict["pos"] = "%s/observatories/%s" % (simms_path, _ANTENNAS[pos])
-            jdict["pos"] = str(importlib.resources.files("simms.observatories") / _ANTENNAS[pos])
-            jdict["pos_type"] = "ascii"
-            jdict["coords"] = "itrf"
+        jdict = resolve_config(jdict)
 
     else:
         if (not args.tel) and (not args.lon_lat):
@@ -485,16 +1117,8 @@ def main():
                 "Either the telescope name (--tel/-T) or Telescope coordinate (-lle/--lon-lat )is required"
             )
 
-        telescope = args.tel.lower()
-        if telescope in list(_ANTENNAS.keys()) + VLA_CONFS and args.pos is None:
-            if telescope[:3] in ["vla", "jvl"] and args.pos in [None, False, ""]:
-                pos = which_vla(telescope)
-                telescope = "vla"
-            else:
-                pos = _OBS[args.tel.lower()]
-                telescope = _OBS[pos]
-            antennas = str(importlib.resources.files("simms.observatories") / _ANTENNAS[pos])
-
+        if args.tel and args.tel.lower() in list(_ANTENNAS.keys()) + VLA_CONFS and args.pos is None:
+            telescope, antennas = get_telescope(args.tel)
             _type = "ascii"
             cs = "itrf"
         else:
@@ -509,6 +1133,11 @@ def main():
             pos=antennas,
             feed=" ".join(args.feed),
             pos_type=_type,
+            antennas=args.antennas,
+            baselines=args.baselines,
+            min_baseline=args.min_baseline,
+            max_baseline=args.max_baseline,
+            bda_tolerance=args.bda_tolerance,
             ra=args.ra,
             dec=args.dec,
             synthesis=args.synthesis,
@@ -521,20 +1150,62 @@ def main():
             setlimits=args.set_limits,
             elevation_limit=args.elevation_limit,
             shadow_limit=args.shadow_limit,
+            drop_flagged=args.drop_flagged,
             outdir=args.outdir,
             coords=cs,
             lon_lat=args.lon_lat,
             noup=args.noup,
             direction=args.direction,
+            pointing_file=args.pointing_file,
+            hex_rings=args.hex_rings,
+            hex_spacing=args.hex_spacing,
             nbands=args.nband,
             date=args.date,
             optimise_start=args.optimise_start,
             scan_lag=args.scan_lag,
             auto_corr=args.auto_corr,
             nolog=args.nolog,
+            backend=args.backend,
+            output_format=args.output_format,
+            zarr_chunks=args.zarr_chunks,
+            append=args.append,
+            parallel_spw=args.parallel_spw,
+            spw_assembly=args.spw_assembly,
+            shards=args.shards,
+            shard_workers=args.shard_workers,
+            shard_plan=args.shard_plan,
+            constant_columns=args.constant_columns,
+            omit_columns=args.omit_columns,
+            layout=args.layout,
+            tile_shape=args.tile_shape,
+            chunk_rows=args.chunk_rows,
+            chunk_mb=args.chunk_mb,
+            report_memory=args.report_memory,
+            validation=args.validation,
+            profile=args.profile,
+            dry_run=args.dry_run,
+            space_check=args.space_check,
+            benchmark_history=args.benchmark_history,
+            cache=args.cache,
+            cache_dir=args.cache_dir,
+            cache_size=args.cache_size,
         )
 
-        create_empty_ms(**jdict)
+    if args.server:
+        return _submit(args.server, [jdict])
+    create_empty_ms(**jdict)
+
+
+def _submit(path, jobs):
+    """Run jobs on the simms server at path, printing their events"""
+    from simms import serve
+
+    finished = None
+    for event in serve.submit(path, jobs):
+        print(serve.describe(event), flush=True)
+        if event["event"] == "finished":
+            finished = event
+    return 0 if finished and not finished["failed"] else 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+What creating an MS takes, computed from the arguments of makems without
+creating it: the number of scans, rows, baselines, spectral windows and
+channels, the bytes of each column of the main table, the size on disk and,
+from a benchmark history (see benchmarks/suite.py), the wall time.
+
+    report = estimate.estimate("native", **makems_kwargs)
+    print("\\n".join(estimate.summary(report)))
+
+The rows are exact (the schedule is that of the backends); the bytes are
+those of the tiles the storage managers write, which is within a percent
+or so of the size of the MS.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from simms import bda, casasm, msschema, schedule
+
+# Bytes per row of the other columns of the main table (UVW, antennas, times, ids)
+META_BYTES = {"casa": 45, "native": 33}
+# Bytes of the subtables, other than the POINTING table of the casa backend
+SUBTABLE_BYTES = 300 * 1024
+# Bytes of the POINTING table of the casa backend, per antenna and integration
+POINTING_BYTES = 170
+# Rows per tile of the CASA simulator's visibility columns (all channels in a tile)
+CASA_TILE_ROWS = 100
+# Bytes of a column stored as a constant (its incremental storage manager bucket)
+CONSTANT_BYTES = 64 * 1024
+
+# Fraction of the free space an MS may take
+SPACE_MARGIN = 0.95
+
+
+def _tiled_bytes(nrows, cell, tiles, itemsize):
+    # rows and channels are padded to whole tiles (no larger than the cells); itemsize is in bits
+    chan_tile = min(tiles[1], cell[1]) if len(cell) > 1 else 1
+    nchan = int(np.ceil(cell[1] / chan_tile) * chan_tile) if len(cell) > 1 else 1
+    nrows = int(np.ceil(nrows / tiles[-1]) * tiles[-1]) if nrows else 0
+    return nrows * cell[0] * nchan * itemsize // 8
+
+
+def column_bytes(rows, shapes, backend="casa", layout=None, tile_shape=None, constant=(), omit=()):
+    """Bytes of each visibility column of the main table. rows is the number
+    of rows of each distinct shape (ncorr, nchan) in shapes"""
+    ncorr = max(shape[0] for shape in shapes)
+    max_nchan = max(shape[1] for shape in shapes)
+    default = backend == "casa" and not (layout or tile_shape)
+    columns = {}
+    for name, itemsize in [
+        ("DATA", 64),
+        ("MODEL_DATA", 64),
+        ("CORRECTED_DATA", 64),
+        ("FLAG", 1),
+        ("SIGMA", 32),
+        ("WEIGHT", 32),
+    ]:
+        if name in omit:
+            continue
+        if name in constant:
+            columns[name] = CONSTANT_BYTES
+            continue
+        # a fixed shape column has a single hypercube, a variable shape one a hypercube per shape
+        hypercubes = [(sum(rows), shapes[0])] if len(shapes) == 1 else list(zip(rows, shapes))
+        nbytes = 0
+        for nrows, shape in hypercubes:
+            if default:
+                tiles = [shape[0], shape[1], CASA_TILE_ROWS]
+            else:
+                tiles = msschema.tile_shape(ncorr, max_nchan, layout, tile_shape)
+            cell = shape if name not in ["SIGMA", "WEIGHT"] else shape[:1]
+            nbytes += _tiled_bytes(nrows, cell, tiles if len(cell) > 1 else [tiles[0], tiles[-1]], itemsize)
+        columns[name] = nbytes
+    return columns
+
+
+def wall_time(visibilities, backend, history):
+    """Wall time (s) of creating an MS of visibilities (rows x channels),
+    from the last run of the cases of backend in a benchmark history file.
+    Returns None if there is none."""
+    if not history or not os.path.exists(history):
+        return None
+    with open(history) as stdr:
+        runs = json.load(stdr)
+    for run in reversed(runs):
+        cases = [case for case in run["cases"] if case.get("backend") == backend and "error" not in case]
+        if cases:
+            break
+    else:
+        return None
+
+    x = np.array([case["rows"] * case["nchan"] for case in cases], dtype=float)
+    y = np.array([case["seconds"] for case in cases])
+    if len(set(x)) > 1:
+        # a fixed cost (starting up, the subtables) and a cost per visibility
+        slope, intercept = np.polyfit(x, y, 1)
+        if slope > 0:
+            return float(max(intercept, 0) + slope * visibilities)
+    return float(y.sum() / x.sum() * visibilities)
+
+
+def estimate(
+    backend="casa",
+    tel="MeerKAT",
+    pos=None,
+    pos_type="casa",
+    coords="itrf",
+    lon_lat=None,
+    noup=False,
+    antennas=None,
+    baselines=None,
+    min_baseline=None,
+    max_baseline=None,
+    bda_tolerance=None,
+    direction=[],
+    synthesis=4,
+    scan_length=0,
+    dtime=10,
+    freq0=["700MHz"],
+    dfreq=["50MHz"],
+    nchan=[1],
+    nbands=1,
+    stokes="XX XY YX YY",
+    auto_corr=False,
+    constant_columns=None,
+    omit_columns=None,
+    layout=None,
+    tile_shape=None,
+    drop_flagged=None,
+    output_format="ms",
+    history=None,
+    **kwargs
+):
+    """Estimate of an MS created with the makems arguments (and backend).
+    Returns a dict of the numbers of antennas, baselines, spectral windows,
+    channels (of each spectral window), correlations, fields, scans and rows,
+    the bytes of each visibility column (columns) and of the MS (bytes),
+    peak_bytes (the space needed while creating it) and seconds (the
+    estimated wall time, from a benchmark history, or None). If flagged rows
+    are dropped, the rows (and bytes) are upper limits."""
+    if not pos:
+        raise ValueError("Estimates need the antenna positions (pos)")
+    if isinstance(direction, str):
+        direction = [direction]
+    freq0 = list(freq0) if isinstance(freq0, (list, tuple)) else [freq0]
+    nchan = [int(n) for n in (nchan if isinstance(nchan, (list, tuple)) else [nchan])]
+    nspw = nbands if nbands and nbands > 1 and len(freq0) == 1 else len(freq0)
+    nchan = (nchan + [nchan[-1]] * nspw)[:nspw]
+    ncorr = len(stokes.split())
+    dtime = float(str(dtime).rstrip("s"))
+
+    factor = None
+    if antennas or baselines or min_baseline or max_baseline or bda_tolerance:
+        obs_pos = casasm.get_observatory(tel, lon_lat)
+        xyz, dish_diam, station, _ = casasm.get_itrf(pos, pos_type, coords, noup, obs_pos, antennas)
+        nant = len(station)
+        ant1, ant2 = casasm.get_baselines(xyz, station, auto_corr, obs_pos, baselines, min_baseline, max_baseline)
+        nbl = len(ant1)
+        if bda_tolerance:
+            # the first and last channel of each spectral window
+            edges = []
+            dfreq = list(dfreq) if isinstance(dfreq, (list, tuple)) else [dfreq]
+            for f, df, nc in zip(*casasm.get_spws(freq0, dfreq, nchan, nbands)):
+                f, df = [casasm.me.frequency("rest", q)["m0"]["value"] for q in (f, df)]
+                edges += [f, f + df * (nc - 1)]
+            factor = bda.factors(xyz, dish_diam, ant1, ant2, dtime, edges, bda_tolerance)
+    else:
+        nant = len(casasm.read_antennas(pos, pos_type, noup)[2])
+        nbl = nant * (nant + 1) // 2 if auto_corr else nant * (nant - 1) // 2
+
+    scan_length = casasm.get_scan_lengths(scan_length, synthesis, len(direction))
+    nint = [0] * nspw
+    rows = [0] * nspw
+    nscans = 0
+    for spw, _, start, stop in schedule.get_schedule(direction, scan_length, nspw):
+        first, last = casasm.get_integrations(start, stop, dtime)
+        nint[spw] += last - first
+        rows[spw] += (last - first) * nbl if factor is None else bda.count_rows(last - first, factor)
+        nscans += last > first
+
+    shapes = sorted(set(nchan))
+    rows_per_shape = [sum(r for r, n in zip(rows, nchan) if n == nc) for nc in shapes]
+    constant, omit = msschema.get_column_storage(constant_columns, omit_columns)
+    shapes = [(ncorr, nc) for nc in shapes]
+    columns = column_bytes(rows_per_shape, shapes, backend, layout, tile_shape, constant, omit)
+    other = sum(rows) * META_BYTES.get(backend, META_BYTES["casa"]) + SUBTABLE_BYTES
+    if output_format == "zarr":
+        # only the UVW and the chunks of flags with flagged rows are written (see simms.zarrms)
+        columns = dict(UVW=sum(rows) * 24)
+        other = SUBTABLE_BYTES
+    if backend == "casa":
+        other += nant * sum(nint) * POINTING_BYTES
+    nbytes = sum(columns.values()) + other
+    peak = nbytes
+    if backend == "casa" and (constant or omit or layout or tile_shape):
+        # the simulator writes all columns tiled before they are converted, and
+        # the columns whose values are kept are copied
+        kept = sum(columns.get(name, 0) for name in ["FLAG", "SIGMA", "WEIGHT"])
+        peak = sum(column_bytes(rows_per_shape, shapes, backend).values()) + other + kept
+
+    return dict(
+        backend=backend,
+        antennas=nant,
+        baselines=nbl,
+        spws=nspw,
+        channels=nchan,
+        correlations=ncorr,
+        fields=len(direction),
+        scans=nscans,
+        integrations=sum(nint),
+        rows=sum(rows),
+        drop_flagged=drop_flagged,
+        columns=columns,
+        bytes=nbytes,
+        peak_bytes=peak,
+        seconds=wall_time(sum(r * n for r, n in zip(rows, nchan)), backend, history),
+    )
+
+
+def free_space(path):
+    """Free bytes on the filesystem path is (or would be) on"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def check_space(msname, nbytes):
+    """A description of the problem if the filesystem of msname has no room
+    for nbytes, None if it has"""
+    free = free_space(os.path.dirname(os.path.abspath(msname)))
+    if nbytes > free * SPACE_MARGIN:
+        return "{} needs about {} but only {} is free".format(msname, human(nbytes), human(free))
+    return None
+
+
+def human(nbytes):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if abs(nbytes) < 1024 or unit == "TB":
+            return "{:.1f} {}".format(nbytes, unit)
+        nbytes /= 1024.0
+
+
+def summary(report):
+    """Lines describing an estimate"""
+    lines = [
+        "\t {} antennas, {} baselines, {} fields, {} scans, {} integrations".format(
+            report["antennas"], report["baselines"], report["fields"], report["scans"], report["integrations"]
+        ),
+        "\t {} SPWs with {} channels, {} correlations".format(
+            report["spws"], ",".join(map(str, report["channels"])), report["correlations"]
+        ),
+        "\t {}{} rows".format("at most " if report.get("drop_flagged") else "", report["rows"]),
+    ]
+    for name, nbytes in report["columns"].items():
+        lines.append("\t {:<15} {:>10}".format(name, human(nbytes)))
+    lines.append("\t {:<15} {:>10} (peak {})".format("total", human(report["bytes"]), human(report["peak_bytes"])))
+    if report["seconds"] is None:
+        lines.append("\t wall time unknown (no benchmark history, see benchmarks/suite.py)")
+    else:
+        lines.append("\t wall time about {:.0f} s".format(report["seconds"]))
+    return lines
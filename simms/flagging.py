@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Elevation and shadowing flags, computed with NumPy for all antennas and
+integrations at once from the ITRF antenna positions and dish diameters.
+Like the CASA simulator (sm.setlimits), data are flagged if either antenna
+points below the elevation limit, or if either antenna is shadowed by
+another one by more than the shadow limit: the fraction of its dish area
+blocked by the other dish, projected onto the plane perpendicular to the
+source direction. Of a pair of overlapping dishes, the one flagged is the
+one the simulator flags, with the larger projection on the source direction.
+
+The native backend flags rows as it writes them (and can drop flagged
+rows); the casa backend flags the MS written by the simulator (see flag_ms).
+"""
+import numpy as np
+
+from simms import astrometry, coords, storage, tools
+
+tb = tools.LazyTool("tb")
+
+# Limits applied when none are given (those of the CASA simulator)
+DEFAULT_ELEVATION_LIMIT = 8.0  # deg
+DEFAULT_SHADOW_LIMIT = 1e-6
+
+# Ways of dropping flagged rows
+DROP = ["rows", "integrations"]
+
+# Largest number of (time, antenna, antenna) elements of the shadowing computed in one go
+BLOCK_SIZE = 2**22
+
+
+def get_limits(elevation_limit=None, shadow_limit=None):
+    """Elevation (deg) and shadow limits, with 0/None meaning the defaults"""
+    return (
+        DEFAULT_ELEVATION_LIMIT if elevation_limit in (None, "None", 0) else float(elevation_limit),
+        DEFAULT_SHADOW_LIMIT if shadow_limit in (None, "None", 0) else float(shadow_limit),
+    )
+
+
+def source_direction(times, ra, dec, epoch=None):
+    """Unit vectors (ntime,3) of a J2000 direction in the ITRF frame"""
+    return astrometry.celestial_to_terrestrial(times, epoch) @ astrometry.direction_cosines(ra, dec)
+
+
+def blocked_fraction(distance, radius, blocker_radius):
+    """Fraction of the area of dishes of radius blocked by dishes of
+    blocker_radius at (projected) distance"""
+    d, r1, r2 = np.broadcast_arrays(distance, radius, blocker_radius)
+    area = np.zeros(d.shape)
+    inside = d <= np.abs(r1 - r2)
+    area[inside] = np.pi * np.minimum(r1, r2)[inside] ** 2
+    partial = ~inside & (d < r1 + r2)
+    d, r1, r2 = d[partial], r1[partial], r2[partial]
+    area[partial] = (
+        r1**2 * np.arccos(np.clip((d**2 + r1**2 - r2**2) / (2 * d * r1), -1, 1))
+        + r2**2 * np.arccos(np.clip((d**2 + r2**2 - r1**2) / (2 * d * r2), -1, 1))
+        - 0.5 * np.sqrt(np.maximum((-d + r1 + r2) * (d + r1 - r2) * (d - r1 + r2) * (d + r1 + r2), 0))
+    )
+    return area / (np.pi * radius**2)
+
+
+def shadowed(xyz, dish_diam, direction, shadow_limit=DEFAULT_SHADOW_LIMIT):
+    """Antennas (ntime,nant) shadowed by more than shadow_limit, for the
+    source directions (ntime,3, ITRF) of each time"""
+    nant = len(xyz)
+    radius = np.asarray(dish_diam, dtype=float) / 2
+    baseline = xyz[np.newaxis, :, :] - xyz[:, np.newaxis, :]
+    length2 = np.sum(baseline**2, axis=-1)
+    flags = np.zeros((len(direction), nant), dtype=bool)
+    step = max(1, BLOCK_SIZE // (nant * nant))
+    for t0 in range(0, len(direction), step):
+        # w[t, i, j]: the w of baseline (i, j), positive if antenna i is the one flagged
+        proj = direction[t0 : t0 + step] @ xyz.T
+        w = proj[:, :, np.newaxis] - proj[:, np.newaxis, :]
+        distance = np.sqrt(np.maximum(length2 - w**2, 0))
+        fraction = blocked_fraction(distance, radius[:, np.newaxis], radius[np.newaxis, :])
+        flags[t0 : t0 + step] = ((w > 0) & (fraction > shadow_limit)).any(axis=-1)
+    return flags
+
+
+def antenna_flags(xyz, dish_diam, direction, elevation_limit=None, shadow_limit=None, up=None):
+    """Antennas (ntime,nant) below the elevation limit (deg) or shadowed, for
+    the source directions (ntime,3, ITRF) of each time. up are the local
+    verticals of the antennas (see coords.local_vertical)"""
+    elevation_limit, shadow_limit = get_limits(elevation_limit, shadow_limit)
+    up = coords.local_vertical(xyz) if up is None else up
+    flags = np.arcsin(np.clip(direction @ up.T, -1, 1)) < np.deg2rad(elevation_limit)
+    if shadow_limit < 1:
+        flags |= shadowed(xyz, dish_diam, direction, shadow_limit)
+    return flags
+
+
+def flag_ms(
+    msname, xyz, dish_diam, directions, elevation_limit=None, shadow_limit=None, chunk_rows=None, chunk_mb=None
+):
+    """Flag the rows of an MS (FLAG_ROW and FLAG) below the elevation limit
+    or shadowed. directions are the (ra, dec) of each field. Returns the
+    number of rows flagged."""
+    shapes = storage.get_shapes(msname)
+    up = coords.local_vertical(xyz)
+    directions = np.asarray(directions, dtype=float)
+    nflagged = 0
+    tb.open(msname, nomodify=False)
+    for row, nrow, shape in storage.chunks(shapes, chunk_rows, chunk_mb):
+        times = tb.getcol("TIME", row, nrow)
+        fields = tb.getcol("FIELD_ID", row, nrow)
+        ant1 = tb.getcol("ANTENNA1", row, nrow)
+        ant2 = tb.getcol("ANTENNA2", row, nrow)
+        # the antennas are flagged once per integration (and field)
+        keys, index = np.unique(np.stack([times, fields]), axis=1, return_inverse=True)
+        index = index.reshape(-1)
+        direction = np.zeros((keys.shape[1], 3))
+        for field in np.unique(keys[1]):
+            selected = keys[1] == field
+            direction[selected] = source_direction(keys[0][selected], *directions[int(field)])
+        flags = antenna_flags(xyz, dish_diam, direction, elevation_limit, shadow_limit, up)
+        flag_row = flags[index, ant1] | flags[index, ant2]
+        if flag_row.any():
+            tb.putcol("FLAG_ROW", flag_row, row, nrow)
+            tb.putcol("FLAG", np.broadcast_to(flag_row, shape + (nrow,)).copy(), row, nrow)
+            nflagged += int(flag_row.sum())
+    tb.close()
+    return nflagged
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Antenna layouts: the positions, dish diameters, station names and mounts of
+the ASCII files of simms/observatories (or of users), and subarrays of them.
+
+Parsed ASCII layouts are cached as .npz files in the layouts directory of
+the simms cache (see simms.cache), keyed by a hash of the contents of the
+file, so a layout of thousands of stations is only parsed the first time it
+is used.
+
+A subarray (--antennas) is a comma separated list of any of
+
+    M000,M01*     station names, which may have wildcards (case insensitive)
+    5             the index of an antenna in the layout
+    0:16          a range of indices, as in Python (here the first 16)
+    <5km          the antennas within a radius (m, or with units m/km) of the
+                  array centre
+
+and has the antennas of any of them, in the order of the layout.
+
+Baselines (--baselines) are selected by a comma separated list of any of
+
+    M000&M01*     the baselines between the antennas on either side of the
+                  &, each of which is any one of the above
+    M000          all the baselines of the antennas, any one of the above
+
+and by their lengths (--min-baseline, --max-baseline), computed from the
+ITRF positions of the antennas. Only the selected baselines are written.
+"""
+import fnmatch
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from simms import cache
+
+# Version of the cached layouts, part of their keys
+FORMAT = 1
+
+_LENGTH = re.compile(r"^([0-9.eE+-]+)\s*(m|km)?$")
+_SLICE = re.compile(r"^(-?\d*):(-?\d*)$")
+
+
+def get_dir():
+    """Directory of the cached layouts"""
+    return os.path.join(cache.get_dir(), "layouts")
+
+
+def parse_ascii(path, noup=False):
+    """ITRF (or ENU/WGS84) positions (nant,3), dish diameters, station names
+    and mounts of an ASCII layout, with one antenna a line: x y [z] dish
+    station mount. If noup, there is no z (it is 0)."""
+    ncols = 5 if noup else 6
+    rows = []
+    with open(path) as stdr:
+        for number, line in enumerate(stdr, 1):
+            items = line.split("#")[0].split()
+            if not items:
+                continue
+            if len(items) < ncols:
+                raise ValueError("Line {} of {} has {} columns, not {}".format(number, path, len(items), ncols))
+            rows.append(items[:ncols])
+    rows = np.array(rows, dtype=str).reshape(-1, ncols)
+    xyz = np.zeros((len(rows), 3))
+    xyz[:, : ncols - 3] = rows[:, : ncols - 3].astype(float)
+    return xyz, rows[:, -3].astype(float), rows[:, -2].tolist(), rows[:, -1].tolist()
+
+
+def read_ascii(path, noup=False):
+    """parse_ascii, served from the cache of parsed layouts if the file was
+    parsed before"""
+    with open(path, "rb") as stdr:
+        digest = hashlib.sha256(stdr.read())
+    digest.update("{} {}".format(FORMAT, bool(noup)).encode())
+    cached = os.path.join(get_dir(), digest.hexdigest() + ".npz")
+    if os.path.exists(cached):
+        with np.load(cached) as layout:
+            return layout["xyz"], layout["dish_diam"], layout["station"].tolist(), layout["mount"].tolist()
+
+    xyz, dish_diam, station, mount = parse_ascii(path, noup)
+    try:
+        os.makedirs(get_dir(), exist_ok=True)
+        # written under a temporary name, so that concurrent runs never read half a layout
+        fd, tmp = tempfile.mkstemp(suffix=".npz", dir=get_dir())
+        with os.fdopen(fd, "wb") as stdw:
+            np.savez(stdw, xyz=xyz, dish_diam=dish_diam, station=np.array(station), mount=np.array(mount))
+        os.replace(tmp, cached)
+    except OSError:
+        # e.g. a read-only cache
+        pass
+    return xyz, dish_diam, station, mount
+
+
+def length(value):
+    """A length in metres, given in metres or as a string with units m or km"""
+    match = _LENGTH.match(str(value).strip())
+    if not match:
+        raise ValueError("[%s] is not a length (m, or with units m/km)" % value)
+    return float(match.group(1)) * (1000.0 if match.group(2) == "km" else 1.0)
+
+
+def _match(item, station, xyz, centre):
+    """Mask of the antennas selected by one item of a subarray"""
+    nant = len(station)
+    selected = np.zeros(nant, dtype=bool)
+    indices = _SLICE.match(item)
+    if item.startswith("<"):
+        centre = np.median(xyz, axis=0) if centre is None else np.asarray(centre, dtype=float)
+        selected |= np.linalg.norm(xyz - centre, axis=-1) <= length(item[1:])
+    elif indices:
+        start, stop = [int(value) if value else None for value in indices.groups()]
+        selected[start:stop] = True
+    elif item.lstrip("-").isdigit():
+        if not -nant <= int(item) < nant:
+            raise ValueError("There is no antenna %s, the layout has %d" % (item, nant))
+        selected[int(item)] = True
+    else:
+        matched = [i for i, name in enumerate(station) if fnmatch.fnmatchcase(name.lower(), item.lower())]
+        if not matched:
+            raise ValueError("No station of the layout matches [%s]" % item)
+        selected[matched] = True
+    return selected
+
+
+def select(station, xyz, antennas, centre=None):
+    """Indices of the antennas of a subarray (see the module docstring) of
+    the stations at (ITRF) xyz. The radius is from centre (ITRF), which
+    defaults to the median position of the antennas"""
+    if isinstance(antennas, str):
+        antennas = antennas.split(",")
+    selected = np.zeros(len(station), dtype=bool)
+    for item in antennas:
+        selected |= _match(item.strip(), station, xyz, centre)
+    if selected.sum() < 2:
+        raise ValueError("[%s] selects %d antennas, at least 2 are needed" % (",".join(antennas), selected.sum()))
+    return np.flatnonzero(selected)
+
+
+def select_baselines(station, xyz, ant1, ant2, baselines=None, min_length=None, max_length=None, centre=None):
+    """Indices of the baselines (ant1, ant2) selected by a list of baselines
+    (see the module docstring) and lengths (m, or with units m/km) of the
+    stations at (ITRF) xyz. Auto-correlations are always selected."""
+    if isinstance(baselines, str):
+        baselines = baselines.split(",")
+    if baselines:
+        selected = np.zeros(len(ant1), dtype=bool)
+        for item in baselines:
+            sides = [_match(side.strip(), station, xyz, centre) for side in item.split("&", 1)]
+            if len(sides) == 1:
+                selected |= sides[0][ant1] | sides[0][ant2]
+            else:
+                selected |= (sides[0][ant1] & sides[1][ant2]) | (sides[1][ant1] & sides[0][ant2])
+    else:
+        selected = np.ones(len(ant1), dtype=bool)
+    lengths = np.linalg.norm(xyz[ant1] - xyz[ant2], axis=-1)
+    if min_length:
+        selected &= lengths >= length(min_length)
+    if max_length:
+        selected &= lengths <= length(max_length)
+    selected[ant1 == ant2] = True
+    if not (selected & (ant1 != ant2)).any():
+        raise ValueError("The baseline selection selects no baselines")
+    return np.flatnonzero(selected)
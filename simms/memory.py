@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory use of the running process, for reporting the peak resident set size
+(RSS) of each chunk of rows written. On Linux the peak is reset between
+chunks (through /proc/self/clear_refs), elsewhere it is the peak since the
+process started. The peak of the whole run is kept across the resets
+(run_peak_rss).
+"""
+import resource
+import sys
+
+# Highest peak RSS (MB) before the last reset_peak
+_run_peak = 0.0
+
+
+def _status(field):
+    # a field of /proc/self/status, in MB
+    try:
+        with open("/proc/self/status") as stdr:
+            for line in stdr:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss():
+    """Peak RSS (MB) since the last reset_peak (or since the process started)"""
+    peak = _status("VmHWM")
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kB on Linux, bytes on macOS
+        peak = peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+    return peak
+
+
+def run_peak_rss():
+    """Peak RSS (MB) since the process started, whatever the resets"""
+    return max(_run_peak, peak_rss())
+
+
+def rss():
+    """Current RSS (MB), or the peak where that is not available"""
+    current = _status("VmRSS")
+    return peak_rss() if current is None else current
+
+
+def reset_peak():
+    """Reset the peak RSS, where the OS supports it (Linux >= 4.0)"""
+    global _run_peak
+    _run_peak = run_peak_rss()
+    try:
+        with open("/proc/self/clear_refs", "w") as stdw:
+            stdw.write("5")
+    except OSError:
+        pass
+
+
+def report(label):
+    """Print the current and peak RSS, and reset the peak"""
+    print("\t {}: RSS {:.0f} MB, peak {:.0f} MB".format(label, rss(), peak_rss()))
+    reset_peak()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The pointings of a mosaic, as the directions (EPOCH,ra,dec) of makems.
+They are read from a pointing file, with one pointing a line
+
+    # ra dec, or epoch ra dec (J2000 by default), separated by spaces or commas
+    0h0m0s -30d0m0s
+    J2000 0h4m0s -30d0m0s
+    1.5 -30.5
+
+where plain numbers are degrees, or laid out on a hexagonal grid around a
+centre. The observation of the pointings is planned once (see
+simms.schedule), and both backends observe the plan in bulk.
+"""
+import numpy as np
+
+from simms import tools
+
+me = tools.LazyTool("me")
+qa = tools.LazyTool("qa")
+
+EPOCHS = ["J2000", "B1950", "ICRS", "GALACTIC", "APP", "AZEL"]
+
+
+def _angle(value):
+    try:
+        return "{}deg".format(float(value))
+    except ValueError:
+        return value
+
+
+def read_pointings(path):
+    """The directions (EPOCH,ra,dec) of the pointings in a pointing file"""
+    pointings = []
+    with open(path) as stdr:
+        for number, line in enumerate(stdr, 1):
+            items = line.split("#")[0].replace(",", " ").split()
+            if not items:
+                continue
+            if len(items) == 2:
+                items = ["J2000"] + items
+            if len(items) != 3 or items[0].upper() not in EPOCHS:
+                raise ValueError("Line {} of {} is not a pointing ([epoch] ra dec): {}".format(number, path, line))
+            pointings.append(",".join([items[0].upper(), _angle(items[1]), _angle(items[2])]))
+    if not pointings:
+        raise ValueError("No pointings in %s" % path)
+    return pointings
+
+
+def hex_offsets(rings):
+    """Offsets (npointing,2) of a hexagonal grid of unit spacing with rings
+    rings around its centre: the centre, then ring by ring, 1 + 3 rings
+    (rings + 1) pointings in all"""
+    q, r = np.meshgrid(np.arange(-rings, rings + 1), np.arange(-rings, rings + 1), indexing="ij")
+    q, r = q.ravel(), r.ravel()
+    ring = np.maximum(np.maximum(np.abs(q), np.abs(r)), np.abs(q + r))
+    x, y = q + r / 2.0, r * np.sqrt(3) / 2
+    order = np.lexsort((np.mod(np.arctan2(y, x), 2 * np.pi), ring))
+    order = order[ring[order] <= rings]
+    return np.stack([x[order], y[order]], axis=-1)
+
+
+def hex_grid(centre, spacing, rings):
+    """The directions (J2000) of a hexagonal grid of pointings spacing (an
+    angle, e.g. "30arcmin") apart, with rings rings around the centre (a
+    direction, EPOCH,ra,dec)"""
+    centre = me.measure(me.direction(*centre.split(",")), "J2000")
+    ra0, dec0 = centre["m0"]["value"], centre["m1"]["value"]
+    step = qa.convert(qa.quantity(spacing), "rad")["value"]
+    # the offsets are in the plane tangent to the sky at the centre (SIN projection)
+    l, m = (hex_offsets(int(rings)) * step).T
+    if np.any(l**2 + m**2 >= 1):
+        raise ValueError("A hexagonal grid of {} rings {} apart does not fit on the sky".format(rings, spacing))
+    n = np.sqrt(1 - l**2 - m**2)
+    dec = np.arcsin(m * np.cos(dec0) + n * np.sin(dec0))
+    ra = ra0 + np.arctan2(l, n * np.cos(dec0) - m * np.sin(dec0))
+    return ["J2000,{!r}rad,{!r}rad".format(float(a), float(d)) for a, d in zip(np.mod(ra, 2 * np.pi), dec)]
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Table descriptions of the MeasurementSet (v2) tables written by simms.
+These mirror what the CASA simulator writes, so that an MS created without
+the simulator can be read by the same tools.
+"""
+import os
+
+import numpy as np
+
+MS_VERSION = 2.0
+
+# Frequency reference codes as stored by casacore in the SPECTRAL_WINDOW table
+_FREQ_REF_TYPES = ["REST", "LSRK", "LSRD", "BARY", "GEO", "TOPO", "GALACTO", "LGROUP", "CMB", "Undefined"]
+_FREQ_REF_CODES = [0, 1, 2, 3, 4, 5, 6, 7, 8, 64]
+
+SSM = ("StandardStMan", "StandardStMan")
+ISM = ("IncrementalStMan", "ismdata")
+# Storage manager of the visibility columns stored as constants (see main_columns)
+CONSTANT_STMAN = "IncrementalStMan"
+
+# Main table columns holding (or shaped like) the visibilities
+VIS_COLUMNS = ["DATA", "MODEL_DATA", "CORRECTED_DATA", "FLAG", "SIGMA", "WEIGHT"]
+# Main table columns an MS does not need to have
+OPTIONAL_COLUMNS = ["DATA", "MODEL_DATA", "CORRECTED_DATA", "FLAG_CATEGORY"]
+
+# Storage layouts of the tiled visibility columns, and their channels per tile (see tile_shape)
+LAYOUTS = {"row": None, "channel": 8, "balanced": 64}
+# Rough size (bytes) of a tile of visibilities
+TILE_SIZE = 2**20
+
+
+def column(vtype, comment, ndim=0, shape=None, units=None, meas=None, ref=None, dm=SSM):
+    """Description of a single column. Array columns have ndim > 0 (-1 for any
+    dimensionality); give shape to make them fixed shape."""
+    keywords = {}
+    if units:
+        keywords["QuantumUnits"] = np.array(units)
+    if meas == "frequency":
+        keywords["MEASINFO"] = {
+            "type": "frequency",
+            "VarRefCol": "MEAS_FREQ_REF",
+            "TabRefTypes": np.array(_FREQ_REF_TYPES),
+            "TabRefCodes": np.array(_FREQ_REF_CODES, dtype=np.uint64),
+        }
+    elif meas:
+        keywords["MEASINFO"] = {"type": meas, "Ref": ref}
+
+    desc = {
+        "valueType": vtype,
+        "comment": comment,
+        "dataManagerType": dm[0],
+        "dataManagerGroup": dm[1],
+        "option": 0,
+        "maxlen": 0,
+        "keywords": keywords,
+    }
+    if ndim:
+        desc["ndim"] = ndim
+    if shape is not None:
+        desc["shape"] = np.array(shape, dtype=np.int32)
+        desc["option"] = 5  # Direct + FixedShape
+    return desc
+
+
+def _time(comment, dm=SSM):
+    return column("double", comment, units=["s"], meas="epoch", ref="UTC", dm=dm)
+
+
+def _interval(comment, dm=SSM):
+    return column("double", comment, units=["s"], dm=dm)
+
+
+def _direction(comment, ndim=2):
+    return column("double", comment, ndim=ndim, units=["rad", "rad"], meas="direction", ref="J2000")
+
+
+def _position(comment, ndim=1, shape=[3]):
+    return column("double", comment, ndim=ndim, shape=shape, units=["m", "m", "m"], meas="position", ref="ITRF")
+
+
+def _flag_row(comment="Row flag", dm=SSM):
+    return column("boolean", comment, dm=dm)
+
+
+def get_column_storage(constant=None, omit=None):
+    """Check and normalise the names of the columns stored as constants and of
+    the columns left out of the main table. Both are lists or comma separated
+    strings; "all" stands for all visibility (or optional) columns."""
+
+    def names(value, choices, what):
+        if value in (None, "None", "", []):
+            return []
+        if isinstance(value, str):
+            value = value.split(",")
+        value = [name.strip().upper() for name in value]
+        if value == ["ALL"]:
+            return list(choices)
+        unknown = set(value) - set(choices)
+        if unknown:
+            raise ValueError(
+                "Cannot %s column(s) [%s]. Choices are (%s)" % (what, ", ".join(sorted(unknown)), ", ".join(choices))
+            )
+        return value
+
+    omit = names(omit, OPTIONAL_COLUMNS, "omit")
+    constant = [name for name in names(constant, VIS_COLUMNS, "store as constants") if name not in omit]
+    return constant, omit
+
+
+def main_columns(tiled=None, shape=None, constant=(), omit=()):
+    """Columns of the main table. tiled maps each tiled column name to the
+    data manager group it is stored in. If shape (ncorr, nchan) is given, the
+    visibility columns are fixed shape and stored with TiledColumnStMan.
+    Columns in constant (which needs shape) are stored with the incremental
+    storage manager instead (one per column, see constant_group), which only
+    stores a value when it changes from one row to the next, and columns in
+    omit are left out."""
+    tiled = tiled or {}
+    if constant and not shape:
+        raise ValueError("Columns can only be stored as constants if all spectral windows have the same shape")
+
+    def tsm(name):
+        if shape and name != "FLAG_CATEGORY":
+            return ("TiledColumnStMan", tiled.get(name, name))
+        return ("TiledShapeStMan", tiled.get(name, name))
+
+    vis_shape = list(shape) if shape else None
+    pol_shape = list(shape[:1]) if shape else None
+
+    columns = {
+        "ANTENNA1": column("int", "ID of first antenna in interferometer"),
+        "ANTENNA2": column("int", "ID of second antenna in interferometer"),
+        "ARRAY_ID": column("int", "ID of array or subarray", dm=ISM),
+        "DATA_DESC_ID": column("int", "The data description table index", dm=ISM),
+        "EXPOSURE": _interval("The effective integration time", dm=ISM),
+        "FEED1": column("int", "The feed index for ANTENNA1", dm=ISM),
+        "FEED2": column("int", "The feed index for ANTENNA2", dm=ISM),
+        "FIELD_ID": column("int", "Unique id for this pointing", dm=ISM),
+        "FLAG_ROW": _flag_row("Row flag - flag all data in this row if True", dm=ISM),
+        "INTERVAL": _interval("The sampling interval", dm=ISM),
+        "OBSERVATION_ID": column("int", "ID for this observation, index in OBSERVATION table", dm=ISM),
+        "PROCESSOR_ID": column("int", "Id for backend processor, index in PROCESSOR table", dm=ISM),
+        "SCAN_NUMBER": column("int", "Sequential scan number from on-line system", dm=ISM),
+        "STATE_ID": column("int", "ID for this observing state", dm=ISM),
+        "TIME": _time("Modified Julian Day", dm=ISM),
+        "TIME_CENTROID": _time("Modified Julian Day", dm=ISM),
+        "UVW": column(
+            "double",
+            "Vector with uvw coordinates (in meters)",
+            ndim=1,
+            shape=[3],
+            units=["m", "m", "m"],
+            meas="uvw",
+            ref="ITRF",
+        ),
+        "DATA": column("complex", "The data column", ndim=2, shape=vis_shape, dm=tsm("DATA")),
+        "MODEL_DATA": column("complex", "The model data column", ndim=2, shape=vis_shape, dm=tsm("MODEL_DATA")),
+        "CORRECTED_DATA": column(
+            "complex", "The corrected data column", ndim=2, shape=vis_shape, dm=tsm("CORRECTED_DATA")
+        ),
+        "FLAG": column(
+            "boolean",
+            "The data flags, array of bools with same shape as data",
+            ndim=2,
+            shape=vis_shape,
+            dm=tsm("FLAG"),
+        ),
+        "FLAG_CATEGORY": column(
+            "boolean", "The flag category, NUM_CAT flags for each datum", ndim=3, dm=tsm("FLAG_CATEGORY")
+        ),
+        "SIGMA": column(
+            "float",
+            "Estimated rms noise for channel with unity bandpass response",
+            ndim=1,
+            shape=pol_shape,
+            dm=tsm("SIGMA"),
+        ),
+        "WEIGHT": column(
+            "float", "Weight for each polarization spectrum", ndim=1, shape=pol_shape, dm=tsm("WEIGHT")
+        ),
+    }
+    columns["FLAG_CATEGORY"]["keywords"]["CATEGORY"] = np.array([], dtype=str)
+    for name in constant:
+        columns[name]["dataManagerType"] = CONSTANT_STMAN
+        columns[name]["dataManagerGroup"] = constant_group(name)
+    for name in omit:
+        del columns[name]
+    return columns
+
+
+SUBTABLES = {
+    "ANTENNA": {
+        "DISH_DIAMETER": column("double", "Physical diameter of dish", units=["m"]),
+        "FLAG_ROW": _flag_row("Flag for this row"),
+        "MOUNT": column("string", "Mount type e.g. alt-az, equatorial, etc."),
+        "NAME": column("string", "Antenna name, e.g. VLA22, CA03"),
+        "OFFSET": _position("Axes offset of mount to FEED REFERENCE point"),
+        "POSITION": _position("Antenna X,Y,Z phase reference position"),
+        "STATION": column("string", "Station (antenna pad) name"),
+        "TYPE": column("string", "Antenna type (e.g. SPACE-BASED)"),
+    },
+    "DATA_DESCRIPTION": {
+        "FLAG_ROW": _flag_row("Flag this row"),
+        "POLARIZATION_ID": column("int", "Pointer to polarization table"),
+        "SPECTRAL_WINDOW_ID": column("int", "Pointer to spectralwindow table"),
+    },
+    "FEED": {
+        "ANTENNA_ID": column("int", "ID of antenna in this array"),
+        "BEAM_ID": column("int", "Id for BEAM model"),
+        "BEAM_OFFSET": _direction("Beam position offset (on sky but in antennareference frame)"),
+        "FEED_ID": column("int", "Feed id"),
+        "INTERVAL": _interval("Interval for which this set of parameters is accurate"),
+        "NUM_RECEPTORS": column("int", "Number of receptors on this feed (probably 1 or 2)"),
+        "POLARIZATION_TYPE": column(
+            "string", "Type of polarization to which a given RECEPTOR responds", ndim=1
+        ),
+        "POL_RESPONSE": column("complex", "D-matrix i.e. leakage between two receptors", ndim=2),
+        "POSITION": _position("Position of feed relative to feed reference position"),
+        "RECEPTOR_ANGLE": column("double", "The reference angle for polarization", ndim=1, units=["rad"]),
+        "SPECTRAL_WINDOW_ID": column("int", "ID for this spectral window setup"),
+        "TIME": _time("Midpoint of time for which this set of parameters is accurate"),
+    },
+    "FIELD": {
+        "CODE": column("string", "Special characteristics of field, e.g. Bandpass calibrator"),
+        "DELAY_DIR": _direction("Direction of delay center (e.g. RA, DEC)as polynomial in time."),
+        "FLAG_ROW": _flag_row("Row Flag"),
+        "NAME": column("string", "Name of this field"),
+        "NUM_POLY": column("int", "Polynomial order of _DIR columns"),
+        "PHASE_DIR": _direction("Direction of phase center (e.g. RA, DEC)."),
+        "REFERENCE_DIR": _direction("Direction of REFERENCE center (e.g. RA, DEC).as polynomial in time."),
+        "SOURCE_ID": column("int", "Source id"),
+        "TIME": _time("Time origin for direction and rate"),
+    },
+    "FLAG_CMD": {
+        "APPLIED": column("boolean", "True if flag has been applied to main table"),
+        "COMMAND": column("string", "Flagging command"),
+        "INTERVAL": _interval("Time interval for which this flag is valid"),
+        "LEVEL": column("int", "Flag level - revision level "),
+        "REASON": column("string", "Flag reason"),
+        "SEVERITY": column("int", "Severity code (0-10) "),
+        "TIME": _time("Midpoint of interval for which this flag is valid"),
+        "TYPE": column("string", "Type of flag (FLAG or UNFLAG)"),
+    },
+    "HISTORY": {
+        "APPLICATION": column("string", "Application name"),
+        "APP_PARAMS": column("string", "Application parameters", ndim=1),
+        "CLI_COMMAND": column("string", "CLI command sequence", ndim=1),
+        "MESSAGE": column("string", "Log message"),
+        "OBJECT_ID": column("int", "Originating ObjectID"),
+        "OBSERVATION_ID": column("int", "Observation id (index in OBSERVATION table)"),
+        "ORIGIN": column("string", "(Source code) origin from which message originated"),
+        "PRIORITY": column("string", "Message priority"),
+        "TIME": _time("Timestamp of message"),
+    },
+    "OBSERVATION": {
+        "FLAG_ROW": _flag_row(),
+        "LOG": column("string", "Observing log", ndim=1),
+        "OBSERVER": column("string", "Name of observer(s)"),
+        "PROJECT": column("string", "Project identification string"),
+        "RELEASE_DATE": _time("Release date when data becomes public"),
+        "SCHEDULE": column("string", "Observing schedule", ndim=1),
+        "SCHEDULE_TYPE": column("string", "Observing schedule type"),
+        "TELESCOPE_NAME": column("string", "Telescope Name (e.g. WSRT, VLBA)"),
+        "TIME_RANGE": column(
+            "double",
+            "Start and end of observation",
+            ndim=1,
+            shape=[2],
+            units=["s"],
+            meas="epoch",
+            ref="UTC",
+        ),
+    },
+    "POINTING": {
+        "ANTENNA_ID": column("int", "Antenna Id"),
+        "DIRECTION": _direction("Antenna pointing direction as polynomial in time"),
+        "INTERVAL": _interval("Time interval"),
+        "NAME": column("string", "Pointing position name"),
+        "NUM_POLY": column("int", "Series order"),
+        "TARGET": _direction("target direction as polynomial in time", ndim=-1),
+        "TIME": _time("Time interval midpoint"),
+        "TIME_ORIGIN": _time("Time origin for direction"),
+        "TRACKING": column("boolean", "Tracking flag - True if on position"),
+    },
+    "POLARIZATION": {
+        "CORR_PRODUCT": column("int", "Indices describing receptors of feed going into correlation", ndim=2),
+        "CORR_TYPE": column(
+            "int", "The polarization type for each correlation product, as a Stokes enum.", ndim=1
+        ),
+        "FLAG_ROW": _flag_row(),
+        "NUM_CORR": column("int", "Number of correlation products"),
+    },
+    "PROCESSOR": {
+        "FLAG_ROW": _flag_row(),
+        "MODE_ID": column("int", "Processor mode id"),
+        "SUB_TYPE": column("string", "Processor sub type"),
+        "TYPE": column("string", "Processor type"),
+        "TYPE_ID": column("int", "Processor type id"),
+    },
+    "SOURCE": {
+        "CALIBRATION_GROUP": column("int", "Number of grouping for calibration purpose."),
+        "CODE": column("string", "Special characteristics of source, e.g. Bandpass calibrator"),
+        "DIRECTION": _direction("Direction (e.g. RA, DEC).", ndim=-1),
+        "INTERVAL": _interval("Interval of time for which this set of parameters is accurate"),
+        "NAME": column("string", "Name of source as given during observations"),
+        "NUM_LINES": column("int", "Number of spectral lines"),
+        "POSITION": _position("Position (e.g. for solar system objects", ndim=-1, shape=None),
+        "PROPER_MOTION": column("double", "Proper motion", ndim=-1, units=["rad/s"]),
+        "PULSAR_ID": column("int", "Pulsar Id, pointer to pulsar table"),
+        "SOURCE_ID": column("int", "Source id"),
+        "SPECTRAL_WINDOW_ID": column("int", "ID for this spectral window setup"),
+        "TIME": _time("Midpoint of time for which this set of parameters is accurate."),
+    },
+    "SPECTRAL_WINDOW": {
+        "CHAN_FREQ": column(
+            "double",
+            "Center frequencies for each channel in the data matrix",
+            ndim=1,
+            units=["Hz"],
+            meas="frequency",
+        ),
+        "CHAN_WIDTH": column("double", "Channel width for each channel", ndim=1, units=["Hz"]),
+        "EFFECTIVE_BW": column("double", "Effective noise bandwidth of each channel", ndim=1, units=["Hz"]),
+        "FLAG_ROW": _flag_row(),
+        "FREQ_GROUP": column("int", "Frequency group"),
+        "FREQ_GROUP_NAME": column("string", "Frequency group name"),
+        "IF_CONV_CHAIN": column("int", "The IF conversion chain number"),
+        "MEAS_FREQ_REF": column("int", "Frequency Measure reference"),
+        "NAME": column("string", "Spectral window name"),
+        "NET_SIDEBAND": column("int", "Net sideband"),
+        "NUM_CHAN": column("int", "Number of spectral channels"),
+        "REF_FREQUENCY": column("double", "The reference frequency", units=["Hz"], meas="frequency"),
+        "RESOLUTION": column("double", "The effective noise bandwidth for each channel", ndim=1, units=["Hz"]),
+        "TOTAL_BANDWIDTH": column("double", "The total bandwidth for this window", units=["Hz"]),
+    },
+    "STATE": {
+        "CAL": column("double", "Noise calibration temperature", units=["K"]),
+        "FLAG_ROW": _flag_row(),
+        "LOAD": column("double", "Load temperature", units=["K"]),
+        "OBS_MODE": column("string", "Observing mode, e.g., OFF_SPECTRUM"),
+        "REF": column("boolean", "True for a reference observation"),
+        "SIG": column("boolean", "True for a source observation"),
+        "SUB_SCAN": column("int", "Sub scan number, relative to scan number"),
+    },
+}
+
+
+def tiled_dminfo(groups):
+    """Data manager info for tiled storage manager groups. groups maps a group
+    name to (columns, default tile shape[, storage manager]). The storage
+    manager defaults to TiledShapeStMan"""
+    dminfo = {}
+    for i, (name, group) in enumerate(groups.items()):
+        columns, tiles = group[:2]
+        dminfo["*%d" % (i + 1)] = {
+            "TYPE": group[2] if len(group) > 2 else "TiledShapeStMan",
+            "NAME": name,
+            "SEQNR": i,
+            "SPEC": {"DEFAULTTILESHAPE": np.array(tiles, dtype=np.int32)},
+            "COLUMNS": np.array(columns),
+        }
+    return dminfo
+
+
+def tile_shape(ncorr, nchan, layout=None, shape=None):
+    """Tile shape (ncorr, nchan, nrow) of the tiled visibility columns, about
+    TILE_SIZE bytes of visibilities per tile. The layout is chosen by how the
+    MS will be read (see LAYOUTS):
+        row: all channels of a few rows per tile, for reading chunks of rows
+            (e.g. calibration solvers)
+        channel: a few channels of many rows per tile, for reading ranges of
+            channels (e.g. imaging subbands)
+        balanced: up to 64 channels per tile. The default
+    An explicit shape (a list or a comma separated string) overrides the layout."""
+    if shape not in (None, "None", "", []):
+        if isinstance(shape, str):
+            shape = shape.split(",")
+        shape = [int(n) for n in shape]
+        if len(shape) != 3 or min(shape) < 1:
+            raise ValueError("A tile shape is three positive integers (ncorr, nchan, nrow), not %s" % shape)
+        return shape
+
+    layout = layout or "balanced"
+    if layout not in LAYOUTS:
+        raise ValueError("Unknown layout [%s]. Choices are (%s)" % (layout, ", ".join(LAYOUTS)))
+    chan_tile = min(nchan, LAYOUTS[layout] or nchan)
+    return [ncorr, chan_tile, max(1, TILE_SIZE // (ncorr * chan_tile * 8))]
+
+
+def column_tile_shape(name, tiles):
+    """Tile shape of a column of the main table, given the tile shape of the
+    visibilities (see tile_shape)"""
+    if name in ["SIGMA", "WEIGHT"]:
+        return [tiles[0], tiles[-1]]
+    if name == "FLAG_CATEGORY":
+        return list(tiles[:2]) + [1] + list(tiles[2:])
+    return list(tiles)
+
+
+def constant_group(name):
+    """Data manager group of a column stored as a constant. Each has its own,
+    as a column cannot be removed from an incremental storage manager that
+    stores others."""
+    return "Constant_%s" % name
+
+
+def constant_dminfo(name, shape, seqnr=0):
+    """Data manager info of a column stored as a constant (see main_columns).
+    A bucket of the incremental storage manager must hold a few of its values;
+    shape is the (ncorr, nchan) of the visibilities."""
+    cell = int(np.prod(shape if name in ["DATA", "MODEL_DATA", "CORRECTED_DATA", "FLAG"] else shape[:1])) * 8
+    return {
+        "TYPE": CONSTANT_STMAN,
+        "NAME": constant_group(name),
+        "SEQNR": seqnr,
+        "SPEC": {"BUCKETSIZE": max(32768, 4 * cell + 1024)},
+        "COLUMNS": np.array([name]),
+    }
+
+
+def create_table(tb, path, desc, nrow=0, dminfo={}):
+    """Create a table with the given column descriptions. The table is left open in tb."""
+    tb.create(path, desc, dminfo=dminfo, nrow=nrow)
+
+
+def create_ms(tb, msname, main_desc, dminfo={}):
+    """Create an MS with an empty main table and empty subtables.
+    The main table is left open (for writing) in tb."""
+    create_table(tb, msname, main_desc, dminfo=dminfo)
+    tb.putinfo(
+        {
+            "type": "Measurement Set",
+            "subType": "simulator",
+            "readme": "This is a MeasurementSet Table holding simulated astronomical observations\n",
+        }
+    )
+    tb.putkeyword("MS_VERSION", MS_VERSION)
+    tb.close()
+
+    for name, desc in SUBTABLES.items():
+        create_table(tb, "%s/%s" % (msname, name), desc)
+        tb.close()
+
+    tb.open(msname, nomodify=False)
+    for name in SUBTABLES:
+        tb.putkeyword(name, "Table: %s/%s" % (os.path.abspath(msname), name))
@@ -0,0 +1,856 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Create an empty measurement set without the CASA simulator. The observation
+(antennas, spectral windows, fields, times, baselines and UVW) is computed
+with NumPy and the tables are written directly with the casatools table tool.
+
+The CASA simulator (see casasm.py) remains the reference backend. Things
+that differ from it:
+  * The first integration starts at the reference time. The simulator
+    starts TAI-UTC (37 s) later. Both label TIME in UTC.
+  * When times are given as hour angles, they are relative to the transit of
+    the first field closest to the reference time.
+  * The POINTING table is left empty.
+"""
+import os
+import time
+
+import numpy as np
+
+from simms import astrometry, bda, casasm, coords, flagging, memory, msschema, observation, profiling, storage, uvw
+from simms import validation as checks
+from simms.casasm import me, tb
+from simms.schedule import get_reference_time, get_schedule
+
+# Stokes enums as used by the CORR_TYPE column of the POLARIZATION table
+STOKES_TYPES = dict(I=1, Q=2, U=3, V=4, RR=5, RL=6, LR=7, LL=8, XX=9, XY=10, YX=11, YY=12)
+
+# Rows of the columns that vary from row to row and are stored incrementally (e.g. TIME)
+# written in one go. The time to write them grows faster than the number of rows.
+ISM_ROWS = 1024
+
+# Rows of SCAN_NUMBER read in one go when looking for the last scan of an MS
+SCAN_ROWS = 2**24
+
+_TILED = ["DATA", "MODEL_DATA", "CORRECTED_DATA", "FLAG", "FLAG_CATEGORY", "SIGMA", "WEIGHT"]
+
+
+def corr_products(corrs, receptors):
+    """Indices (2,ncorr) of the receptors going into each correlation"""
+    products = []
+    for corr in corrs:
+        if len(corr) == 2:
+            products.append([receptors.index(corr[0]), receptors.index(corr[1])])
+        else:
+            products.append([0, 0])
+    return np.array(products, dtype=np.int32).T.copy()
+
+
+def _fill(subtable, nrow, **columns):
+    """Add nrow rows to (the end of) a subtable. Columns given as lists are written cell by cell."""
+    tb.open(subtable, nomodify=False)
+    start = tb.nrows()
+    tb.addrows(nrow)
+    for name, value in columns.items():
+        if isinstance(value, list):
+            for row, cell in enumerate(value):
+                tb.putcell(name, start + row, cell)
+        else:
+            tb.putcol(name, value, startrow=start, nrow=nrow)
+    tb.close()
+
+
+def _fill_spws(msname, freq0, dfreq, nchan, first=0):
+    """Add spectral windows (and their data descriptions), numbered from first"""
+    nbands = len(freq0)
+    ids = np.arange(first, first + nbands, dtype=np.int32)
+    _fill(
+        "%s/SPECTRAL_WINDOW" % msname,
+        nbands,
+        NAME=np.array(["{0:02d}".format(i) for i in ids]),
+        NUM_CHAN=np.array(nchan, dtype=np.int32),
+        REF_FREQUENCY=np.array(freq0),
+        CHAN_FREQ=[f + df * np.arange(nc) for f, df, nc in zip(freq0, dfreq, nchan)],
+        CHAN_WIDTH=[np.full(nc, df) for df, nc in zip(dfreq, nchan)],
+        EFFECTIVE_BW=[np.full(nc, df) for df, nc in zip(dfreq, nchan)],
+        RESOLUTION=[np.full(nc, df) for df, nc in zip(dfreq, nchan)],
+        TOTAL_BANDWIDTH=np.array(dfreq) * np.array(nchan),
+        MEAS_FREQ_REF=np.full(nbands, 5, dtype=np.int32),  # TOPO
+        NET_SIDEBAND=np.ones(nbands, dtype=np.int32),
+        FREQ_GROUP=np.zeros(nbands, dtype=np.int32),
+        FREQ_GROUP_NAME=np.array(["Group 1"] * nbands),
+        IF_CONV_CHAIN=np.zeros(nbands, dtype=np.int32),
+        FLAG_ROW=np.zeros(nbands, dtype=bool),
+    )
+    _fill(
+        "%s/DATA_DESCRIPTION" % msname,
+        nbands,
+        SPECTRAL_WINDOW_ID=ids,
+        POLARIZATION_ID=np.zeros(nbands, dtype=np.int32),
+        FLAG_ROW=np.zeros(nbands, dtype=bool),
+    )
+
+
+def _fill_fields(msname, directions, origin, first=0):
+    """Add fields (and their sources) at the J2000 (ra, dec) directions, numbered from first"""
+    nfield = len(directions)
+    ids = np.arange(first, first + nfield, dtype=np.int32)
+    field_dir = np.array(directions).T[:, np.newaxis, :].copy()
+    names = np.array(["{0:02d}".format(i) for i in ids])
+    _fill(
+        "%s/FIELD" % msname,
+        nfield,
+        NAME=names,
+        CODE=np.array([""] * nfield),
+        PHASE_DIR=field_dir,
+        DELAY_DIR=field_dir,
+        REFERENCE_DIR=field_dir,
+        SOURCE_ID=ids,
+        NUM_POLY=np.zeros(nfield, dtype=np.int32),
+        TIME=np.full(nfield, origin),
+        FLAG_ROW=np.zeros(nfield, dtype=bool),
+    )
+    _fill(
+        "%s/SOURCE" % msname,
+        nfield,
+        SOURCE_ID=ids,
+        NAME=names,
+        CODE=np.array([""] * nfield),
+        DIRECTION=[np.array(d) for d in directions],
+        PROPER_MOTION=[np.zeros(2)] * nfield,
+        SPECTRAL_WINDOW_ID=np.full(nfield, -1, dtype=np.int32),
+        NUM_LINES=np.zeros(nfield, dtype=np.int32),
+        CALIBRATION_GROUP=np.zeros(nfield, dtype=np.int32),
+        PULSAR_ID=np.zeros(nfield, dtype=np.int32),
+        TIME=np.full(nfield, origin),
+        INTERVAL=np.full(nfield, 1e30),
+    )
+
+
+def scan_frames(scans, origin, directions):
+    """UVW frames of the fields of the scans (see get_schedule), with
+    aberration at the middle of each scan, and the precession-nutation
+    matrices at the middle of each scan, both (nscan,3,3)"""
+    epochs = origin + (scans["start"] + scans["stop"]) / 2
+    frames = np.zeros((len(scans), 3, 3))
+    prec = np.zeros((len(scans), 3, 3))
+    for i, (fid, epoch) in enumerate(zip(scans["field"], epochs)):
+        frames[i] = astrometry.uvw_frame(*astrometry.aberrate(*directions[fid], epoch))
+        prec[i] = astrometry.precession_nutation(epoch)
+    return frames, prec
+
+
+def antenna_geometry(xyz, times, frames, prec):
+    """UVW (ntime,nant,3) of the antennas at times (MJD seconds), and the
+    ITRF direction (ntime,3) of the field, given the frame and
+    precession-nutation (see scan_frames) of the scan of each time"""
+    rot = astrometry.rotation(astrometry.gast(times), 2) @ prec
+    # the w axis of the frame is the direction of the field
+    return np.einsum("tij,tkj,ak->tai", frames, rot, xyz), np.einsum("tij,tj->ti", rot, frames[:, 2])
+
+
+def iter_rows(
+    scans,
+    origin,
+    dtime,
+    xyz,
+    directions,
+    chunk_rows,
+    auto_corr=False,
+    elevation_limit=None,
+    shadow_limit=None,
+    dish_diam=None,
+    spws=None,
+    time_range=None,
+    drop_flagged=None,
+    baselines=None,
+    factor=None,
+    first_scan=0,
+):
+    """Yield the main table rows of the scans (see get_schedule), as
+    (spw, columns) for chunks of integrations of a spectral window, which
+    may span many scans (e.g. of a mosaic). columns has the ANTENNA1,
+    ANTENNA2, UVW (nrow,3), TIME, INTERVAL, SCAN_NUMBER, FIELD_ID and
+    FLAG_ROW of the rows. A chunk has whole integrations and at most
+    chunk_rows[spw] rows, unless an integration has more.
+    Only the spectral windows in spws and the integrations starting in
+    time_range are observed, if given. Rows are flagged below the elevation
+    limit (deg) and, given the dish diameters, when shadowed (see
+    simms.flagging). Flagged rows are dropped if drop_flagged is "rows",
+    and integrations with all rows flagged if it is "integrations". Only the
+    baselines (ant1, ant2) are observed if given, otherwise all of them.
+    Each baseline is averaged over factor integrations, if given (see
+    simms.bda). Scans are numbered from first_scan + 1."""
+    ant1, ant2 = uvw.baselines(len(xyz), auto_corr) if baselines is None else baselines
+    nbl = len(ant1)
+    # the levels of averaging, and the level of each baseline
+    levels, level = np.unique(np.ones(nbl, dtype=np.int32) if factor is None else factor, return_inverse=True)
+    up = coords.local_vertical(xyz)
+    if dish_diam is None:
+        shadow_limit = 1
+
+    # the integrations observed, and what they need of their scans: the direction of the
+    # field (with aberration at the middle of the scan), its UVW frame and precession-nutation
+    selected, integrations, nints = [], [], []
+    for scan, (spw, fid, start, stop) in enumerate(scans):
+        first, last = casasm.get_integrations(start, stop, dtime, time_range)
+        if (spws is None or spw in spws) and last > first:
+            selected.append(scan)
+            integrations.append(np.arange(first, last))
+            nints.append(casasm.get_integrations(start, stop, dtime)[1])
+    if not selected:
+        raise RuntimeError("Nothing to observe in the selected spectral windows and time range")
+    selected = np.array(selected)
+    frames, prec = scan_frames(scans[selected], origin, directions)
+    nints = np.array(nints)
+    index = np.repeat(np.arange(len(selected)), [len(k) for k in integrations])
+    # the index of each integration in its scan
+    steps = np.concatenate(integrations)
+    int_spw = scans["spw"][selected[index]]
+
+    bounds = np.flatnonzero(np.diff(int_spw)) + 1
+    for i0, i1 in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(steps)]])):
+        spw = int(int_spw[i0])
+        nchunk = max(1, chunk_rows[spw] // nbl)
+        for c0 in range(i0, i1, nchunk):
+            chunk = slice(c0, min(c0 + nchunk, i1))
+            nt = chunk.stop - chunk.start
+            j, scan_index = steps[chunk], index[chunk]
+
+            # the averaging intervals of each level that end with each integration (all of
+            # them without averaging), and their middles
+            starts = j[:, np.newaxis] // levels * levels
+            ends = ((j[:, np.newaxis] + 1) % levels == 0) | (j == nints[scan_index] - 1)[:, np.newaxis]
+            it, il = np.nonzero(ends)
+            scan_index = scan_index[it]
+            t = origin + scans["start"][selected][scan_index] + (starts[it, il] + j[it] + 1) / 2.0 * dtime
+            interval = (j[it] + 1 - starts[it, il]) * dtime
+
+            ant_uvw, direction = antenna_geometry(xyz, t, frames[scan_index], prec[scan_index])
+            ant_flags = flagging.antenna_flags(xyz, dish_diam, direction, elevation_limit, shadow_limit, up)
+
+            # the rows of each interval: the baselines averaged at its level
+            rows, bl = np.nonzero(level[np.newaxis, :] == il[:, np.newaxis])
+            a1, a2 = ant1[bl], ant2[bl]
+            flags = ant_flags[rows, a1] | ant_flags[rows, a2]
+            if drop_flagged == "integrations":
+                unflagged = np.bincount(it[rows[~flags]], minlength=nt)
+                keep = unflagged[it[rows]] > 0
+            elif drop_flagged == "rows":
+                keep = ~flags
+            else:
+                keep = slice(None)
+            if not len(flags[keep]):
+                continue
+            rows, a1, a2 = rows[keep], a1[keep], a2[keep]
+            scan = selected[scan_index[rows]]
+            yield spw, dict(
+                ANTENNA1=a1,
+                ANTENNA2=a2,
+                UVW=ant_uvw[rows, a1] - ant_uvw[rows, a2],
+                TIME=t[rows],
+                INTERVAL=interval[rows],
+                SCAN_NUMBER=(first_scan + scan + 1).astype(np.int32),
+                FIELD_ID=scans["field"][scan],
+                FLAG_ROW=flags[keep],
+            )
+
+
+def write_main(
+    msname,
+    scans,
+    origin,
+    dtime,
+    xyz,
+    directions,
+    ncorr,
+    nchan,
+    auto_corr,
+    elevation_limit,
+    fixed_shape=False,
+    spws=None,
+    time_range=None,
+    constant=(),
+    omit=(),
+    chunk_rows=None,
+    chunk_mb=None,
+    report_memory=False,
+    shadow_limit=None,
+    dish_diam=None,
+    drop_flagged=None,
+    baselines=None,
+    factor=None,
+    first_scan=0,
+):
+    """Write the main table rows of the scans (see iter_rows, which takes
+    the same arguments), after the rows already in the MS. Fixed shape
+    visibility columns read back as zeros (and False) without being
+    written, so only the flags and weights are written to them. Columns in
+    constant are stored as constants and columns in omit are not in the MS
+    (see msschema.main_columns). The visibilities are written chunk_rows
+    rows (or chunk_mb MB) at a time (see storage.get_chunk_rows), which
+    bounds the memory used. If report_memory, the memory used is printed
+    after each chunk. The baselines observed are recorded in the MS (see
+    validation.record_baselines). Returns the number of rows written and
+    the (spw, field) of the first scan written."""
+    steps = [storage.get_chunk_rows((ncorr, nc), chunk_rows, chunk_mb) for nc in nchan]
+    tb.open(msname, nomodify=False)
+    start = row = tb.nrows()
+    # the FLAG stored as a constant of the rows already in the MS is not known
+    flagged = start > 0
+    first = None
+    # chunks of integrations of a spectral window: rows of visibilities, and whole integrations, written in one go
+    for spw, columns in iter_rows(
+        scans,
+        origin,
+        dtime,
+        xyz,
+        directions,
+        steps,
+        auto_corr,
+        elevation_limit,
+        shadow_limit,
+        dish_diam,
+        spws,
+        time_range,
+        drop_flagged,
+        baselines,
+        factor,
+        first_scan,
+    ):
+        step = steps[spw]
+        flag_row = columns["FLAG_ROW"]
+        scan = columns["SCAN_NUMBER"]
+        nrow = len(flag_row)
+        if first is None:
+            first = spw, int(columns["FIELD_ID"][0])
+
+        tb.addrows(nrow)
+        put = dict(startrow=row, nrow=nrow)
+        tb.putcol("ANTENNA1", columns["ANTENNA1"], **put)
+        tb.putcol("ANTENNA2", columns["ANTENNA2"], **put)
+        tb.putcol("UVW", columns["UVW"].T, **put)
+        tb.putcol("DATA_DESC_ID", np.full(nrow, spw, dtype=np.int32), **put)
+        for col in ["ARRAY_ID", "FEED1", "FEED2", "OBSERVATION_ID", "PROCESSOR_ID", "STATE_ID"]:
+            tb.putcol(col, np.zeros(nrow, dtype=np.int32), **put)
+        varying = dict(
+            TIME=columns["TIME"],
+            TIME_CENTROID=columns["TIME"],
+            INTERVAL=columns["INTERVAL"],
+            EXPOSURE=columns["INTERVAL"],
+            SCAN_NUMBER=scan,
+            FIELD_ID=columns["FIELD_ID"],
+            FLAG_ROW=flag_row,
+        )
+        for ism_row in range(0, nrow, ISM_ROWS):
+            ism_nrow = min(ISM_ROWS, nrow - ism_row)
+            for col, values in varying.items():
+                tb.putcol(col, values[ism_row : ism_row + ism_nrow], startrow=row + ism_row, nrow=ism_nrow)
+
+        for col in ["SIGMA", "WEIGHT"]:
+            tb.putcol(col, np.ones((ncorr, nrow), dtype=np.float32), **put)
+
+        # the visibilities of a chunk of integrations may still be too many to write in one go
+        for vis_row in range(0, nrow, step):
+            vis_nrow = min(step, nrow - vis_row)
+            vis_flags = flag_row[vis_row : vis_row + vis_nrow]
+            vis_put = dict(startrow=row + vis_row, nrow=vis_nrow)
+            shape = (ncorr, nchan[spw], vis_nrow)
+            # rows added to a column stored as a constant repeat the last value written to it
+            if not fixed_shape or vis_flags.any() or ("FLAG" in constant and flagged):
+                tb.putcol("FLAG", np.broadcast_to(vis_flags, shape).copy(), **vis_put)
+            flagged = vis_flags[-1]
+            if not fixed_shape:
+                for col in ["DATA", "MODEL_DATA", "CORRECTED_DATA"]:
+                    if col not in omit:
+                        tb.putcol(col, np.zeros(shape, dtype=np.complex64), **vis_put)
+        row += nrow
+        profiling.add_rows(nrow)
+        if report_memory:
+            memory.report("scans {}-{} rows {}-{}".format(scan[0], scan[-1], row - nrow, row - 1))
+
+    tb.close()
+    if first is None:
+        raise RuntimeError("Nothing to observe in the selected spectral windows and time range")
+    ant1, ant2 = uvw.baselines(len(xyz), auto_corr) if baselines is None else baselines
+    checks.record_baselines(msname, ant1, ant2, len(xyz), append=start > 0)
+    return row - start, first
+
+
+def read_ms(msname):
+    """What an MS created by simms already has: the ITRF positions (xyz) of
+    its antennas, its correlations (corr_types), spectral windows (freq0,
+    dfreq, nchan) and fields (directions, J2000 ra, dec), how its visibility
+    columns are stored (fixed_shape, constant, omit), the time_range (MJD
+    seconds) of its rows and its last scan number (last_scan). The MS may
+    have been created by either backend."""
+    ms = {}
+    tb.open("%s/ANTENNA" % msname)
+    ms["xyz"] = tb.getcol("POSITION").T
+    tb.close()
+    tb.open("%s/POLARIZATION" % msname)
+    ms["corr_types"] = [int(c) for c in tb.getcell("CORR_TYPE", 0)]
+    tb.close()
+    tb.open("%s/SPECTRAL_WINDOW" % msname)
+    ms["nchan"] = [int(nc) for nc in tb.getcol("NUM_CHAN")]
+    ms["freq0"] = [float(tb.getcell("CHAN_FREQ", spw)[0]) for spw in range(tb.nrows())]
+    ms["dfreq"] = [float(tb.getcell("CHAN_WIDTH", spw)[0]) for spw in range(tb.nrows())]
+    tb.close()
+    tb.open("%s/FIELD" % msname)
+    ms["directions"] = [tuple(d) for d in tb.getcol("PHASE_DIR")[:, 0, :].T]
+    tb.close()
+    tb.open(msname)
+    ms["fixed_shape"] = bool(tb.getcoldesc("FLAG").get("option", 0) & 4)
+    ms["omit"] = [col for col in msschema.OPTIONAL_COLUMNS if col not in tb.colnames()]
+    # read in chunks, the columns of a large MS do not fit in memory
+    ms["last_scan"] = 0
+    ms["time_range"] = [np.inf, -np.inf]
+    for row in range(0, tb.nrows(), SCAN_ROWS):
+        nrow = min(SCAN_ROWS, tb.nrows() - row)
+        ms["last_scan"] = max(ms["last_scan"], int(tb.getcol("SCAN_NUMBER", row, nrow).max()))
+        times, half = tb.getcol("TIME", row, nrow), tb.getcol("INTERVAL", row, nrow) / 2
+        start, stop = float((times - half).min()), float((times + half).max())
+        ms["time_range"] = [min(ms["time_range"][0], start), max(ms["time_range"][1], stop)]
+    tb.close()
+    ms["constant"] = storage.get_constant_columns(msname)
+    return ms
+
+
+def _match(values, existing, close):
+    """Index of each of values in existing (where close(value, old)), and the
+    values not in it, numbered after existing"""
+    index, new = [], []
+    for value in values:
+        found = [i for i, old in enumerate(existing) if close(value, old)]
+        if not found:
+            found = [len(existing) + len(new)]
+            new.append(value)
+        index.append(found[0])
+    return np.array(index, dtype=np.int32), new
+
+
+def append_ms(msname, scans, origin, directions, freq0, dfreq, nchan, corrs, xyz, spws=None, **kwargs):
+    """Append the scans (see get_schedule) of an observation to an MS
+    created by simms (with either backend), writing only the new rows. The
+    spectral windows (freq0, dfreq and nchan, Hz) and fields (J2000
+    directions) of the observation that the MS already has are observed as
+    those, the others are added to it. The scans are numbered after those of
+    the MS. The antennas (xyz) and correlations must be those of the MS, and
+    the scans of its spectral windows must not overlap the time range of its
+    rows. kwargs are those of write_main (dtime, auto_corr, elevation_limit,
+    ...), without the storage of the visibility columns, which is that of
+    the MS. No POINTING rows are written for the rows appended (the native
+    backend writes none, those of the CASA backend then only cover the rows
+    it wrote). Returns the number of rows written."""
+    ms = read_ms(msname)
+    if xyz.shape != ms["xyz"].shape or not np.allclose(xyz, ms["xyz"], atol=1e-3):
+        raise ValueError("The antennas of the observation are not those of %s" % msname)
+    if [STOKES_TYPES[c] for c in corrs] != ms["corr_types"]:
+        raise ValueError("The correlations of the observation are not those of %s" % msname)
+
+    bands = list(zip(freq0, dfreq, nchan))
+    spw_ids, new_bands = _match(
+        bands,
+        list(zip(ms["freq0"], ms["dfreq"], ms["nchan"])),
+        lambda band, old: band[2] == old[2] and np.allclose(band[:2], old[:2], rtol=1e-9, atol=0),
+    )
+    if (ms["fixed_shape"] or ms["constant"]) and any(nc != ms["nchan"][0] for _, _, nc in new_bands):
+        raise ValueError(
+            "The visibility columns of %s have a fixed shape, new spectral windows need %d channels"
+            % (msname, ms["nchan"][0])
+        )
+    field_ids, new_fields = _match(
+        directions,
+        ms["directions"],
+        lambda d, old: abs(np.angle(np.exp(1j * (d[0] - old[0])))) < 1e-9 and abs(d[1] - old[1]) < 1e-9,
+    )
+
+    scans = scans.copy()
+    scans["spw"] = spw_ids[scans["spw"]]
+    scans["field"] = field_ids[scans["field"]]
+    start, stop = origin + scans["start"], origin + scans["stop"]
+    old = scans["spw"] < len(ms["nchan"])
+    if np.any(old & (start < ms["time_range"][1]) & (stop > ms["time_range"][0])):
+        raise ValueError(
+            "Scans of spectral windows of %s overlap its time range, which would repeat its rows. "
+            "Observe new spectral windows or another time range (--date)" % msname
+        )
+
+    # the rows written refer to the new spectral windows and fields
+    if new_bands:
+        _fill_spws(msname, *zip(*new_bands), first=len(ms["nchan"]))
+    if new_fields:
+        _fill_fields(msname, new_fields, origin, first=len(ms["directions"]))
+    nrows, _ = write_main(
+        msname,
+        scans,
+        origin,
+        directions=ms["directions"] + new_fields,
+        xyz=xyz,
+        ncorr=len(corrs),
+        nchan=ms["nchan"] + [nc for _, _, nc in new_bands],
+        fixed_shape=ms["fixed_shape"],
+        spws=None if spws is None else [int(spw_ids[spw]) for spw in spws],
+        constant=ms["constant"],
+        omit=ms["omit"],
+        first_scan=ms["last_scan"],
+        **kwargs
+    )
+    tb.open("%s/OBSERVATION" % msname, nomodify=False)
+    time_range = [min(ms["time_range"][0], start.min()), max(ms["time_range"][1], stop.max())]
+    tb.putcell("TIME_RANGE", 0, np.array(time_range))
+    tb.close()
+    return nrows
+
+
+def makems(
+    msname=None,
+    label=None,
+    tel="MeerKAT",
+    pos=None,
+    pos_type="CASA",
+    fromknown=False,
+    direction=[],
+    synthesis=4,
+    scan_length=0,
+    dtime=10,
+    freq0=700e6,
+    dfreq=50e6,
+    nchan=1,
+    nbands=1,
+    stokes="RR RL LR LL",
+    feed="perfect R L",
+    noise=0,
+    setlimits=False,  # Deprecated
+    elevation_limit=None,
+    shadow_limit=None,
+    outdir=None,
+    coords="itrf",
+    lon_lat=None,
+    optimise_start=False,
+    date=None,
+    noup=False,
+    auto_corr=False,
+    scan_lag=0,  # Deprecated
+    spws=None,
+    time_range=None,
+    constant_columns=None,
+    omit_columns=None,
+    layout=None,
+    tile_shape=None,
+    chunk_rows=None,
+    chunk_mb=None,
+    report_memory=False,
+    validation="quick",
+    drop_flagged=None,
+    antennas=None,
+    baselines=None,
+    min_baseline=None,
+    max_baseline=None,
+    bda_tolerance=None,
+    output_format="ms",
+    zarr_chunks=None,
+    append=False,
+):
+    """Creates an empty measurement set, computing the observation with NumPy.
+    Takes the same arguments as casasm.makems(). If output_format is "zarr",
+    the observation is written as a Zarr store instead, with chunks of
+    zarr_chunks (see simms.zarrms). If it is "numpy" or "xarray", nothing is
+    written, and the observation is returned as arrays or an xarray Dataset
+    (see simms.observation). If append and the MS exists, the observation
+    is added to it instead (see append_ms)."""
+    t0 = time.time()
+    if output_format == "zarr" and (drop_flagged or bda_tolerance or time_range is not None):
+        raise ValueError("Zarr stores have all rows of a regular time grid (no drop_flagged, bda or time_range)")
+    phases = profiling.Phases("native.makems")
+    phases.next("configure")
+
+    obs_pos = casasm.get_observatory(tel, lon_lat)
+
+    if not isinstance(dtime, str):
+        dtime = "%ds" % dtime
+
+    if msname.lower().strip() == "none":
+        msname = None
+    if msname is None:
+        msname = "%s_%dh%s.MS" % (label or tel, synthesis, dtime)
+    if outdir not in [None, "None", "."]:
+        msname = "%s/%s" % (outdir, msname)
+
+    if fromknown or not pos:
+        raise RuntimeError(
+            "The native backend needs an antenna configuration (pos). "
+            "Known CASA configurations are only available with the CASA backend"
+        )
+    dtime = float(str(dtime).rstrip("s"))
+
+    xyz, dish_diam, station, mount = casasm.get_itrf(pos, pos_type, coords, noup, obs_pos, antennas)
+    ant1, ant2 = casasm.get_baselines(xyz, station, auto_corr, obs_pos, baselines, min_baseline, max_baseline)
+
+    freq0, dfreq, nchan = casasm.get_spws(freq0, dfreq, nchan, nbands)
+    freq0 = [me.frequency("rest", f)["m0"]["value"] for f in freq0]
+    dfreq = [me.frequency("rest", df)["m0"]["value"] for df in dfreq]
+    nbands = len(freq0)
+
+    scan_length = casasm.get_scan_lengths(scan_length, synthesis, len(direction))
+    directions = []
+    for d in direction:
+        d = me.measure(me.direction(*d.split(",")), "J2000")
+        directions.append((d["m0"]["value"], d["m1"]["value"]))
+
+    reftime, use_ha = get_reference_time(date)
+    if optimise_start:
+        origin = casasm.optimised_start(direction, scan_length, dtime, obs_pos, reftime, elevation_limit)
+    elif use_ha:
+        lon = me.measure(obs_pos, "wgs84")["m0"]["value"]
+        origin = astrometry.transit_time(*directions[0], lon, reftime)
+    else:
+        origin = reftime
+
+    corrs = stokes.split()
+    receptors = feed.split()[-2:]
+    ncorr = len(corrs)
+
+    print("Creating Measurement Set with the following properties:")
+    print(
+        "\t {} SPWs each with {} channels at of {} resolution".format(
+            nbands, ",".join(map(str, nchan)), ",".join(map(str, dfreq))
+        )
+    )
+    print(
+        "\t {} tracking fields each with scans of duration {}s, total {}hr per field".format(
+            len(direction),
+            ",".join(map(str, map(int, map(np.ceil, scan_length)))),
+            "{0:.2f}".format(np.sum(scan_length) / 3600.0),
+        )
+    )
+    print("\t {} antennas, {} baselines".format(len(xyz), len(ant1)))
+    factor = None
+    if bda_tolerance:
+        edges = [f + df * np.array([0, nc - 1]) for f, df, nc in zip(freq0, dfreq, nchan)]
+        factor = bda.factors(xyz, dish_diam, ant1, ant2, dtime, edges, bda_tolerance)
+        levels, counts = np.unique(factor, return_counts=True)
+        print(
+            "\t baselines averaged over {} integrations: {}".format(
+                "/".join(map(str, levels)), "/".join(map(str, counts))
+            )
+        )
+
+    if output_format in observation.FORMATS:
+        phases.next("observe")
+        steps = [storage.get_chunk_rows((ncorr, nc), chunk_rows, chunk_mb) for nc in nchan]
+        rows = iter_rows(
+            get_schedule(direction, scan_length, nbands),
+            origin,
+            dtime,
+            xyz,
+            directions,
+            steps,
+            auto_corr,
+            elevation_limit,
+            shadow_limit,
+            dish_diam,
+            spws,
+            time_range,
+            drop_flagged,
+            (ant1, ant2),
+            factor,
+        )
+        obs = observation.collect(
+            rows,
+            CHAN_FREQ=[f + df * np.arange(nc) for f, df, nc in zip(freq0, dfreq, nchan)],
+            PHASE_DIR=np.array(directions),
+            ANTENNA_NAME=np.array(station),
+            ANTENNA_POSITION=xyz,
+            DISH_DIAMETER=np.asarray(dish_diam, dtype=float),
+            CORR_TYPE=corrs,
+            attrs=dict(telescope_name=tel, reference_time=origin, integration_time=dtime),
+        )
+        phases.end()
+        print("Observation computed in memory ({} rows)".format(len(obs["TIME"])))
+        return observation.to_dataset(obs) if output_format == "xarray" else obs
+
+    if output_format == "zarr":
+        from simms import zarrms
+
+        phases.next("write zarr")
+        nrows = zarrms.write(
+            msname,
+            get_schedule(direction, scan_length, nbands),
+            origin,
+            dtime,
+            xyz,
+            station,
+            mount,
+            dish_diam,
+            directions,
+            (ant1, ant2),
+            freq0,
+            dfreq,
+            nchan,
+            corrs,
+            elevation_limit,
+            shadow_limit,
+            zarr_chunks,
+            spws,
+            attrs=dict(telescope_name=tel, reference_time=origin),
+        )
+        phases.end()
+        print("Zarr store '{}' created ({} rows)".format(msname, nrows))
+        return msname
+
+    if append and os.path.exists(msname):
+        phases.next("append")
+        nrows = append_ms(
+            msname,
+            get_schedule(direction, scan_length, nbands),
+            origin,
+            directions,
+            freq0,
+            dfreq,
+            nchan,
+            corrs,
+            xyz,
+            spws,
+            dtime=dtime,
+            auto_corr=auto_corr,
+            elevation_limit=elevation_limit,
+            time_range=time_range,
+            chunk_rows=chunk_rows,
+            chunk_mb=chunk_mb,
+            report_memory=report_memory,
+            shadow_limit=shadow_limit,
+            dish_diam=dish_diam,
+            drop_flagged=drop_flagged,
+            baselines=(ant1, ant2),
+            factor=factor,
+        )
+        print("{} rows appended to '{}'".format(nrows, msname))
+        phases.next("validate")
+        valid = casasm.validate(msname, t0, None, None, mode=validation)
+        phases.end()
+        return msname if valid else None
+
+    phases.next("create tables")
+    # With a single channelisation the visibility columns can be fixed shape,
+    # which saves writing (and converting) all the zeros
+    fixed_shape = len(set(nchan)) == 1
+    constant, omit = msschema.get_column_storage(constant_columns, omit_columns)
+    stman = "TiledColumnStMan" if fixed_shape else "TiledShapeStMan"
+    tiled = {col: col for col in _TILED}
+    tiles = msschema.tile_shape(ncorr, max(nchan), layout, tile_shape)
+    groups = {col: ([col], msschema.column_tile_shape(col, tiles), stman) for col in _TILED}
+    # FLAG_CATEGORY has no fixed shape (its number of categories is not known)
+    groups["FLAG_CATEGORY"] = groups["FLAG_CATEGORY"][:2]
+    for col in constant + omit:
+        del groups[col]
+    desc = msschema.main_columns(tiled, (ncorr, nchan[0]) if fixed_shape else None, constant, omit)
+    dminfo = msschema.tiled_dminfo(groups)
+    for col in constant:
+        dminfo["*%d" % (len(dminfo) + 1)] = msschema.constant_dminfo(col, (ncorr, nchan[0]), len(dminfo))
+    msschema.create_ms(tb, msname, desc, dminfo)
+    tb.close()
+
+    phases.next("write main table")
+    scans = get_schedule(direction, scan_length, nbands)
+    nrows, first = write_main(
+        msname,
+        scans,
+        origin,
+        dtime,
+        xyz,
+        directions,
+        ncorr,
+        nchan,
+        auto_corr,
+        elevation_limit,
+        fixed_shape,
+        spws,
+        time_range,
+        constant,
+        omit,
+        chunk_rows,
+        chunk_mb,
+        report_memory,
+        shadow_limit,
+        dish_diam,
+        drop_flagged,
+        (ant1, ant2),
+        factor,
+    )
+
+    phases.next("write subtables")
+    nant = len(xyz)
+    _fill(
+        "%s/ANTENNA" % msname,
+        nant,
+        NAME=np.array(station),
+        STATION=np.array(station),
+        MOUNT=np.array(mount),
+        TYPE=np.array(["GROUND-BASED"] * nant),
+        DISH_DIAMETER=dish_diam,
+        POSITION=xyz.T.copy(),
+        OFFSET=np.zeros((3, nant)),
+        FLAG_ROW=np.zeros(nant, dtype=bool),
+    )
+    _fill(
+        "%s/FEED" % msname,
+        nant,
+        ANTENNA_ID=np.arange(nant, dtype=np.int32),
+        FEED_ID=np.zeros(nant, dtype=np.int32),
+        SPECTRAL_WINDOW_ID=np.full(nant, -1, dtype=np.int32),
+        BEAM_ID=np.full(nant, -1, dtype=np.int32),
+        NUM_RECEPTORS=np.full(nant, len(receptors), dtype=np.int32),
+        POLARIZATION_TYPE=[np.array(receptors)] * nant,
+        POL_RESPONSE=[np.eye(len(receptors), dtype=complex)] * nant,
+        RECEPTOR_ANGLE=[np.zeros(len(receptors))] * nant,
+        BEAM_OFFSET=[np.zeros((2, len(receptors)))] * nant,
+        POSITION=np.zeros((3, nant)),
+        INTERVAL=np.full(nant, 1e30),
+        TIME=np.zeros(nant),
+    )
+    _fill_spws(msname, freq0, dfreq, nchan)
+    _fill(
+        "%s/POLARIZATION" % msname,
+        1,
+        NUM_CORR=np.array([ncorr], dtype=np.int32),
+        CORR_TYPE=[np.array([STOKES_TYPES[c] for c in corrs], dtype=np.int32)],
+        CORR_PRODUCT=[corr_products(corrs, receptors)],
+        FLAG_ROW=np.zeros(1, dtype=bool),
+    )
+    _fill_fields(msname, directions, origin)
+
+    time_range = [origin + min(start for _, _, start, _ in scans), origin + max(stop for _, _, _, stop in scans)]
+    _fill(
+        "%s/OBSERVATION" % msname,
+        1,
+        TELESCOPE_NAME=np.array([tel]),
+        OBSERVER=np.array(["simms"]),
+        PROJECT=np.array(["simms simulation"]),
+        SCHEDULE_TYPE=np.array([""]),
+        TIME_RANGE=np.array(time_range)[:, np.newaxis],
+        RELEASE_DATE=np.zeros(1),
+        FLAG_ROW=np.zeros(1, dtype=bool),
+    )
+    _fill(
+        "%s/STATE" % msname,
+        1,
+        OBS_MODE=np.array(["OBSERVE_TARGET.ON_SOURCE"]),
+        SIG=np.ones(1, dtype=bool),
+        REF=np.zeros(1, dtype=bool),
+        CAL=np.zeros(1),
+        LOAD=np.zeros(1),
+        SUB_SCAN=np.zeros(1, dtype=np.int32),
+        FLAG_ROW=np.zeros(1, dtype=bool),
+    )
+
+    print("Empty MS '{}' created ({} rows)".format(msname, nrows))
+
+    phases.next("validate")
+    valid = casasm.validate(msname, t0, *first, mode=validation)
+    phases.end()
+    if valid:
+        return msname
+    else:
+        os.system("rm -fr %s" % msname)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An observation computed in memory instead of written to an MS: the rows
+of the main table the native backend would write (see simms.native), as
+NumPy arrays or an xarray Dataset. Tests and quick studies that only need
+the TIME, UVW and ANTENNA1/2 of an observation then need neither the
+simulator nor the filesystem::
+
+    obs = simms.observe(tel="meerkat", synthesis=1, dtime=60)
+    obs["UVW"]  # (nrow, 3)
+    obs = simms.observe(tel="meerkat", synthesis=1, dtime=60, dataset=True)
+
+observe takes the arguments of create_empty_ms. The rows are those of the
+MS, in the same order and with the same column names (ROW_COLUMNS), and
+
+    CHAN_FREQ           frequencies (Hz) of each spectral window
+    PHASE_DIR           (nfield, 2) J2000 (ra, dec) (rad) of the fields
+    ANTENNA_NAME        names of the antennas
+    ANTENNA_POSITION    (nant, 3) ITRF positions (m) of the antennas
+    DISH_DIAMETER       dish diameters (m) of the antennas
+    CORR_TYPE           names of the correlations
+    attrs               telescope_name, reference_time (MJD seconds) and
+                        integration_time (s)
+
+describe the rest of the observation. In a Dataset, the rows are along
+the row dimension, and the channels of spectral windows with fewer
+channels than others are NaN. Making a Dataset needs xarray.
+"""
+import numpy as np
+
+# Output formats of an observation computed in memory
+FORMATS = ["numpy", "xarray"]
+
+# Columns of the rows, as those of the main table of an MS
+ROW_COLUMNS = [
+    "TIME",
+    "INTERVAL",
+    "ANTENNA1",
+    "ANTENNA2",
+    "UVW",
+    "SCAN_NUMBER",
+    "FIELD_ID",
+    "DATA_DESC_ID",
+    "FLAG_ROW",
+]
+
+
+def collect(rows, **metadata):
+    """The rows (spw, columns) of native.iter_rows as one array per column
+    of ROW_COLUMNS, with the metadata describing the rest of the observation"""
+    chunks = {col: [] for col in ROW_COLUMNS}
+    for spw, columns in rows:
+        columns = dict(columns, DATA_DESC_ID=np.full(len(columns["TIME"]), spw, dtype=np.int32))
+        for col in ROW_COLUMNS:
+            chunks[col].append(columns[col])
+    if not chunks["TIME"]:
+        raise RuntimeError("Nothing to observe in the selected spectral windows and time range")
+    obs = {col: np.concatenate(values) for col, values in chunks.items()}
+    obs.update(metadata)
+    return obs
+
+
+def to_dataset(obs):
+    """The observation (see collect) as an xarray Dataset"""
+    try:
+        import xarray
+    except ImportError:
+        raise RuntimeError("An observation Dataset needs xarray (pip install xarray)")
+    nchan = [len(freqs) for freqs in obs["CHAN_FREQ"]]
+    chan_freq = np.full((len(nchan), max(nchan)), np.nan)
+    for spw, freqs in enumerate(obs["CHAN_FREQ"]):
+        chan_freq[spw, : len(freqs)] = freqs
+    data_vars = {col: (["row", "uvw_label"] if col == "UVW" else ["row"], obs[col]) for col in ROW_COLUMNS}
+    data_vars.update(
+        CHAN_FREQ=(["spw", "chan"], chan_freq),
+        NUM_CHAN=(["spw"], np.array(nchan, dtype=np.int32)),
+        PHASE_DIR=(["field", "radec"], np.asarray(obs["PHASE_DIR"])),
+        ANTENNA_POSITION=(["antenna", "xyz"], obs["ANTENNA_POSITION"]),
+        DISH_DIAMETER=(["antenna"], np.asarray(obs["DISH_DIAMETER"], dtype=float)),
+    )
+    coords = dict(
+        uvw_label=["u", "v", "w"],
+        antenna=list(obs["ANTENNA_NAME"]),
+        correlation=list(obs["CORR_TYPE"]),
+    )
+    return xarray.Dataset(data_vars, coords=coords, attrs=dict(obs.get("attrs", {})))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Start time of an observation that keeps its fields above the elevation limit
+for as long as possible. The elevation of every field is evaluated at every
+integration it is observed in (the schedule of schedule.get_schedule), for a
+grid of candidate reference times over a sidereal day, in one vectorised
+pass. The candidate with the most time above the limit wins, ties going to
+the highest mean elevation (e.g. centred on the transits of fields that
+never set).
+
+The result is the reference time (the middle of the observation), which
+date_string turns into a --date that gives the same observation without
+optimising again. Results are also kept for the life of the process, so the
+workers of a batch (see simms.batch) optimise the start of each distinct
+observation once.
+"""
+import datetime
+
+import numpy as np
+
+from simms import astrometry, casasm, flagging
+
+# Spacing (s) of the candidate reference times
+STEP = 60.0
+
+# Largest number of (candidate, integration) elevations computed in one go
+BLOCK_SIZE = 2**22
+
+_results = {}
+
+
+def best_start(directions, scans, dtime, lon, lat, reftime, elevation_limit=None, step=STEP):
+    """Reference time (MJD seconds, UTC) between reftime and a sidereal day
+    later that maximises the time the fields are above elevation_limit (deg).
+    directions are the J2000 (ra, dec) of the fields, scans the plan of
+    schedule.get_schedule (start and stop in seconds relative to the reference
+    time) and lon, lat (rad) the position of the observatory. Returns the
+    reference time and the seconds observed above the limit."""
+    elevation_limit = flagging.get_limits(elevation_limit)[0]
+    key = (tuple(map(tuple, directions)), scans.tobytes(), dtime, lon, lat, reftime, elevation_limit, step)
+    if key in _results:
+        return _results[key]
+
+    # the integrations observed (those of one spectral window, the others repeat them)
+    times, fields = [], []
+    for _, fid, start, stop in scans[scans["spw"] == scans["spw"][0]]:
+        first, last = casasm.get_integrations(start, stop, dtime)
+        times.append(start + (np.arange(first, last) + 0.5) * dtime)
+        fields.append(np.full(last - first, fid))
+    times, fields = np.concatenate(times), np.concatenate(fields)
+
+    # apparent places of the fields. The hour angle of integration k for candidate c is
+    # offset[c] + x[k], so the sine of its elevation is a + b * cos(offset[c] + x[k])
+    s = astrometry.direction_cosines(*np.asarray(directions, dtype=float).T)
+    s = s @ astrometry.precession_nutation(reftime).T
+    ra, dec = np.arctan2(s[:, 1], s[:, 0])[fields], np.arcsin(s[:, 2])[fields]
+    x = 2 * np.pi * astrometry.SIDEREAL_RATE / astrometry.SECONDS_PER_DAY * times - ra
+    a, b = np.sin(lat) * np.sin(dec), np.cos(lat) * np.cos(dec)
+    bcos, bsin = b * np.cos(x), b * np.sin(x)
+    candidates = reftime + np.arange(0, astrometry.SECONDS_PER_DAY / astrometry.SIDEREAL_RATE, step)
+    offset = astrometry.gast(candidates) + lon
+
+    above = np.zeros(len(candidates))
+    mean = np.zeros(len(candidates))
+    threshold = np.sin(np.deg2rad(elevation_limit)) - a
+    block = max(1, BLOCK_SIZE // len(times))
+    for c0 in range(0, len(candidates), block):
+        o = offset[c0 : c0 + block, np.newaxis]
+        sin_el = np.cos(o) * bcos - np.sin(o) * bsin
+        above[c0 : c0 + block] = (sin_el >= threshold).sum(axis=1) * dtime
+        mean[c0 : c0 + block] = sin_el.mean(axis=1)  # less the mean of a, the same for all candidates
+
+    best = np.lexsort((mean, above))[-1]
+    _results[key] = float(candidates[best]), float(above[best])
+    return _results[key]
+
+
+def date_string(time):
+    """A --date (EPOCH,yyyy/mm/dd/h:m:s) of a time (MJD seconds, UTC)"""
+    date = datetime.datetime(1858, 11, 17) + datetime.timedelta(seconds=float(time))
+    return "UTC,{:%Y/%m/%d/%H:%M:%S}.{:03d}".format(date, date.microsecond // 1000)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Create the spectral windows of an MS in parallel. casatools tools are
+global singletons, so every spectral window is created by its own worker
+process as a complete MS (with all the windows defined, but only one
+observed). The parts are then put together as a CASA multi-MS (the parts
+are moved into <msname>/SUBMSS, nothing is copied) or concatenated into a
+single MS.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import time
+
+from simms import casasm, profiling, tools
+from simms.casasm import tb
+
+ASSEMBLY = ["multims", "concat"]
+
+# Subtables that stay with each part of a multi-MS
+_PART_SUBTABLES = ["SOURCE", "HISTORY"]
+
+
+def part_name(msname, spw):
+    """Name of the part of msname holding spectral window spw"""
+    return "%s.%04d.ms" % (msname.rstrip("/"), spw)
+
+
+def _make_part(backend, spw, kwargs):
+    # Runs in a worker process
+    from simms import native
+
+    makems = native.makems if backend == "native" else casasm.makems
+    return makems(spws=[spw], **kwargs)
+
+
+def make_parts(backend, nspw, nworkers, msname, **kwargs):
+    """Create one MS per spectral window with nworkers processes.
+    Returns the names of the parts, in spectral window order"""
+    names = [part_name(msname, spw) for spw in range(nspw)]
+    for name in names:
+        if os.path.exists(name):
+            shutil.rmtree(name)
+
+    # spawn (not fork) so that no casatools state is shared with the workers
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(nworkers, mp_context=context) as pool:
+        jobs = [
+            pool.submit(_make_part, backend, spw, dict(kwargs, msname=name, outdir=None))
+            for spw, name in enumerate(names)
+        ]
+        parts = [job.result() for job in jobs]
+
+    failed = [name for name, part in zip(names, parts) if part is None]
+    if failed:
+        raise RuntimeError("Failed to create the parts %s of %s" % (", ".join(failed), msname))
+    return parts
+
+
+def multims(msname, parts):
+    """Make a multi-MS out of parts. The parts are moved into msname/SUBMSS and
+    share the subtables of the first part, as done by CASA's partition task"""
+    ms = tools.get("ms")
+    ms.createmultims(msname, parts, [], True, False, False, [])
+    ms.close()
+
+    tb.open(msname, nomodify=False)
+    info = tb.info()
+    info["readme"] = info.get("readme", "") + "AxisType = spw\n"
+    tb.putinfo(info)
+    tb.close()
+
+    submss = os.path.join(msname, "SUBMSS")
+    first = os.path.basename(parts[0].rstrip("/"))
+    subtables = get_subtables(os.path.join(submss, first))
+    for name in subtables:
+        os.symlink(os.path.join("SUBMSS", first, name), os.path.join(msname, name))
+
+    for part in parts[1:]:
+        path = os.path.join(submss, os.path.basename(part.rstrip("/")))
+        for name in subtables:
+            if name in _PART_SUBTABLES:
+                continue
+            shutil.rmtree(os.path.join(path, name))
+            os.symlink(os.path.join("..", first, name), os.path.join(path, name))
+
+    return msname
+
+
+def get_subtables(msname):
+    """Names of the subtables of an MS"""
+    tb.open(msname)
+    names = [
+        name
+        for name in tb.keywordnames()
+        if isinstance(tb.getkeyword(name), str) and tb.getkeyword(name).startswith("Table: ")
+    ]
+    tb.close()
+    return names
+
+
+def concat(msname, parts):
+    """Concatenate the main tables of parts into msname. All parts have the
+    same subtables, so those of the first part are kept"""
+    os.rename(parts[0], msname)
+    tb.open(msname, nomodify=False)
+    for part in parts[1:]:
+        tb.close()
+        tb.open(part)
+        tb.copyrows(msname)
+        tb.close()
+        shutil.rmtree(part)
+        tb.open(msname, nomodify=False)
+    tb.close()
+    return msname
+
+
+def makems(backend="casa", nworkers=2, assembly="multims", **kwargs):
+    """Create an MS (takes the same arguments as casasm.makems) with each
+    spectral window created by one of nworkers worker processes. assembly
+    is one of ASSEMBLY"""
+    if assembly not in ASSEMBLY:
+        raise ValueError("Unknown assembly [%s]. Choices are (%s)" % (assembly, ", ".join(ASSEMBLY)))
+
+    t0 = time.time()
+    msname = kwargs.pop("msname")
+    if kwargs.get("outdir") not in [None, "None", "."]:
+        msname = "%s/%s" % (kwargs["outdir"], msname)
+    kwargs["outdir"] = None
+
+    freq0, _, _ = casasm.get_spws(kwargs["freq0"], kwargs["dfreq"], kwargs["nchan"], kwargs.get("nbands", 1))
+    nspw = len(freq0)
+
+    # the parts are created (and can only be profiled) in the worker processes
+    phases = profiling.Phases("parallel.makems")
+    phases.next("make parts")
+    parts = make_parts(backend, nspw, min(nworkers, nspw), msname, **kwargs)
+    print("Assembling {} parts into {} ({})".format(len(parts), msname, assembly))
+    phases.next("assemble")
+    if assembly == "multims":
+        multims(msname, parts)
+    else:
+        concat(msname, parts)
+
+    phases.next("validate")
+    valid = casasm.validate(msname, t0, mode=kwargs.get("validation", "quick"))
+    phases.end()
+    if valid:
+        return msname
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing of the phases of creating an MS, written as a trace in the Chrome
+trace event format (JSON), which chrome://tracing and https://ui.perfetto.dev
+display as a timeline. A trace records
+
+    spans:    the phases of makems (see Phases) and the casatools calls
+              that took at least MIN_CALL ms
+    counters: the rows written, and the memory used (RSS and peak RSS) at
+              the end of each phase
+
+and in its otherData the number of calls of (and time spent in) each
+casatools method, the rows written and the peak RSS. Only the process that
+started the trace is traced, not worker processes (see simms.parallel).
+
+    with profiling.trace("obs.trace.json"):
+        core.create_empty_ms(...)
+
+The phases started and the rows written can also be followed as they
+happen, with or without a trace (e.g. to report the progress of a job, see
+simms.serve):
+
+    with profiling.listen(print):
+        core.create_empty_ms(...)
+"""
+import contextlib
+import json
+import os
+import time
+
+from simms import memory
+
+# Shortest casatools call (ms) that gets a span of its own
+MIN_CALL = 1.0
+
+_active = None
+_listener = None
+
+
+class Trace(object):
+    """The events of a trace"""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.calls = {}
+        self.rows = 0
+        self.phases = []
+
+    def now(self):
+        """Time (us) since the start of the trace"""
+        return (time.perf_counter() - self.t0) * 1e6
+
+    def span(self, name, start, cat="phase", **args):
+        """Add a span from start (us) to now"""
+        end = self.now()
+        self.events.append(dict(name=name, cat=cat, ph="X", ts=start, dur=end - start, pid=self.pid, tid=0, args=args))
+        if cat == "phase":
+            self.counter("memory", end, rss=memory.rss(), peak_rss=memory.peak_rss())
+
+    def counter(self, name, ts=None, **values):
+        self.events.append(dict(name=name, ph="C", ts=self.now() if ts is None else ts, pid=self.pid, args=values))
+
+    def to_dict(self):
+        # phases left open (e.g. by an exception) end with the trace
+        for phases in list(self.phases):
+            phases.end(failed=True)
+        return dict(
+            traceEvents=self.events,
+            displayTimeUnit="ms",
+            otherData=dict(
+                seconds=self.now() / 1e6,
+                rows=self.rows,
+                peak_rss=memory.run_peak_rss(),
+                calls={name: dict(count=count, seconds=seconds) for name, (count, seconds) in sorted(self.calls.items())},
+            ),
+        )
+
+
+def active():
+    """True if a trace is being recorded"""
+    return _active is not None
+
+
+@contextlib.contextmanager
+def trace(path):
+    """Record a trace of the code run in the context, and write it to path.
+    Nested traces are part of the outer one."""
+    global _active
+    if _active is not None:
+        yield _active
+        return
+    _active = Trace()
+    try:
+        yield _active
+    finally:
+        content, _active = _active.to_dict(), None
+        with open(path, "w") as stdw:
+            json.dump(content, stdw)
+        print("Profile written to {} (open it in chrome://tracing or https://ui.perfetto.dev)".format(path))
+
+
+@contextlib.contextmanager
+def listen(callback):
+    """Call callback with an event (a dict) for each phase started
+    (function and phase) and each chunk of rows written (rows) by the code
+    run in the context"""
+    global _listener
+    saved, _listener = _listener, callback
+    try:
+        yield
+    finally:
+        _listener = saved
+
+
+def _notify(**event):
+    if _listener is not None:
+        _listener(event)
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """A span of the code run in the context"""
+    if _active is None:
+        yield
+        return
+    start = _active.now()
+    try:
+        yield
+    finally:
+        if _active is not None:
+            _active.span(name, start, **args)
+
+
+class Phases(object):
+    """Consecutive phases of a function, in a span of the function:
+
+    phases = profiling.Phases("makems")
+    phases.next("configure")
+    ...
+    phases.next("observe")
+    ...
+    phases.end()
+
+    Does nothing if no trace is being recorded."""
+
+    def __init__(self, name):
+        self.name = name
+        self.current = None
+        self.trace = _active
+        if self.trace:
+            self.start = self.trace.now()
+            self.trace.phases.append(self)
+
+    def _end_current(self, **args):
+        if self.current:
+            self.trace.span(self.current, self.current_start, **args)
+        self.current = None
+
+    def next(self, name):
+        """End the current phase and start phase name"""
+        _notify(function=self.name, phase=name)
+        if not self.trace:
+            return
+        self._end_current()
+        self.current, self.current_start = name, self.trace.now()
+
+    def end(self, **args):
+        """End the current phase and the span of the function"""
+        if not self.trace or self not in self.trace.phases:
+            return
+        self._end_current(**args)
+        self.trace.span(self.name, self.start, **args)
+        self.trace.phases.remove(self)
+
+
+def add_rows(nrows):
+    """Count nrows rows as written"""
+    _notify(rows=int(nrows))
+    if _active is not None:
+        _active.rows += int(nrows)
+        _active.counter("rows", rows=_active.rows)
+
+
+def timed(name, method):
+    """method (of a casatools tool), counting and timing its calls"""
+
+    def call(*args, **kwargs):
+        start = _active.now() if _active else None
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if _active is not None and start is not None:
+                seconds = (_active.now() - start) / 1e6
+                count, total = _active.calls.get(name, (0, 0.0))
+                _active.calls[name] = (count + 1, total + seconds)
+                if seconds * 1e3 >= MIN_CALL:
+                    _active.span(name, start, cat="casatools")
+
+    return call
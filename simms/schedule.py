@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The plan of an observation, shared by both backends: the scans observed
+(get_schedule), with times in seconds relative to the reference time of
+the observation (get_reference_time). The CASA backend observes the scans
+with the simulator and the native backend computes them with NumPy, so
+both give the same scans in the same order.
+"""
+import time
+
+import numpy as np
+
+from simms import astrometry, tools
+
+me = tools.LazyTool("me")
+
+# A scan of the observation plan (see get_schedule)
+SCHEDULE = [("spw", np.int32), ("field", np.int32), ("start", float), ("stop", float)]
+
+
+def get_schedule(direction, scan_length, nspw):
+    """The scans observed, in the order the CASA backend observes them: in
+    each spectral window, the fields take turns to observe a scan. Returns
+    the plan, an array of SCHEDULE records (spw, field, start, stop) with
+    start/stop in seconds relative to the reference time."""
+    nfield, nscan = len(direction), len(scan_length)
+    lengths = np.repeat(np.asarray(scan_length, dtype=float), nfield)
+    # added up in order, which gives the same times as adding one scan after another
+    edges = np.cumsum(np.concatenate([[0.0 - sum(scan_length) / 2.0], lengths]))
+    scans = np.zeros(nspw * nscan * nfield, dtype=SCHEDULE)
+    scans["spw"] = np.repeat(np.arange(nspw), nscan * nfield)
+    scans["field"] = np.tile(np.arange(nfield), nspw * nscan)
+    scans["start"] = np.tile(edges[:-1], nspw)
+    scans["stop"] = np.tile(edges[1:], nspw)
+    return scans
+
+
+def get_reference_time(date=None):
+    """Reference time (MJD seconds, UTC) and whether scan times are hour angles"""
+    use_ha = False
+    if date in (None, "None"):
+        td = time.gmtime()
+        date = "UTC,{0:d}/{1:d}/{2:d}".format(td.tm_year, td.tm_mon, td.tm_mday)
+        use_ha = True
+
+    epoch, date = date.split(",")
+    reftime = me.measure(me.epoch(epoch, date), "UTC")
+    return reftime["m0"]["value"] * astrometry.SECONDS_PER_DAY, use_ha
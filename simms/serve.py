@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A long-running simms server. Its worker processes keep casatools (and the
+measures data) loaded between jobs, so a job does not pay for starting
+Python and casatools as a new simms process does. Clients send jobs (dicts
+of create_empty_ms arguments, as in a batch file, see simms.batch) over a
+Unix socket; the jobs are queued and run by the workers, as many at a time
+as there are workers, and the events of each job are sent back to its
+client as they happen.
+
+    simms --serve /tmp/simms.sock --batch-workers 4
+    simms --server /tmp/simms.sock -T meerkat -st 1 -be native
+    simms --server /tmp/simms.sock --batch sweep.json
+
+Messages are JSON objects, one per line. A client sends one request
+
+    {"jobs": [{"tel": "meerkat", "synthesis": 1}, ...], "cwd": "/data"}
+
+(names of MSs and files are relative to cwd) and gets the events of its jobs
+
+    {"event": "queued", "id": 3, "msname": ..., "position": 2}
+    {"event": "started", "id": 3, "pid": 1234}
+    {"event": "phase", "id": 3, "function": "native.makems", "phase": "write main table"}
+    {"event": "rows", "id": 3, "rows": 120000}
+    {"event": "done", "id": 3, "msname": ..., "seconds": 2.1, ...}
+
+("failed", with its error, instead of "done"), rows being the rows written
+so far, and a last {"event": "finished", "done": 1, "failed": 0}. The
+request {"status": true} gets the number of workers and of jobs queued,
+running, done and failed, and {"shutdown": true} stops the server once the
+jobs running are finished. The output of each job goes to a log file as
+with --batch. Jobs whose worker died are retried, in a new pool of workers.
+"""
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import socket
+import stat
+import time
+
+from simms import batch
+
+# Shortest time (s) between two rows events of a job
+PROGRESS_INTERVAL = 1.0
+
+# In a worker: the queue of the events sent to the server
+_events = None
+
+
+def _init_worker(events):
+    """Start a worker: load casatools, its tools and the measures data"""
+    global _events
+    _events = events
+    from simms import casasm, core, native, tools  # noqa: F401
+
+    for name in ["sm", "tb", "me"]:
+        tools.get(name)
+    casasm.me.measure(casasm.me.epoch("UTC", "today"), "TAI")
+    casasm.me.observatory("MeerKAT")
+
+
+def run_job(job_id, job, cwd=None, logdir=None):
+    """Run a job in a worker (see batch.run_job), in the directory cwd,
+    sending its events to the server"""
+    from simms import profiling
+
+    progress = dict(rows=0, sent=0.0)
+
+    def send(event):
+        if "rows" in event:
+            progress["rows"] += event["rows"]
+            if time.time() - progress["sent"] < PROGRESS_INTERVAL:
+                return
+            progress["sent"] = time.time()
+            _events.put(dict(event="rows", id=job_id, rows=progress["rows"]))
+        else:
+            _events.put(dict(event, event="phase", id=job_id))
+
+    _events.put(dict(event="started", id=job_id, pid=os.getpid()))
+    saved = os.getcwd()
+    try:
+        os.chdir(cwd or saved)
+        with profiling.listen(send):
+            result = batch.run_job(job_id, job, logdir)
+    finally:
+        os.chdir(saved)
+    # sent after the events of the job, through the same queue
+    del result["index"]
+    _events.put(dict(result, event=result.pop("status"), id=job_id))
+
+
+class Server(object):
+    """A queue of jobs run by a pool of nworkers warm worker processes"""
+
+    def __init__(self, nworkers=1, logdir=None, retries=1):
+        self.nworkers = nworkers
+        self.logdir = os.path.abspath(logdir) if logdir else None
+        self.retries = retries
+        # spawn (not fork) so that no casatools state is shared with the workers
+        self.context = multiprocessing.get_context("spawn")
+        self.events = self.context.Queue()
+        self.pool = self._new_pool()
+        self.queue = asyncio.Queue()
+        self.clients = {}
+        self.counts = dict(running=0, done=0, failed=0)
+        self.next_id = 0
+        self.stopping = asyncio.Event()
+        self.tasks = []
+
+    def _new_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(
+            self.nworkers, mp_context=self.context, initializer=_init_worker, initargs=(self.events,)
+        )
+
+    async def start(self):
+        """Start the workers (all of them, loaded) and the tasks feeding them jobs"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, os.getpid) for _ in range(self.nworkers)])
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(self.nworkers)]
+        self.tasks.append(asyncio.ensure_future(self._pump()))
+
+    async def close(self):
+        """Stop the workers, once the jobs running are finished"""
+        for task in self.tasks[:-1]:
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.pool.shutdown)
+        # wakes the pump up
+        self.events.put(None)
+        await self.tasks[-1]
+
+    def _route(self, event):
+        """Pass an event of a job to its client"""
+        if event["event"] in ("done", "failed"):
+            self.counts[event["event"]] += 1
+        client = self.clients.get(event["id"])
+        if client is not None:
+            client.put_nowait(event)
+
+    def _fail(self, job_id, job, error):
+        self._route(dict(event="failed", id=job_id, msname=job.get("msname"), seconds=0.0, error=error))
+
+    async def _pump(self):
+        """Pass the events of the workers on to the clients"""
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self.events.get)
+            if event is None:
+                return
+            self._route(event)
+
+    async def _work(self):
+        """Run the queued jobs in the pool, one at a time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, job, cwd, attempts = await self.queue.get()
+            self.counts["running"] += 1
+            pool = self.pool
+            try:
+                await loop.run_in_executor(pool, run_job, job_id, job, cwd, self.logdir)
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker died (e.g. a crash in casatools). The jobs running in the pool are
+                # retried in a new one
+                if pool is self.pool:
+                    self.pool = self._new_pool()
+                    pool.shutdown(wait=False)
+                if attempts < self.retries:
+                    self.queue.put_nowait((job_id, job, cwd, attempts + 1))
+                else:
+                    self._fail(job_id, job, "worker process died")
+            except Exception as exc:
+                # e.g. a job that cannot be sent to a worker
+                self._fail(job_id, job, "%s: %s" % (type(exc).__name__, exc))
+            finally:
+                self.counts["running"] -= 1
+
+    def status(self):
+        return dict(event="status", workers=self.nworkers, queued=self.queue.qsize(), **self.counts)
+
+    async def handle(self, reader, writer):
+        """Serve a client: queue its jobs and send it their events"""
+        try:
+            request = json.loads(await reader.readline())
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+        except ValueError as exc:
+            await _send(writer, dict(event="error", error="Bad request: %s" % exc))
+            writer.close()
+            return
+        if request.get("status"):
+            await _send(writer, self.status())
+        elif request.get("shutdown"):
+            await _send(writer, dict(self.status(), event="shutdown"))
+            self.stopping.set()
+        else:
+            jobs = request.get("jobs") or [request.get("job", {})]
+            events = asyncio.Queue()
+            pending = set()
+            for job in jobs:
+                job_id, self.next_id = self.next_id, self.next_id + 1
+                self.clients[job_id] = events
+                pending.add(job_id)
+                self.queue.put_nowait((job_id, job, request.get("cwd"), 0))
+                await _send(
+                    writer, dict(event="queued", id=job_id, msname=job.get("msname"), position=self.queue.qsize())
+                )
+            counts = dict(done=0, failed=0)
+            # the jobs run even if the client goes away
+            while pending:
+                event = await events.get()
+                if event["event"] in counts:
+                    counts[event["event"]] += 1
+                    pending.discard(event["id"])
+                    del self.clients[event["id"]]
+                await _send(writer, event)
+            await _send(writer, dict(event="finished", **counts))
+        writer.close()
+
+
+async def _send(writer, event):
+    if writer.is_closing():
+        return
+    try:
+        writer.write((json.dumps(event, default=str) + "\n").encode())
+        await writer.drain()
+    except ConnectionError:
+        writer.close()
+
+
+async def _serve(path, nworkers, logdir, retries):
+    server = Server(nworkers, logdir, retries)
+    await server.start()
+    unix = await asyncio.start_unix_server(server.handle, path=path)
+    # jobs write files as the user running the server
+    os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+    print("simms server listening on {} with {} workers".format(path, nworkers), flush=True)
+    async with unix:
+        await server.stopping.wait()
+    await server.close()
+
+
+def serve(path, nworkers=1, logdir=None, retries=1):
+    """Run a server on the Unix socket path until it is shut down (or
+    interrupted). The output of each job goes to logdir/jobNNNN.log
+    (discarded if no logdir). Jobs whose worker died are retried up to
+    retries times."""
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise RuntimeError("%s exists and is not a socket" % path)
+        # left behind by a server that did not stop cleanly
+        os.remove(path)
+    if logdir:
+        os.makedirs(logdir, exist_ok=True)
+    try:
+        asyncio.run(_serve(path, nworkers, logdir, retries))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def request(path, message):
+    """Send a request to the server at path, yielding the events it sends back"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps(message) + "\n").encode())
+        with sock.makefile() as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+def submit(path, jobs, cwd=None):
+    """Run jobs on the server at path, yielding their events as they happen"""
+    return request(path, dict(jobs=jobs, cwd=os.path.abspath(cwd or os.getcwd())))
+
+
+def describe(event):
+    """A line describing an event"""
+    kind = event["event"]
+    if kind in ("done", "failed"):
+        outcome = event.get("error") or event.get("msname")
+        return "[{:>4}] {:<7} {:8.1f}s {}".format(event["id"], kind, event["seconds"], outcome)
+    if kind == "queued":
+        return "[{:>4}] queued  (position {}) {}".format(event["id"], event["position"], event["msname"] or "")
+    if kind == "started":
+        return "[{:>4}] started (pid {})".format(event["id"], event["pid"])
+    if kind == "phase":
+        return "[{:>4}] {}: {}".format(event["id"], event["function"], event["phase"])
+    if kind == "rows":
+        return "[{:>4}] {} rows written".format(event["id"], event["rows"])
+    if kind == "finished":
+        return "{} jobs done, {} failed".format(event["done"], event["failed"])
+    if kind in ("status", "shutdown"):
+        return "{}: {} workers, {} jobs queued, {} running, {} done, {} failed".format(
+            kind, event["workers"], event["queued"], event["running"], event["done"], event["failed"]
+        )
+    return event.get("error") or json.dumps(event)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Create an MS in time shards. The observation is split into contiguous time
+ranges (on integration boundaries) and described in a JSON manifest. Each
+shard is an MS of its own that can be created independently, by separate
+processes or by separate nodes sharing a filesystem:
+
+    manifest = shards.plan("obs.MS", 8, "casa", **makems_kwargs)  # writes obs.MS.shards.json
+    shards.make_shard("obs.MS.shards.json", 3)                    # on any node, for every shard
+    shards.merge("obs.MS.shards.json")                            # once all shards are done
+
+The merged MS has the same rows in the same order (spectral window, then
+time) as an MS created in one go.
+"""
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import time
+
+import numpy as np
+
+from simms import astrometry, casasm, native, parallel, profiling, schedule
+from simms.casasm import me, tb
+
+MANIFEST_VERSION = 1
+
+
+def manifest_name(msname):
+    """Default name of the manifest of msname"""
+    return "%s.shards.json" % msname.rstrip("/")
+
+
+def shard_name(msname, index):
+    """Name of shard index of msname"""
+    return "%s.shard%04d.ms" % (msname.rstrip("/"), index)
+
+
+def get_time_ranges(nshards, direction, scan_length, dtime):
+    """Split the integrations of an observation into nshards contiguous time
+    ranges of (as near as possible) the same number of integrations. Times
+    are in seconds relative to the reference time."""
+    starts = []
+    for _, _, start, stop in schedule.get_schedule(direction, scan_length, 1):
+        first, last = casasm.get_integrations(start, stop, dtime)
+        starts += [start + k * dtime for k in range(first, last)]
+    if nshards > len(starts):
+        raise ValueError("Cannot split %d integrations into %d shards" % (len(starts), nshards))
+
+    bounds = [chunk[0] for chunk in np.array_split(starts, nshards)] + [starts[-1] + dtime]
+    return [(float(bounds[i]), float(bounds[i + 1])) for i in range(nshards)]
+
+
+def plan(msname, nshards, backend="casa", manifest=None, **kwargs):
+    """Write the manifest of an MS created in nshards time shards. kwargs are
+    the arguments of makems (of the backend). Returns the manifest name."""
+    kwargs = dict(kwargs)
+    if kwargs.get("outdir") not in [None, "None", "."]:
+        msname = "%s/%s" % (kwargs["outdir"], msname)
+    kwargs["outdir"] = None
+
+    direction = kwargs["direction"]
+    # All shards must agree on the reference time, wherever and whenever they run. Without a date, the
+    # observation starts (as it would in one go) at today's transit of the first field, pinned as the date
+    if kwargs.get("date") in (None, "None"):
+        reftime, _ = schedule.get_reference_time()
+        obs_pos = casasm.get_observatory(kwargs.get("tel"), kwargs.get("lon_lat"))
+        ra, dec = [me.measure(me.direction(*direction[0].split(",")), "J2000")[m]["value"] for m in ["m0", "m1"]]
+        origin = astrometry.transit_time(ra, dec, me.measure(obs_pos, "wgs84")["m0"]["value"], reftime)
+        kwargs["date"] = "UTC,{!r}d".format(float(origin / astrometry.SECONDS_PER_DAY))
+
+    scan_length = casasm.get_scan_lengths(kwargs.get("scan_length", 0), kwargs.get("synthesis", 4), len(direction))
+    dtime = float(str(kwargs.get("dtime", 10)).rstrip("s"))
+    nspw = len(casasm.get_spws(kwargs["freq0"], kwargs["dfreq"], kwargs["nchan"], kwargs.get("nbands", 1))[0])
+
+    manifest = manifest or manifest_name(msname)
+    root = os.path.dirname(os.path.abspath(manifest))
+    shards = [
+        dict(index=i, msname=os.path.relpath(shard_name(msname, i), root), start=start, stop=stop)
+        for i, (start, stop) in enumerate(get_time_ranges(nshards, direction, scan_length, dtime))
+    ]
+    content = dict(
+        version=MANIFEST_VERSION,
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        msname=os.path.relpath(msname, root),
+        backend=backend,
+        nspw=nspw,
+        arguments=kwargs,
+        shards=shards,
+    )
+    with open(manifest, "w") as stdw:
+        json.dump(content, stdw, indent=2)
+
+    return manifest
+
+
+def load(manifest):
+    """Read a manifest. Paths in it are made absolute"""
+    with open(manifest) as stdr:
+        content = json.load(stdr)
+    if content.get("version") != MANIFEST_VERSION:
+        raise ValueError("Unsupported shard manifest version [%s]" % content.get("version"))
+
+    root = os.path.dirname(os.path.abspath(manifest))
+    content["msname"] = os.path.join(root, content["msname"])
+    for shard in content["shards"]:
+        shard["msname"] = os.path.join(root, shard["msname"])
+    return content
+
+
+def _status_name(shard):
+    return "%s.done" % shard["msname"]
+
+
+def status(manifest):
+    """Status (done or pending) of each shard"""
+    content = load(manifest)
+    return ["done" if os.path.exists(_status_name(shard)) else "pending" for shard in content["shards"]]
+
+
+def make_shard(manifest, index):
+    """Create shard index of the manifest. Returns the name of the shard"""
+    t0 = time.time()
+    content = load(manifest)
+    shard = content["shards"][index]
+    for path in [shard["msname"], _status_name(shard)]:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    makems = native.makems if content["backend"] == "native" else casasm.makems
+    msname = makems(msname=shard["msname"], time_range=(shard["start"], shard["stop"]), **content["arguments"])
+    if msname is None:
+        raise RuntimeError("Failed to create shard %d of %s" % (index, content["msname"]))
+
+    tb.open(msname)
+    nrows = tb.nrows()
+    tb.close()
+    with open(_status_name(shard), "w") as stdw:
+        json.dump(dict(host=socket.gethostname(), seconds=time.time() - t0, nrows=nrows), stdw)
+    return msname
+
+
+def _make_shard(manifest, index):
+    # Runs in a worker process
+    return make_shard(manifest, index)
+
+
+def make_shards(manifest, nworkers=1):
+    """Create all shards of a manifest, in this process or with nworkers
+    worker processes"""
+    nshards = len(load(manifest)["shards"])
+    if nworkers <= 1:
+        return [make_shard(manifest, index) for index in range(nshards)]
+
+    # spawn (not fork) so that no casatools state is shared with the workers
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(nworkers, mp_context=context) as pool:
+        jobs = [pool.submit(_make_shard, manifest, index) for index in range(nshards)]
+        return [job.result() for job in jobs]
+
+
+def merge(manifest, cleanup=True):
+    """Merge the shards of a manifest into its MS, spectral window by spectral
+    window and shard by shard, which gives the row order of an MS created in
+    one go. The shards are removed afterwards, unless cleanup is False."""
+    t0 = time.time()
+    content = load(manifest)
+    pending = [shard["index"] for shard, state in zip(content["shards"], status(manifest)) if state != "done"]
+    if pending:
+        raise RuntimeError("Shards %s of %s are not done" % (pending, content["msname"]))
+
+    msname = content["msname"]
+    parts = [shard["msname"] for shard in content["shards"]]
+    if os.path.exists(msname):
+        shutil.rmtree(msname)
+
+    # an empty main table and the subtables of the first shard
+    tb.open(parts[0])
+    tb.copy(msname, deep=True, valuecopy=True, norows=True)
+    tb.close()
+    for name in parallel.get_subtables(parts[0]):
+        shutil.rmtree(os.path.join(msname, name))
+        shutil.copytree(os.path.join(parts[0], name), os.path.join(msname, name))
+
+    print("Merging {} shards into {}".format(len(parts), msname))
+    for spw in range(content["nspw"]):
+        for part in parts:
+            tb.open(part)
+            selection = tb.query("DATA_DESC_ID==%d" % spw)
+            selection.copyrows(msname)
+            selection.close()
+            tb.close()
+
+    # Each shard only has the pointings and time range of its own part of the observation
+    time_range = []
+    for part in parts:
+        tb.open("%s/OBSERVATION" % part)
+        time_range.append(tb.getcell("TIME_RANGE", 0))
+        tb.close()
+        if part != parts[0]:
+            tb.open("%s/POINTING" % part)
+            if tb.nrows():
+                tb.copyrows("%s/POINTING" % msname)
+            tb.close()
+    time_range = np.array(time_range)
+    tb.open("%s/OBSERVATION" % msname, nomodify=False)
+    tb.putcell("TIME_RANGE", 0, np.array([time_range[:, 0].min(), time_range[:, 1].max()]))
+    tb.close()
+
+    if not casasm.validate(msname, t0, mode=content["arguments"].get("validation", "quick")):
+        raise RuntimeError("Merged MS %s failed validation" % msname)
+
+    if cleanup:
+        for shard in content["shards"]:
+            shutil.rmtree(shard["msname"])
+            os.remove(_status_name(shard))
+    return msname
+
+
+def makems(backend="casa", nshards=2, nworkers=1, **kwargs):
+    """Create an MS (takes the same arguments as casasm.makems) in nshards
+    time shards, created by nworkers processes, and merge them"""
+    msname = kwargs.pop("msname")
+    manifest = plan(msname, nshards, backend, **kwargs)
+    with profiling.span("make shards", nshards=nshards):
+        make_shards(manifest, nworkers)
+    with profiling.span("merge"):
+        msname = merge(manifest)
+    os.remove(manifest)
+    return msname
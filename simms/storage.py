@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storage of the visibility columns of the main table. An empty MS is mostly
+zero DATA, MODEL_DATA and CORRECTED_DATA (and unflagged FLAG and unit SIGMA
+and WEIGHT), so these columns can be stored as constants (with the
+incremental storage manager, which only stores a value when it changes from
+one row to the next) and the optional ones can be left out altogether. The
+MS is then metadata-sized, and is still readable (and writable) by any
+casacore based tool. A column can be materialised (stored tiled, the way
+the CASA simulator stores it) later on:
+
+    storage.materialise("obs.MS", ["DATA", "FLAG"])
+"""
+import numpy as np
+
+from simms import msschema, tools
+
+tb = tools.LazyTool("tb")
+
+# Rough upper limit (bytes) of the visibilities written in one go, by default
+CHUNK_SIZE = 256 * 1024**2
+
+# Rows of DATA_DESC_ID read in one go when going through the rows of an MS in chunks
+DDID_ROWS = 2**20
+
+_ZERO_COLUMNS = ["DATA", "MODEL_DATA", "CORRECTED_DATA"]
+_VALUE_TYPES = {"complex": np.complex64, "boolean": bool, "float": np.float32}
+
+
+def get_shapes(msname):
+    """Shape (ncorr, nchan) of the visibilities of each data description"""
+    tb.open("%s/DATA_DESCRIPTION" % msname)
+    spw_ids = tb.getcol("SPECTRAL_WINDOW_ID")
+    pol_ids = tb.getcol("POLARIZATION_ID")
+    tb.close()
+    tb.open("%s/SPECTRAL_WINDOW" % msname)
+    nchan = tb.getcol("NUM_CHAN")
+    tb.close()
+    tb.open("%s/POLARIZATION" % msname)
+    ncorr = tb.getcol("NUM_CORR")
+    tb.close()
+    return {ddid: (int(ncorr[pol]), int(nchan[spw])) for ddid, (spw, pol) in enumerate(zip(spw_ids, pol_ids))}
+
+
+def get_constant_columns(msname):
+    """Names of the columns of an MS stored as constants"""
+    tb.open(msname)
+    dminfo = tb.getdminfo()
+    tb.close()
+    return [
+        str(info["COLUMNS"][0])
+        for info in dminfo.values()
+        if info["TYPE"] == msschema.CONSTANT_STMAN
+        and len(info["COLUMNS"]) == 1
+        and info["NAME"] == msschema.constant_group(info["COLUMNS"][0])
+    ]
+
+
+def get_chunk_rows(shape, chunk_rows=None, chunk_mb=None):
+    """Number of rows of visibilities of shape (ncorr, nchan) to write in one
+    go: chunk_rows, or as many as fit in chunk_mb MB (CHUNK_SIZE by default)"""
+    if chunk_rows:
+        return int(chunk_rows)
+    size = float(chunk_mb) * 1024**2 if chunk_mb else CHUNK_SIZE
+    return max(1, int(size // (int(np.prod(shape)) * 8)))
+
+
+def chunks(shapes, chunk_rows=None, chunk_mb=None):
+    """(startrow, nrow, shape) of chunks of rows of the same data description
+    of the main table open in tb. DATA_DESC_ID is read DDID_ROWS rows at a
+    time, so that going through a large MS takes the same memory as a small one"""
+    nrows = tb.nrows()
+    for block in range(0, nrows, DDID_ROWS):
+        ddids = tb.getcol("DATA_DESC_ID", block, min(DDID_ROWS, nrows - block))
+        edges = np.flatnonzero(np.diff(ddids)) + 1
+        for start, stop in zip(np.concatenate([[0], edges]), np.concatenate([edges, [len(ddids)]])):
+            shape = shapes[ddids[start]]
+            step = get_chunk_rows(shape, chunk_rows, chunk_mb)
+            for row in range(start, stop, step):
+                yield int(block + row), int(min(step, stop - row)), shape
+
+
+def _add_tiled(name, desc, tiles, stman, shapes, source=None, chunking={}):
+    """Add column name (stored tiled) to the main table open in tb, and fill
+    it from column source, or with zeros if there is none"""
+    dminfo = msschema.tiled_dminfo({name: ([name], msschema.column_tile_shape(name, tiles), stman)})["*1"]
+    tb.addcols({name: desc[name]}, dminfo)
+    fixed = stman == "TiledColumnStMan"
+    dtype = _VALUE_TYPES[desc[name]["valueType"]]
+    for row, nrow, shape in chunks(shapes, **chunking):
+        cell = shape if name not in ["SIGMA", "WEIGHT"] else shape[:1]
+        if source:
+            values = tb.getcol(source, startrow=row, nrow=nrow)
+        elif fixed:
+            # fixed shape tiled columns read back as zeros without being written
+            continue
+        else:
+            # variable shape cells must be written to exist
+            values = np.zeros(cell + (nrow,), dtype=dtype)
+        if fixed and not values.any():
+            continue
+        tb.putcol(name, values, startrow=row, nrow=nrow)
+
+
+def _store_tiled(msname, columns, layout=None, tile_shape=None, copy=(), chunking={}):
+    """Store columns of an MS tiled, with the tile shape of the layout (see
+    msschema.tile_shape). The values of the columns in copy are kept, the
+    others are zero (or added, if not in the MS)."""
+    shapes = get_shapes(msname)
+    fixed = len(set(shapes.values())) == 1
+    ncorr = max(shape[0] for shape in shapes.values())
+    nchan = max(shape[1] for shape in shapes.values())
+    tiles = msschema.tile_shape(ncorr, nchan, layout, tile_shape)
+    stman = "TiledColumnStMan" if fixed else "TiledShapeStMan"
+    desc = msschema.main_columns(shape=list(shapes.values())[0] if fixed else None)
+
+    tb.open(msname, nomodify=False)
+    present = tb.colnames()
+    for name in columns:
+        source = None
+        if name in present and name in copy:
+            source = "%s_SIMMS_TMP" % name
+            tb.renamecol(name, source)
+        elif name in present:
+            tb.removecols([name])
+        _add_tiled(name, desc, tiles, stman, shapes, source, chunking)
+        if source:
+            tb.removecols([source])
+    tb.close()
+
+
+def convert(msname, constant=(), omit=(), chunk_rows=None, chunk_mb=None):
+    """Store the columns in constant as constants and remove the columns in
+    omit from an MS (e.g. one created by the CASA simulator, which stores all
+    visibility columns tiled). The DATA-like columns of an empty MS are all
+    zero, so their values are not copied. Values are copied chunk_rows rows
+    (or chunk_mb MB) at a time."""
+    constant, omit = msschema.get_column_storage(constant, omit)
+    tb.open(msname, nomodify=False)
+    present = tb.colnames()
+    tb.removecols([name for name in omit if name in present])
+    tb.close()
+    if not constant:
+        return
+
+    shapes = get_shapes(msname)
+    if len(set(shapes.values())) > 1:
+        raise ValueError("Columns can only be stored as constants if all spectral windows have the same shape")
+    shape = shapes[0]
+
+    tb.open(msname, nomodify=False)
+    copied = [name for name in constant if name in present and name not in _ZERO_COLUMNS]
+    tb.removecols([name for name in constant if name in present and name in _ZERO_COLUMNS])
+    for name in copied:
+        tb.renamecol(name, "%s_SIMMS_TMP" % name)
+    desc = msschema.main_columns(shape=shape, constant=constant)
+    for name in constant:
+        tb.addcols({name: desc[name]}, msschema.constant_dminfo(name, shape))
+    for name in copied:
+        for row, nrow, _ in chunks(shapes, chunk_rows, chunk_mb):
+            tb.putcol(name, tb.getcol("%s_SIMMS_TMP" % name, startrow=row, nrow=nrow), startrow=row, nrow=nrow)
+    tb.removecols(["%s_SIMMS_TMP" % name for name in copied])
+    tb.close()
+
+
+def materialise(msname, columns=None, layout=None, tile_shape=None, chunk_rows=None, chunk_mb=None):
+    """Store columns (default: all columns stored as constants) tiled, with
+    the tile shape of the layout. Columns left out of the MS are added,
+    filled with zeros. Returns the names of the columns materialised."""
+    constant = get_constant_columns(msname)
+    if columns is None:
+        columns = constant
+    columns, _ = msschema.get_column_storage(columns)
+
+    tb.open(msname)
+    present = tb.colnames()
+    tb.close()
+    columns = [name for name in columns if name in constant or name not in present]
+    _store_tiled(msname, columns, layout, tile_shape, columns, dict(chunk_rows=chunk_rows, chunk_mb=chunk_mb))
+    return columns
+
+
+def retile(msname, layout=None, tile_shape=None, columns=None, chunk_rows=None, chunk_mb=None):
+    """Store the (tiled) visibility columns of an MS with the tile shape of
+    the layout. The DATA-like columns of an empty MS are all zero, so their
+    values are not copied. Returns the names of the columns retiled."""
+    constant = get_constant_columns(msname)
+    tb.open(msname)
+    present = tb.colnames()
+    tb.close()
+    columns = [name for name in columns or msschema.VIS_COLUMNS if name in present and name not in constant]
+    copy = [name for name in columns if name not in _ZERO_COLUMNS]
+    _store_tiled(msname, columns, layout, tile_shape, copy, dict(chunk_rows=chunk_rows, chunk_mb=chunk_mb))
+    return columns
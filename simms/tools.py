@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry of the casatools tools used by simms. Importing casatools takes the
+better part of a second, so the tools are only created (and casatools only
+imported) the first time one of them is used. This keeps `simms --help`,
+`--version` and argument errors fast, and tools that a run does not use
+(e.g. image and componentlist) are never created. While a profile is being
+recorded (see simms.profiling) the calls of the tools are counted and timed.
+"""
+import importlib
+
+from simms import profiling
+
+# name -> casatools factory
+TOOLS = {
+    "sm": "simulator",
+    "ia": "image",
+    "tb": "table",
+    "me": "measures",
+    "qa": "quanta",
+    "cl": "componentlist",
+    "ms": "ms",
+}
+
+_registry = {}
+
+
+def get(name):
+    """The tool registered as name (one of TOOLS), created on first use"""
+    if name not in _registry:
+        casatools = importlib.import_module("casatools")
+        _registry[name] = getattr(casatools, TOOLS[name])()
+    return _registry[name]
+
+
+def created():
+    """Names of the tools that have been created so far"""
+    return list(_registry)
+
+
+class LazyTool(object):
+    """Stand-in for a casatools tool that creates the tool the first time
+    any of its methods is accessed"""
+
+    def __init__(self, name):
+        if name not in TOOLS:
+            raise ValueError("Unknown casatools tool [%s]. Choices are (%s)" % (name, ", ".join(TOOLS)))
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(get(self._name), attr)
+        if profiling.active() and callable(value):
+            return profiling.timed("%s.%s" % (self._name, attr), value)
+        return value
+
+    def __repr__(self):
+        state = "created" if self._name in _registry else "not created"
+        return "<lazy casatools.%s (%s)>" % (TOOLS[self._name], state)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UVW coordinates of all baselines over a grid of times, computed with NumPy.
+This only needs the ITRF antenna positions, so it can be used by simulators
+that want the geometry of an observation without creating an MS:
+
+    from simms import uvw
+    ant1, ant2 = uvw.baselines(len(xyz))
+    coords = uvw.compute(xyz, ra, dec, times)  # (ntime, nbl, 3)
+
+Times are MJD seconds (UTC), directions are J2000 (ra, dec) in radians and
+positions are ITRF metres with shape (nant, 3). UVW follows the CASA
+convention, i.e. uvw(ant1) - uvw(ant2) in the J2000 frame of the phase centre.
+"""
+import numpy as np
+
+from simms import astrometry
+
+# Upper limit (bytes) of the UVW array computed in one go
+CHUNK_SIZE = 64 * 1024**2
+
+
+def baselines(nant, auto_corr=False):
+    """Antenna indices (ant1, ant2) of each baseline, in MS order"""
+    ant1, ant2 = np.triu_indices(nant, 0 if auto_corr else 1)
+    return ant1.astype(np.int32), ant2.astype(np.int32)
+
+
+def time_chunks(ntime, nbl, chunk_size=None):
+    """Slices of the time axis such that each (ntime, nbl, 3) chunk of UVW
+    fits into chunk_size bytes"""
+    step = max(1, (chunk_size or CHUNK_SIZE) // (nbl * 3 * 8))
+    return [slice(t0, min(t0 + step, ntime)) for t0 in range(0, ntime, step)]
+
+
+def antenna_uvw(xyz, ra, dec, times, epoch=None):
+    """UVW (ntime, nant, 3) of each antenna. Aberration and precession-nutation
+    are evaluated at epoch, which defaults to the middle of times."""
+    times = np.atleast_1d(np.asarray(times, dtype=float))
+    if epoch is None:
+        epoch = (times[0] + times[-1]) / 2
+    ra, dec = astrometry.aberrate(ra, dec, epoch)
+    frame = astrometry.uvw_frame(ra, dec)
+    rot = astrometry.celestial_to_terrestrial(times, epoch)
+    return np.einsum("ij,tkj,ak->tai", frame, rot, np.asarray(xyz, dtype=float))
+
+
+def iter_uvw(xyz, ra, dec, times, auto_corr=False, epoch=None, chunk_size=None):
+    """Yield (time slice, uvw) for chunks of the time axis, where uvw has the
+    shape (nt, nbl, 3). Use this to bound memory for long observations."""
+    times = np.atleast_1d(np.asarray(times, dtype=float))
+    if epoch is None:
+        epoch = (times[0] + times[-1]) / 2
+    ant1, ant2 = baselines(len(xyz), auto_corr)
+    for chunk in time_chunks(len(times), len(ant1), chunk_size):
+        auvw = antenna_uvw(xyz, ra, dec, times[chunk], epoch)
+        yield chunk, auvw[:, ant1] - auvw[:, ant2]
+
+
+def compute(xyz, ra, dec, times, auto_corr=False, epoch=None, chunk_size=None, out=None):
+    """UVW of all baselines for one phase centre, shape (ntime, nbl, 3).
+    If ra and dec are arrays of ndir phase centres, the result has the shape
+    (ndir, ntime, nbl, 3). out can be a preallocated array (e.g. a np.memmap)."""
+    times = np.atleast_1d(np.asarray(times, dtype=float))
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    nbl = len(baselines(len(xyz), auto_corr)[0])
+    if out is None:
+        out = np.empty(ra.shape + (len(times), nbl, 3))
+
+    for idx in np.ndindex(ra.shape):
+        for chunk, bl_uvw in iter_uvw(xyz, ra[idx], dec[idx], times, auto_corr, epoch, chunk_size):
+            out[idx + (chunk,)] = bl_uvw
+
+    return out
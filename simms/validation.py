@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validation of a created MS, in one of the MODES:
+
+    quick: the sizes of the subtables, the first and last rows and a strided
+           sample of (at most SAMPLE_SIZE) rows of the main table
+    full:  all rows of the main table, read in chunks of CHUNK_ROWS rows, for
+           the number of rows of each spectral window, field and scan, the
+           time range and the baselines without any rows (of those selected
+           for the MS, see record_baselines)
+    off:   no checks
+
+Neither reads more than a cell of the visibility columns, and neither reads
+the whole of a column in one go, so a quick validation costs the same for
+any size of MS.
+
+    report = validation.check("obs.MS", "full")
+    report["valid"], report["errors"], report["rows_per_scan"]
+"""
+import numpy as np
+
+from simms import storage, tools
+
+tb = tools.LazyTool("tb")
+
+MODES = ["quick", "full", "off"]
+
+SAMPLE_SIZE = 1000
+CHUNK_ROWS = 1000000
+
+# Keyword of the main table with the baselines selected for an MS, as
+# antenna1 * nant + antenna2, if not all of them (see record_baselines)
+BASELINES_KEYWORD = "SIMMS_BASELINES"
+
+# Subtables that must have rows
+_SUBTABLES = ["ANTENNA", "DATA_DESCRIPTION", "FIELD", "OBSERVATION", "POLARIZATION", "SPECTRAL_WINDOW"]
+
+
+def _nrows(name):
+    tb.open(name)
+    nrows = tb.nrows()
+    tb.close()
+    return nrows
+
+
+def _counts(values, counts):
+    # add the number of occurrences of each of values to the dict counts
+    ids, n = np.unique(values, return_counts=True)
+    for value, count in zip(ids.tolist(), n.tolist()):
+        counts[value] = counts.get(value, 0) + count
+
+
+def _check_rows(report, sizes, ddids, fields, ant1, ant2):
+    # the ids in (some) rows of the main table must be rows of the subtables
+    for name, values, subtable in [
+        ("DATA_DESC_ID", ddids, "DATA_DESCRIPTION"),
+        ("FIELD_ID", fields, "FIELD"),
+        ("ANTENNA1", ant1, "ANTENNA"),
+        ("ANTENNA2", ant2, "ANTENNA"),
+    ]:
+        if len(values) and (values.min() < 0 or values.max() >= sizes[subtable]):
+            report["errors"].append("%s out of range of the %s table" % (name, subtable))
+
+
+def _baseline_ids(ant1, ant2, nant):
+    ant1, ant2 = np.asarray(ant1), np.asarray(ant2)
+    return set((np.minimum(ant1, ant2) * nant + np.maximum(ant1, ant2)).tolist())
+
+
+def record_baselines(msname, ant1, ant2, nant, append=False):
+    """Record the baselines (ant1, ant2) selected for an MS of nant
+    antennas, for a full validation to expect rows of those only. Baselines
+    appended to an MS (append) add to those already selected."""
+    selected = _baseline_ids(ant1, ant2, nant)
+    tb.open(msname, nomodify=False)
+    try:
+        keywords = tb.keywordnames()
+        if append:
+            if BASELINES_KEYWORD not in keywords:
+                # all of them already
+                return
+            selected.update(tb.getkeyword(BASELINES_KEYWORD).tolist())
+        if all(i * nant + j in selected for i in range(nant) for j in range(i + 1, nant)):
+            if BASELINES_KEYWORD in keywords:
+                tb.removekeyword(BASELINES_KEYWORD)
+        else:
+            tb.putkeyword(BASELINES_KEYWORD, np.array(sorted(selected), dtype=np.int64))
+    finally:
+        tb.close()
+
+
+def check(msname, mode="quick", ddid=None, field=None):
+    """Validate an MS. ddid and field (if given) are the ids expected in its
+    first row. Returns a report (a dict) with at least valid, errors (a list
+    of what is wrong), rows, subtables (their number of rows) and time_range,
+    and in full mode rows_per_spw, rows_per_field, rows_per_scan and
+    missing_baselines (pairs of antennas)."""
+    if mode not in MODES:
+        raise ValueError("Unknown validation mode [%s]. Choices are (%s)" % (mode, ", ".join(MODES)))
+    report = dict(msname=msname, mode=mode, valid=True, errors=[])
+    if mode == "off":
+        return report
+
+    try:
+        sizes = {name: _nrows("%s/%s" % (msname, name)) for name in _SUBTABLES}
+        report["subtables"] = sizes
+        report["errors"] += ["The %s table is empty" % name for name, nrows in sizes.items() if not nrows]
+        shapes = storage.get_shapes(msname)
+        tb.open("%s/DATA_DESCRIPTION" % msname)
+        spw_ids = tb.getcol("SPECTRAL_WINDOW_ID")
+        tb.close()
+
+        tb.open(msname)
+        try:
+            nrows = report["rows"] = tb.nrows()
+            if not nrows:
+                report["errors"].append("The main table has no rows")
+                return report
+            # DATA is optional (see simms.storage), FLAG is not
+            column = "DATA" if "DATA" in tb.colnames() else "FLAG"
+            for row in [0, nrows - 1]:
+                cell = tb.getcell(column, row)
+                expected = shapes.get(int(tb.getcell("DATA_DESC_ID", row)))
+                if cell is None or tuple(cell.shape) != expected:
+                    report["errors"].append("%s in row %d is not of shape %s" % (column, row, expected))
+            if ddid is not None and tb.getcell("DATA_DESC_ID", 0) != ddid:
+                report["errors"].append("The first row is not of data description %d" % ddid)
+            if field is not None and tb.getcell("FIELD_ID", 0) != field:
+                report["errors"].append("The first row is not of field %d" % field)
+
+            if mode == "quick":
+                stride = max(1, nrows // SAMPLE_SIZE)
+                sample = {
+                    name: tb.getcol(name, 0, -1, stride)
+                    for name in ["DATA_DESC_ID", "FIELD_ID", "ANTENNA1", "ANTENNA2", "TIME"]
+                }
+                _check_rows(
+                    report, sizes, sample["DATA_DESC_ID"], sample["FIELD_ID"], sample["ANTENNA1"], sample["ANTENNA2"]
+                )
+                times = np.concatenate([sample["TIME"], [tb.getcell("TIME", nrows - 1)]])
+                report["sampled"] = len(sample["TIME"])
+                report["time_range"] = [float(times.min()), float(times.max())]
+                return report
+
+            rows_per_ddid, rows_per_field, rows_per_scan = {}, {}, {}
+            baselines = set()
+            tmin, tmax = np.inf, -np.inf
+            nant = sizes["ANTENNA"]
+            selected = tb.getkeyword(BASELINES_KEYWORD).tolist() if BASELINES_KEYWORD in tb.keywordnames() else None
+            for row in range(0, nrows, CHUNK_ROWS):
+                nrow = min(CHUNK_ROWS, nrows - row)
+                ddids = tb.getcol("DATA_DESC_ID", row, nrow)
+                fields = tb.getcol("FIELD_ID", row, nrow)
+                ant1 = tb.getcol("ANTENNA1", row, nrow)
+                ant2 = tb.getcol("ANTENNA2", row, nrow)
+                times = tb.getcol("TIME", row, nrow)
+                _check_rows(report, sizes, ddids, fields, ant1, ant2)
+                _counts(ddids, rows_per_ddid)
+                _counts(fields, rows_per_field)
+                _counts(tb.getcol("SCAN_NUMBER", row, nrow), rows_per_scan)
+                baselines.update(_baseline_ids(ant1, ant2, nant))
+                tmin, tmax = min(tmin, times.min()), max(tmax, times.max())
+        finally:
+            tb.close()
+    except RuntimeError as error:
+        # casatools raises RuntimeError for tables and columns it cannot read
+        report["errors"].append(str(error).strip())
+        return report
+    finally:
+        report["valid"] = not report["errors"]
+
+    rows_per_spw = {}
+    for index, count in rows_per_ddid.items():
+        if 0 <= index < len(spw_ids):
+            spw = int(spw_ids[index])
+            rows_per_spw[spw] = rows_per_spw.get(spw, 0) + count
+    if selected is None:
+        # all of them, with auto-correlations only expected if there are any
+        autos = any(bl // nant == bl % nant for bl in baselines)
+        selected = [i * nant + j for i in range(nant) for j in range(i if autos else i + 1, nant)]
+    report.update(
+        time_range=[float(tmin), float(tmax)],
+        rows_per_spw=rows_per_spw,
+        rows_per_field=rows_per_field,
+        rows_per_scan=rows_per_scan,
+        missing_baselines=[(bl // nant, bl % nant) for bl in selected if bl not in baselines],
+    )
+    return report
+
+
+def summary(report):
+    """Lines describing a report"""
+    lines = ["{} rows".format(report.get("rows", 0))]
+    if report.get("time_range"):
+        t0, t1 = report["time_range"]
+        lines.append("time range {:.1f} - {:.1f} ({:.1f} s)".format(t0, t1, t1 - t0))
+    for name in ["spw", "field", "scan"]:
+        counts = report.get("rows_per_%s" % name)
+        if counts:
+            lines.append("rows per {}: {}".format(name, ", ".join("%s:%d" % item for item in sorted(counts.items()))))
+    if report.get("missing_baselines"):
+        lines.append("baselines without rows: {}".format(len(report["missing_baselines"])))
+    return lines + report["errors"]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An observation written as a Zarr store instead of an MS, for downstream
+steps that fill the visibilities with many (e.g. dask) workers at once,
+without the table locks of an MS. The layout follows the MSv4 processing
+sets: a group (partition) for each spectral window and field, each of them
+an xarray dataset
+
+    xds = xarray.open_zarr("obs.zarr", group="spw00_field00")
+
+with the dimensions time, baseline_id, frequency and polarization and
+
+    VISIBILITY  (time, baseline_id, frequency, polarization)  complex64
+    FLAG        (time, baseline_id, frequency, polarization)  bool
+    WEIGHT      (time, baseline_id, frequency, polarization)  float32
+    UVW         (time, baseline_id, uvw_label)                float64
+
+with the time, scan_number, baseline_antenna1_name, baseline_antenna2_name,
+frequency and polarization coordinates, and an "antenna" group with the
+names, stations, mounts, dish diameters and ITRF positions of the antennas.
+The scans, UVW and flags are those of the native backend (see
+simms.native). Chunks of VISIBILITY, FLAG and WEIGHT that only hold their
+fill values (0, False and 1) are not written, so an empty store is little
+more than its UVW, and each chunk can be filled by a different worker.
+
+Writing a store needs zarr (version 3 or later, pip install simms[zarr]).
+"""
+import warnings
+
+import numpy as np
+
+from simms import casasm, coords, flagging, native
+
+# Size (MB) of the chunks of visibilities, when the number of times in a chunk is not given
+CHUNK_MB = 64
+
+_VISIBILITY_DIMS = ["time", "baseline_id", "frequency", "polarization"]
+_COORDINATES = "scan_number baseline_antenna1_name baseline_antenna2_name"
+
+
+def _import_zarr():
+    try:
+        import zarr
+    except ImportError:
+        raise RuntimeError("Zarr output needs zarr (pip install simms[zarr])")
+    return zarr
+
+
+def get_chunks(chunks, ntime, nbl, nchan, ncorr):
+    """Chunk shape (time, baseline_id, frequency, polarization) of the
+    visibilities. chunks is the (time, baseline, frequency) chunk shape,
+    as a list or a comma separated string, with -1 for a whole axis. By
+    default, a chunk has all baselines and channels and as many times as fit
+    into CHUNK_MB of visibilities."""
+    if isinstance(chunks, str):
+        chunks = chunks.split(",")
+    chunks = [int(size) for size in chunks or []]
+    if len(chunks) > 3:
+        raise ValueError("Zarr chunks are (time, baseline, frequency), not %s" % chunks)
+    chunks = chunks + [None] * (3 - len(chunks))
+    shape = [ntime, nbl, nchan]
+    for axis in [1, 2]:
+        if chunks[axis] in (None, -1):
+            chunks[axis] = shape[axis]
+    if chunks[0] is None:
+        chunks[0] = max(1, CHUNK_MB * 1024**2 // (chunks[1] * chunks[2] * ncorr * 8))
+    elif chunks[0] == -1:
+        chunks[0] = ntime
+    return tuple(max(1, min(size, n)) for size, n in zip(chunks, shape)) + (ncorr,)
+
+
+def _array(group, name, dims, data=None, shape=None, dtype=None, chunks=None, fill_value=None, **attrs):
+    """An array of group with named dimensions, filled with data if given"""
+    if data is not None:
+        data = np.asarray(data)
+        # strings are stored with variable lengths
+        shape, dtype = data.shape, str if data.dtype.kind == "U" else data.dtype
+    array = group.create_array(
+        name, shape=shape, dtype=dtype, chunks=chunks or shape, fill_value=fill_value, dimension_names=dims
+    )
+    array.attrs.update(attrs)
+    if data is not None:
+        array[...] = data
+    return array
+
+
+def write(
+    store,
+    scans,
+    origin,
+    dtime,
+    xyz,
+    station,
+    mount,
+    dish_diam,
+    directions,
+    baselines,
+    freq0,
+    dfreq,
+    nchan,
+    corrs,
+    elevation_limit=None,
+    shadow_limit=None,
+    chunks=None,
+    spws=None,
+    attrs=None,
+):
+    """Write the scans (see schedule.get_schedule) of the spectral windows in
+    spws (default all of them) as a Zarr store. origin is the reference time
+    (MJD seconds), directions the J2000 (ra, dec) of the fields, baselines
+    the (ant1, ant2) observed and freq0, dfreq (Hz) and nchan the spectral
+    windows. Rows are flagged like those of an MS (see simms.flagging).
+    chunks is the chunk shape (see get_chunks) and attrs are added to the
+    attributes of the store. Returns the number of (time, baseline) rows."""
+    zarr = _import_zarr()
+    ant1, ant2 = baselines
+    nbl, ncorr = len(ant1), len(corrs)
+    up = coords.local_vertical(xyz)
+    if dish_diam is None:
+        shadow_limit = 1
+
+    root = zarr.open_group(store, mode="w", zarr_format=3)
+    antenna = root.create_group("antenna")
+    _array(antenna, "antenna_name", ["antenna_name"], np.array(station))
+    _array(antenna, "cartesian_pos_label", ["cartesian_pos_label"], np.array(["x", "y", "z"]))
+    _array(antenna, "station", ["antenna_name"], np.array(station))
+    _array(antenna, "mount", ["antenna_name"], np.array(mount))
+    _array(antenna, "dish_diameter", ["antenna_name"], np.asarray(dish_diam, dtype=float), units="m")
+    _array(antenna, "ANTENNA_POSITION", ["antenna_name", "cartesian_pos_label"], xyz, units="m", frame="ITRF")
+
+    partitions = []
+    nrows = 0
+    for spw, field in sorted(set(zip(scans["spw"].tolist(), scans["field"].tolist()))):
+        if spws is not None and spw not in spws:
+            continue
+        mine = np.flatnonzero((scans["spw"] == spw) & (scans["field"] == field))
+        nints = [casasm.get_integrations(start, stop, dtime)[1] for _, _, start, stop in scans[mine]]
+        if not sum(nints):
+            continue
+        index = np.repeat(np.arange(len(mine)), nints)
+        steps = np.concatenate([np.arange(n) for n in nints])
+        times = origin + scans["start"][mine][index] + (steps + 0.5) * dtime
+        frames, prec = native.scan_frames(scans[mine], origin, directions)
+        ntime, nc = len(times), nchan[spw]
+        shape = (ntime, nbl, nc, ncorr)
+        chunk = get_chunks(chunks, ntime, nbl, nc, ncorr)
+
+        name = "spw{:02d}_field{:02d}".format(spw, field)
+        partitions.append(name)
+        group = root.create_group(name)
+        group.attrs.update(
+            type="visibility",
+            spectral_window_id=spw,
+            field_id=field,
+            field_name="{:02d}".format(field),
+            phase_direction=[float(angle) for angle in directions[field]],
+            phase_direction_frame="J2000",
+            integration_time=float(dtime),
+        )
+        _array(group, "time", ["time"], times, units="s", scale="utc", format="MJD")
+        _array(group, "scan_number", ["time"], (mine[index] + 1).astype(np.int32))
+        _array(group, "baseline_id", ["baseline_id"], np.arange(nbl, dtype=np.int32))
+        _array(group, "baseline_antenna1_name", ["baseline_id"], np.array(station)[ant1])
+        _array(group, "baseline_antenna2_name", ["baseline_id"], np.array(station)[ant2])
+        _array(
+            group,
+            "frequency",
+            ["frequency"],
+            freq0[spw] + dfreq[spw] * np.arange(nc),
+            units="Hz",
+            frame="TOPO",
+            channel_width=float(dfreq[spw]),
+            spectral_window_name="{:02d}".format(spw),
+        )
+        _array(group, "polarization", ["polarization"], np.array(corrs))
+        _array(group, "uvw_label", ["uvw_label"], np.array(["u", "v", "w"]))
+        for column, dtype, fill_value in [("VISIBILITY", np.complex64, 0), ("WEIGHT", np.float32, 1)]:
+            _array(group, column, _VISIBILITY_DIMS, None, shape, dtype, chunk, fill_value, coordinates=_COORDINATES)
+        flag = _array(group, "FLAG", _VISIBILITY_DIMS, None, shape, bool, chunk, False, coordinates=_COORDINATES)
+        uvw = _array(
+            group,
+            "UVW",
+            ["time", "baseline_id", "uvw_label"],
+            None,
+            (ntime, nbl, 3),
+            float,
+            chunk[:2] + (3,),
+            0.0,
+            coordinates=_COORDINATES,
+            units="m",
+        )
+
+        # written a chunk of times at a time, so every chunk is written once
+        for t0 in range(0, ntime, chunk[0]):
+            sl = slice(t0, min(t0 + chunk[0], ntime))
+            ant_uvw, direction = native.antenna_geometry(xyz, times[sl], frames[index[sl]], prec[index[sl]])
+            uvw[sl] = ant_uvw[:, ant1] - ant_uvw[:, ant2]
+            ant_flags = flagging.antenna_flags(xyz, dish_diam, direction, elevation_limit, shadow_limit, up)
+            flags = ant_flags[:, ant1] | ant_flags[:, ant2]
+            if flags.any():
+                flag[sl] = np.broadcast_to(flags[:, :, np.newaxis, np.newaxis], (len(flags), nbl, nc, ncorr))
+        nrows += ntime * nbl
+
+    if not partitions:
+        raise RuntimeError("Nothing to observe in the selected spectral windows")
+    root.attrs.update(attrs or {})
+    root.attrs.update(type="processing_set", partitions=partitions)
+    with warnings.catch_warnings():
+        # xarray reads the metadata of all groups in one go if it is consolidated, which Zarr
+        # format 3 does not specify (yet)
+        warnings.simplefilter("ignore", UserWarning)
+        zarr.consolidate_metadata(store)
+    return nrows
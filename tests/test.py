@@ -1,6 +1,9 @@
 import os
 import subprocess
 import sys
+import time
+
+import numpy as np
 
 message = """
 Cannot find casapy in your system:
@@ -18,5 +21,157 @@ subprocess.check_call(["simms", "--help"])
 
 # Finally see if we can run simms
 subprocess.check_call(["simms", "-T", "kat-7", "-st", "8", "-dt", "10"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "8", "-dt", "10", "--backend", "native"])
+# served from the cache
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "8", "-dt", "10", "--backend", "native"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "-nb", "2", "--parallel-spw", "2"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "-n", "const.MS", "--constant-columns", "all"])
+subprocess.check_call(["simms", "--materialise", "const.MS"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "--shards", "3"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "--no-cache", "--validate", "full"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "--no-cache", "--profile", "trace.json"])
+subprocess.check_call(["simms", "-T", "meerkat", "-st", "8", "-dt", "1", "-nc", "4096", "--dry-run"])
+subprocess.check_call(["simms", "-T", "kat-7", "-st", "0.02", "-dt", "10", "-hex", "2", "-hexs", "1deg"])
+subprocess.check_call(["simms", "-T", "meerkat", "-st", "0.1", "-dt", "60", "--antennas", "<1km,M06*", "-be", "native"])
+subprocess.check_call(
+    ["simms", "-T", "meerkat", "-st", "0.1", "-dt", "60", "-maxbl", "1km", "-bls", "M00*", "-be", "native"]
+    + ["-n", "maxbl.MS"]
+)
+subprocess.check_call(
+    ["simms", "-T", "kat-7", "-st", "1", "-dt", "60", "-dir", "J2000,0h0m0s,-30d0m0s", "-dir", "J2000,12h0m0s,10d0m0s"]
+    + ["--optimise-start"]
+)
+subprocess.check_call(
+    ["simms", "-T", "meerkat", "-st", "1", "-dt", "60", "-dec", "45d0m0s", "-be", "native", "--drop-flagged", "rows"]
+)
+subprocess.check_call(["simms", "-T", "meerkat", "-st", "0.5", "-dt", "8", "-be", "native", "--bda-tolerance", "0.01"])
+append = ["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "-be", "native", "-n", "append.MS"]
+subprocess.check_call(append + ["-f0", "1GHz"])
+subprocess.check_call(append + ["-f0", "2GHz", "--append"])
+try:
+    import zarr
+except ImportError:
+    zarr = None
+if zarr:
+    subprocess.check_call(["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "-be", "native", "--output-format", "zarr"])
+subprocess.check_call([sys.executable, "-c", "import simms; simms.observe(tel='kat-7', synthesis=1, dtime=10)"])
+
+server = subprocess.Popen(["simms", "--serve", "simms.sock", "--batch-workers", "1"])
+while not os.path.exists("simms.sock") and server.poll() is None:
+    time.sleep(0.2)
+subprocess.check_call(["simms", "--server", "simms.sock", "-T", "kat-7", "-st", "1", "-dt", "10", "-be", "native"])
+shutdown = "from simms import serve; list(serve.request('simms.sock', {'shutdown': 1}))"
+subprocess.check_call([sys.executable, "-c", shutdown])
+server.wait()
+
+with open("batch.json", "w") as stdw:
+    stdw.write('{"base": {"tel": "kat-7", "synthesis": 1, "msname": "batch_{dtime}s.MS"}, "grid": {"dtime": [10, 20]}}')
+subprocess.check_call(["simms", "--batch", "batch.json", "--batch-workers", "2"])
+
+# a job that kills its worker fails on its own, the jobs queued with it are done
+with open("crashing.py", "w") as stdw:
+    stdw.write(
+        "import os\nfrom simms import batch\n\n\ndef run_job(index, job, logdir=None):\n"
+        "    if job.pop('crash', False):\n        os._exit(1)\n    return batch.run_job(index, job, logdir)\n"
+    )
+crashing = """
+import crashing
+from simms import batch
+
+batch.run_job = crashing.run_job
+jobs = [dict(tel='kat-7', synthesis=0.1, dtime=60, backend='native', msname='crash_%d.MS' % i) for i in range(4)]
+jobs[1]['crash'] = True
+status = [result['status'] for result in batch.run(jobs, nworkers=2)]
+assert status == ['done', 'failed', 'done', 'done'], status
+"""
+subprocess.check_call([sys.executable, "-c", crashing])
+
+
+def ms_rows(msname, columns):
+    """columns of an MS, in time and baseline order"""
+    from casatools import table
+
+    tb = table()
+    tb.open(msname)
+    rows = {name: tb.getcol(name) for name in ["TIME", "ANTENNA1", "ANTENNA2"] + columns}
+    tb.close()
+    order = np.lexsort((rows["ANTENNA2"], rows["ANTENNA1"], rows["TIME"]))
+    return {name: values[..., order] for name, values in rows.items()}
+
+
+# The native UVW are those of the CASA simulator, within UVW_TOLERANCE of the baseline length. The CASA
+# simulator starts TAI-UTC (37 s) after the reference time, so the native observation starts 37 s later to match it.
+UVW_TOLERANCE = 5e-5
+observe = ["simms", "-T", "meerkat", "-st", "1", "-dt", "900", "-el", "0", "--no-cache", "-val", "off"]
+subprocess.check_call(observe + ["-date", "UTC,2024/06/01/20:00:00", "-n", "uvw_casa.MS"])
+subprocess.check_call(observe + ["-date", "UTC,2024/06/01/20:00:37", "-n", "uvw_native.MS", "-be", "native"])
+casa, native = ms_rows("uvw_casa.MS", ["UVW"]), ms_rows("uvw_native.MS", ["UVW"])
+assert np.array_equal(casa["TIME"], native["TIME"]) and np.array_equal(casa["ANTENNA2"], native["ANTENNA2"])
+length = np.maximum(np.linalg.norm(casa["UVW"], axis=0), 1.0)
+error = np.abs(native["UVW"] - casa["UVW"]).max(axis=0) / length
+assert error.max() < UVW_TOLERANCE, "native UVW differ from CASA by %.2g of the baseline length" % error.max()
+
+# and so are those of simms.uvw, for all baselines at the times (hour angles) of the CASA simulator
+from casatools import table
+from simms import uvw
+
+tb = table()
+tb.open("uvw_casa.MS/ANTENNA")
+xyz = tb.getcol("POSITION").T
+tb.close()
+tb.open("uvw_casa.MS/FIELD")
+ra, dec = tb.getcol("PHASE_DIR")[:, 0, 0]
+tb.close()
+times = np.unique(casa["TIME"])
+computed = uvw.compute(xyz, ra, dec, times).reshape(-1, 3).T
+error = np.abs(computed - casa["UVW"]).max(axis=0) / length
+assert error.max() < UVW_TOLERANCE, "uvw.compute differs from CASA by %.2g of the baseline length" % error.max()
+
+# an MS of the CASA simulator is appended to, with the scans numbered after its own
+subprocess.check_call(observe + ["-date", "UTC,2024/06/02/20:00:00", "-n", "uvw_casa.MS", "-be", "native", "--append"])
+appended = ms_rows("uvw_casa.MS", ["SCAN_NUMBER"])
+later = appended["TIME"] > casa["TIME"].max()
+assert len(appended["TIME"]) == 2 * len(casa["TIME"]) and set(appended["SCAN_NUMBER"][later]) == {2}
+
+# simms.coords converts positions as casatools does, to COORDS_TOLERANCE (m)
+from casatools import measures
+from simms import coords, layouts
+from simms.core import get_telescope
+
+COORDS_TOLERANCE = 1e-3
+me = measures()
+xyz = layouts.parse_ascii(get_telescope("meerkat")[1])[0]
+llh = []
+for x, y, z in xyz:
+    pos = me.measure(me.position("itrf", "%.6fm" % x, "%.6fm" % y, "%.6fm" % z), "wgs84")
+    llh.append([np.rad2deg(pos["m0"]["value"]), np.rad2deg(pos["m1"]["value"]), pos["m2"]["value"]])
+expected = [
+    me.addxvalue(me.measure(me.position("wgs84", "%.12fdeg" % lon, "%.12fdeg" % lat, "%.6fm" % h), "itrf"))["value"]
+    for lon, lat, h in llh
+]
+assert np.allclose(coords.wgs84_to_itrf(llh), expected, rtol=0, atol=COORDS_TOLERANCE)
+# ENU offsets from the observatory, as the CASA simulator's "local" coordinates
+ref = me.measure(me.observatory("MeerKAT"), "itrf")
+lon, lat, rad = [ref[m]["value"] for m in ("m0", "m1", "m2")]
+ref_xyz = me.addxvalue(ref)["value"]
+enu = xyz - ref_xyz
+east = np.array([-np.sin(lon), np.cos(lon), 0])
+north = np.array([-np.cos(lon) * np.sin(lat), -np.sin(lon) * np.sin(lat), np.cos(lat)])
+up = np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+expected = ref_xyz + enu[:, :1] * east + enu[:, 1:2] * north + enu[:, 2:] * up
+assert np.allclose(coords.enu_to_itrf(enu, ref_xyz), expected, rtol=0, atol=COORDS_TOLERANCE)
+
+# without --date, a sharded observation starts at the same time (today's transit) as one made in one go
+observe = ["simms", "-T", "kat-7", "-st", "1", "-dt", "10", "-be", "native", "--no-cache", "-val", "off"]
+subprocess.check_call(observe + ["-n", "single.MS"])
+subprocess.check_call(observe + ["-n", "sharded.MS", "--shards", "3"])
+single, sharded = ms_rows("single.MS", ["UVW"]), ms_rows("sharded.MS", ["UVW"])
+assert np.allclose(single["TIME"], sharded["TIME"], rtol=0, atol=1e-3)
+assert np.allclose(single["UVW"], sharded["UVW"], rtol=0, atol=1e-3)
+
+# baselines left out on purpose (-maxbl, -bls) are not missing in a full validation
+from simms import validation
+
+assert not validation.check("maxbl.MS", "full")["missing_baselines"]
 
 print("Done! All is good")